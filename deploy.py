@@ -4,8 +4,14 @@ from pathlib import Path
 import os
 import click
 import subprocess
+import time
+from functools import partial
 
-from tools.ftp import _ftps_connect, _upload
+from fab_deploy.progress import ClickProgressBar, add_consumer
+from tools.buildcache import CACHE_FILE, BuildCache
+from tools.dag import CACHED, DONE, FAILED, RUNNING, SKIPPED, Stage, run_stages
+from tools.deb import COMPRESSIONS, GZIP, build_deb, control_file
+from tools.ftp import Artifact, _ftps_connect, publish
 
 CLICK_INFO_COLOR = "bright_yellow"
 CLICK_OK_COLOR = "green"
@@ -19,19 +25,18 @@ from fab_deploy import __version__
 
 app_folder = Path("/app/fab-dep/")
 dist_folder = app_folder / "dist"
-package_folder = Path("/app/fab/usr/")
-bin_folder = package_folder / "bin"
+# Pyinstaller's work folder. Kept between builds, so it only redoes what changed.
+build_folder = app_folder / "build"
 debian_file = Path("/app/fab.deb")
 
-package_config_folder = Path("/app/fab/DEBIAN")
+# A frozen fab which is larger or starts slower does not get packaged.
+MAX_BUNDLE_SIZE = 45  # MB
+MAX_STARTUP = 0.5  # seconds, fab --help with a warm cache
 
 
-def make_control_file():
-    """Make a control file which allows for deb file installers."""
-
-    _LOGGER = logging.getLogger(__name__)
-
-    dct = {
+def control_fields():
+    """The control fields of the debian package."""
+    return {
         "Package": "fab",
         "Version": __version__,
         "Section": "custom",
@@ -42,12 +47,6 @@ def make_control_file():
         "Description": "fabrication update tool",
     }
 
-    contents = "\n".join("{}: {}".format(key, value) for key, value in dct.items())
-
-    with open(package_config_folder.joinpath("control"), "w") as fl:
-        fl.write(contents)
-        fl.write("\n")
-
 
 def _run(*args, cwd=app_folder, capture_output=True, desc=None):
     if desc:
@@ -55,52 +54,172 @@ def _run(*args, cwd=app_folder, capture_output=True, desc=None):
     else:
         message = str(args)
 
-    click.secho(message, nl=False, fg=CLICK_INFO_COLOR)
+    # Stages run concurrently. A line per command keeps the output readable.
+    _LOGGER.info(message)
 
     process = subprocess.run(
         args, cwd=cwd, capture_output=capture_output, encoding="utf8"
     )
     if not process.returncode == 0:
         print(process)
+        # A failed stage must not be recorded as built.
+        raise click.ClickException("{} failed.".format(" ".join(args)))
 
-    click.secho("..done", fg=CLICK_INFO_COLOR)
     return process.stdout
 
 
-def _deploy_linux():
-    shutil.rmtree(bin_folder, ignore_errors=True)
-    shutil.rmtree(package_config_folder, ignore_errors=True)
-    shutil.rmtree(dist_folder, ignore_errors=True)
-
-    dist_folder.mkdir(exist_ok=True, parents=True)
-    package_config_folder.mkdir(exist_ok=True, parents=True)
-
-    _run("git", "pull")
-
-    content = _run("pipenv", "lock", "-r")
-    with open(app_folder / "reqs.txt", "w") as fl:
-        fl.write(content)
-
-    content = _run("pipenv", "lock", "-r", "-d")
-    with open(app_folder / "reqs-dev.txt", "w") as fl:
+def _export_requirements(target, *args):
+    content = _run("pipenv", "lock", "-r", *args)
+    with open(app_folder / target, "w") as fl:
         fl.write(content)
 
-    _run("python3.7", "-m", "pip", "install", "-r", "reqs.txt")
 
-    _run("python3.7", "-m", "pip", "install", "-r", "reqs-dev.txt")
+def _build_binary():
+    _run(
+        "pyinstaller",
+        "--noconfirm",
+        "--workpath",
+        str(build_folder),
+        "--distpath",
+        str(dist_folder),
+        "fab.spec",
+    )
 
-    _run("pyinstaller", "fab.spec")
 
-    make_control_file()
+def _build_package(compression):
+    build_deb(
+        dist_folder / "fab",
+        debian_file,
+        control_fields(),
+        install_folder="usr/bin",
+        compression=compression,
+    )
 
-    shutil.copytree(app_folder.joinpath("dist", "fab"), bin_folder)
 
-    _run("dpkg-deb", "--build", "fab", cwd=Path("/app/"))
+def _sources():
+    return [
+        app_folder / "fab.py",
+        app_folder / "fab.spec",
+        app_folder / "fab_deploy",
+    ]
+
+
+def linux_stages(compression=GZIP):
+    """The stages of a linux build.
+
+    Inputs are read when a stage starts, so after the pull changed them.
+    """
+    # pipenv lock -r locks again when the Pipfile changed.
+    pipfiles = [app_folder / "Pipfile", app_folder / "Pipfile.lock"]
+    return [
+        Stage("pull", partial(_run, "git", "pull")),
+        Stage(
+            "requirements",
+            partial(_export_requirements, "reqs.txt"),
+            requires=["pull"],
+            inputs=lambda: pipfiles,
+            outputs=[app_folder / "reqs.txt"],
+        ),
+        Stage(
+            "requirements-dev",
+            partial(_export_requirements, "reqs-dev.txt", "-d"),
+            requires=["pull"],
+            inputs=lambda: pipfiles,
+            outputs=[app_folder / "reqs-dev.txt"],
+        ),
+        # Both installs write to the same site-packages, so they run in turn.
+        Stage(
+            "install",
+            partial(_run, "python3.7", "-m", "pip", "install", "-r", "reqs.txt"),
+            requires=["requirements"],
+            inputs=lambda: [app_folder / "reqs.txt"],
+        ),
+        Stage(
+            "install-dev",
+            partial(_run, "python3.7", "-m", "pip", "install", "-r", "reqs-dev.txt"),
+            requires=["install", "requirements-dev"],
+            inputs=lambda: [app_folder / "reqs-dev.txt"],
+        ),
+        Stage(
+            "binary",
+            _build_binary,
+            requires=["install-dev"],
+            inputs=_sources,
+            outputs=[dist_folder / "fab"],
+        ),
+        Stage(
+            "startup",
+            partial(
+                _run,
+                "python3.7",
+                "-m",
+                "tools.bench",
+                "frozen",
+                str(dist_folder / "fab"),
+                "--max-size",
+                str(MAX_BUNDLE_SIZE),
+                "--max-startup",
+                str(MAX_STARTUP),
+            ),
+            requires=["binary"],
+            inputs=lambda: [str(MAX_BUNDLE_SIZE), str(MAX_STARTUP)],
+        ),
+        Stage(
+            "package",
+            partial(_build_package, compression),
+            requires=["binary", "startup"],
+            inputs=lambda: [control_file(control_fields()), compression],
+            outputs=[debian_file],
+        ),
+    ]
+
+
+_STATUS_COLORS = {
+    RUNNING: CLICK_INFO_COLOR,
+    DONE: CLICK_OK_COLOR,
+    CACHED: CLICK_OK_COLOR,
+    FAILED: CLICK_ERROR_COLOR,
+    SKIPPED: CLICK_ERROR_COLOR,
+}
+
+
+def _show_status(name, status):
+    click.secho("{:<18}{}".format(name, status), fg=_STATUS_COLORS.get(status))
+
+
+def _deploy_linux(clean=False, workers=4, compression=GZIP):
+    cache = BuildCache(app_folder / CACHE_FILE)
+    if clean:
+        cache.forget()
+        shutil.rmtree(build_folder, ignore_errors=True)
+        shutil.rmtree(dist_folder, ignore_errors=True)
+
+    start = time.perf_counter()
+    try:
+        run_stages(
+            linux_stages(compression),
+            cache,
+            workers=workers,
+            status=_show_status,
+            root=app_folder,
+        )
+    finally:
+        click.secho(cache.report(time.perf_counter() - start), fg=CLICK_OK_COLOR)
 
 
 @click.command()
-def deploy_linux():
-    _deploy_linux()
+@click.option(
+    "--clean", is_flag=True, help="Ignore the build cache and rebuild everything."
+)
+@click.option("--workers", default=4, help="Number of stages to run at once.")
+@click.option(
+    "--compression",
+    type=click.Choice(COMPRESSIONS),
+    default=GZIP,
+    help="Compression of the package. gzip uses all cores.",
+)
+def deploy_linux(clean, workers, compression):
+    _deploy_linux(clean, workers, compression)
 
 
 @click.command()
@@ -109,18 +228,15 @@ def deploy_linux():
 def publish_linux(user, passw):
 
     assert debian_file.exists()
-    click.secho("Connecting...", fg=CLICK_INFO_COLOR, nl=False)
-    connection = _ftps_connect("motorisation.hde.nl", user, passw)
-    click.secho("done", fg=CLICK_INFO_COLOR)
-
-    _upload(
-        debian_file, "/motorisation.hde.nl/bin/fabricator/ubuntu18_04/", connection
+    publish(
+        [Artifact(debian_file, "/motorisation.hde.nl/bin/fabricator/ubuntu18_04/")],
+        partial(_ftps_connect, "motorisation.hde.nl", user, passw),
     )
 
 
 @click.group()
 def cli():
-    pass
+    add_consumer(ClickProgressBar())
 
 
 cli.add_command(deploy_linux)
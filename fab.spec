@@ -1,6 +1,9 @@
 # -*- mode: python ; coding: utf-8 -*-
 from sys import platform
 
+# Debug symbols are most of the size of the shared libraries. Windows has no strip.
+strip = platform == "linux"
+
 if platform == "linux":
     pass
 else:
@@ -15,6 +18,44 @@ from PyInstaller.building.api import COLLECT
 
 block_cipher = None
 
+# Modules pyinstaller finds but fab never imports at run time. Leaving them out
+# keeps the bundle small and their runtime hooks out of the start-up. Check a
+# change with `python -m tools.bench frozen` and the warn file in build/fab.
+excludes = [
+    # Development tools which are installed next to fab while building.
+    "_pytest",
+    "pytest",
+    "responses",
+    "pyftpdlib",
+    "PyInstaller",
+    "setuptools",
+    "pkg_resources",
+    "distutils",
+    "lib2to3",
+    # pyOpenSSL. requests falls back to the ssl module without it.
+    "OpenSSL",
+    # Standard library which no code path of fab uses.
+    "tkinter",
+    "_tkinter",
+    "unittest",
+    "doctest",
+    "pydoc",
+    "pdb",
+    "sqlite3",
+    "xml",
+    "xmlrpc",
+    "pyexpat",
+    "asyncio",
+    "multiprocessing",
+    "curses",
+    "readline",
+    "webbrowser",
+    "pickle",
+    "_pickle",
+    "tracemalloc",
+    "ftplib",
+]
+
 
 a = Analysis(
     ["fab.py"],
@@ -24,10 +65,13 @@ a = Analysis(
     hiddenimports=[],
     hookspath=[],
     runtime_hooks=[],
-    excludes=[],
+    excludes=excludes,
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
+    # Pure modules stay in the archive and are only loaded when imported. fab
+    # imports requests, cryptography and psutil inside the commands needing them
+    # (guarded by tests/test_startup.py), so --help never loads them.
     noarchive=False,
 )
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
@@ -39,7 +83,7 @@ exe = EXE(
     name="fab",
     debug=False,
     bootloader_ignore_signals=False,
-    strip=False,
+    strip=strip,
     upx=True,
     console=True,
 )
@@ -48,7 +92,7 @@ coll = COLLECT(
     a.binaries,
     a.zipfiles,
     a.datas,
-    strip=False,
+    strip=strip,
     upx=True,
     upx_exclude=[],
     name="fab",
@@ -0,0 +1,107 @@
+"""Prepare updates in the background while the fabricator is running.
+
+A new release is downloaded, decrypted, extracted and verified into a staging
+folder next to the installation folder. Next to it, so both are on the same
+file system and the final switch, once the fabricator is closed, is two
+renames. The version file is written into the staged tree last, which marks
+it complete. The installation it replaces is kept to roll back to. A release
+rolled back from is not staged again, until another release is published.
+"""
+
+import logging
+import random
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from fab_deploy.previous import retire, rolled_back_from
+from fab_deploy.release import Release, installed_version
+from fab_deploy.trash import move_to_trash, purge_in_background
+
+_LOGGER = logging.getLogger(__name__)
+
+STAGING_MARKER = ".staging"
+
+# Seconds between two checks for a new release.
+DEFAULT_INTERVAL = 15 * 60
+# Fraction the interval is randomized by, so a fleet does not poll at once.
+DEFAULT_JITTER = 0.2
+# Seconds between two checks whether the fabricator was closed.
+SWAP_CHECK_INTERVAL = 5.0
+
+
+def staging_folder(installation_folder: Path) -> Path:
+    return installation_folder.with_name(f"{installation_folder.name}{STAGING_MARKER}")
+
+
+def jittered(
+    interval: float,
+    jitter: float = DEFAULT_JITTER,
+    rand: Callable[[], float] = random.random,
+) -> float:
+    """Return the interval, randomized by up to jitter times the interval."""
+    return interval * (1 + jitter * (2 * rand() - 1))
+
+
+def release_of(folder: Path) -> Optional[str]:
+    """Return the release installed or staged in a folder."""
+    version = installed_version(folder)
+    if version is None:
+        return None
+    return version.get("latest")
+
+
+def _describes(version: Optional[Dict[str, Any]], release: Release) -> bool:
+    """Whether a version file is of a release."""
+    if version is None or version.get("latest") != release.latest:
+        return False
+    # A release published again under the same name has another digest.
+    sha256 = version.get("sha256")
+    if sha256 is None or release.sha256 is None:
+        return True
+    return sha256.lower() == release.sha256.lower()
+
+
+def _holds(folder: Path, release: Release) -> bool:
+    """Whether a folder holds a release."""
+    return _describes(installed_version(folder), release)
+
+
+def needs_update(release: Release, installation_folder: Path) -> bool:
+    return not _holds(installation_folder, release)
+
+
+def is_staged(release: Release, installation_folder: Path) -> bool:
+    return _holds(staging_folder(installation_folder), release)
+
+
+def is_rolled_back(release: Release, installation_folder: Path) -> bool:
+    """Whether the installation was rolled back from this release."""
+    return _describes(rolled_back_from(installation_folder), release)
+
+
+def discard_staged(installation_folder: Path):
+    """Remove a staged tree which is no longer needed."""
+    staging = staging_folder(installation_folder)
+    if move_to_trash(staging) is not None:
+        purge_in_background(staging)
+
+
+def swap_in(installation_folder: Path) -> Optional[Path]:
+    """Replace the installation by the staged tree.
+
+    :return: The previous installation, if there was one.
+    :raises FileNotFoundError: When nothing is staged.
+    :raises PermissionError: When a file of the installation is in use.
+    """
+    staging = staging_folder(installation_folder)
+    if not staging.exists():
+        raise FileNotFoundError(f"Nothing staged for {installation_folder}")
+    previous = retire(installation_folder)
+    try:
+        staging.rename(installation_folder)
+    except OSError:
+        if previous is not None:
+            previous.rename(installation_folder)
+        raise
+    purge_in_background(installation_folder)
+    return previous
@@ -0,0 +1,683 @@
+"""Install operations for programs.
+
+The functions here do what the fab commands do, but never print, prompt,
+sleep or exit: they return a result and raise a FatalEchoException subclass
+when they fail. Progress is published to the registered consumers and to the
+on_progress callback of a call, phases are reported to its on_phase callback.
+The fab commands are a thin layer over these functions.
+
+A Session holds the settings, a requests session and the version files
+downloaded before. A long running program keeps one per installation folder
+and thread, so connections are reused and a version file which did not change
+is not downloaded again::
+
+    with Session() as session:
+        if check(session).update_available:
+            result = download(session, on_progress=print)
+"""
+
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import urljoin
+
+from fab_deploy.agent import (
+    discard_staged,
+    is_rolled_back,
+    is_staged,
+    needs_update,
+    release_of,
+    staging_folder,
+    swap_in,
+)
+from fab_deploy.const import (
+    KEY_PLATFORM,
+    _FileSettings,
+    _Settings,
+    get_file_settings,
+    load_settings,
+)
+from fab_deploy.crypto import decryptFile
+from fab_deploy.diskspace import DiskUsage, check_free_space, install_stages
+from fab_deploy.download import download_fabfile, download_version_file
+from fab_deploy.exceptions import (
+    CleanError,
+    ConfigError,
+    DecryptError,
+    ExtractError,
+    FabricatorRunningError,
+    FatalEchoException,
+    RollbackError,
+    VerifyError,
+)
+from fab_deploy.extract import ExtractResult, extract_archive
+from fab_deploy.locking import installation_lock, lock_installation
+from fab_deploy.manifest import Manifest, read_manifest
+from fab_deploy.previous import (
+    clear_rolled_back,
+    mark_rolled_back,
+    retire,
+    roll_back,
+)
+from fab_deploy.process import executable_name, find_running
+from fab_deploy.progress import Consumer, progress
+from fab_deploy.release import (
+    Release,
+    check_supported,
+    installed_version,
+    read_release,
+    save_installed_version,
+)
+from fab_deploy.timing import add_bytes, span
+from fab_deploy.trash import move_to_trash, purge_in_background
+from fab_deploy.verify import VerifyResult, verify_tree
+from fab_deploy.workspace import Workspace
+
+_LOGGER = logging.getLogger(__name__)
+
+STARTED = "started"
+DONE = "done"
+
+# Called with a phase, like "download" or "extract", and STARTED or DONE.
+PhaseCallback = Callable[[str, str], None]
+
+
+class Session:
+    """Settings and connections shared by the calls of a program.
+
+    :param settings: Defaults to the settings saved by fab.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[_Settings] = None,
+        file_settings: Optional[_FileSettings] = None,
+    ):
+        self.file_settings = file_settings or get_file_settings()
+        self.settings = settings or load_settings(self.file_settings.config_file)
+        # Version files by url, with their ETag.
+        self.version_files: Dict[str, Tuple[str, bytes]] = {}
+        self._http = None
+
+    @property
+    def http(self):
+        """A requests session, created when first used."""
+        if self._http is None:
+            # requests takes a large part of the start-up time.
+            import requests
+
+            self._http = requests.Session()
+        return self._http
+
+    def workspace(self) -> Workspace:
+        """A working folder of its own for one call."""
+        return Workspace(self.file_settings.temp_installation_folder)
+
+    def close(self):
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+@dataclass
+class CheckResult:
+    release: Release
+    installed: Optional[str]
+    staged: Optional[str]
+    update_available: bool
+    # The release is the one rolled back from, which is not staged again.
+    rolled_back: bool = False
+
+    @property
+    def latest(self) -> str:
+        return self.release.latest
+
+
+@dataclass
+class InstallResult:
+    installation_folder: Path
+    # None for an install from a file, which has no version file.
+    release: Optional[Release] = None
+    url: Optional[str] = None
+    extracted_bytes: int = 0
+    peak_disk_usage: int = 0
+    # The installation which was replaced, kept to roll back to.
+    previous: Optional[Path] = None
+    verified: Optional[VerifyResult] = None
+
+
+@dataclass
+class RollbackResult:
+    installation_folder: Path
+    # The releases rolled back to and from, when they are known.
+    release: Optional[str]
+    replaced: Optional[str]
+
+
+@contextmanager
+def _session(session: Optional[Session]) -> Iterator[Session]:
+    if session is not None:
+        yield session
+        return
+    with Session() as session:
+        yield session
+
+
+@contextmanager
+def _phase(name: str, on_phase: Optional[PhaseCallback]) -> Iterator[None]:
+    if on_phase is not None:
+        on_phase(name, STARTED)
+    with span(name):
+        yield
+    if on_phase is not None:
+        on_phase(name, DONE)
+
+
+def _require_key(settings: _Settings):
+    if settings.key is None:
+        raise ConfigError("Encryption key not provided")
+
+
+def _require_url(settings: _Settings):
+    if settings.download_url is None:
+        raise ConfigError("No URL provided. Use <fab set-url>.")
+
+
+def _channel_url(settings: _Settings, channel: Optional[str]) -> str:
+    if channel:
+        return f"{settings.download_url}/{channel}/"
+    return settings.download_url
+
+
+def check_running(installation_folder: Path):
+    """check whether the FABtool is running."""
+    name = executable_name()
+    if name is None:
+        raise FatalEchoException("Tool should be running on either windows or linux")
+
+    if find_running(installation_folder, name) is not None:
+        raise FabricatorRunningError(
+            "FABtool is running. Please close it first before updating"
+        )
+
+
+def _extracted_size(archive: Path, components=None) -> Optional[int]:
+    """Return the size of the tree an archive extracts to, if it is known."""
+    try:
+        manifest = read_manifest(archive)
+    except Exception as err:
+        _LOGGER.exception(err)
+        return None
+    return _installed_size(manifest, components)
+
+
+def _installed_size(manifest: Optional[Manifest], components=None) -> Optional[int]:
+    if manifest is None or not manifest.files:
+        return None
+    files = manifest.installed_files(KEY_PLATFORM, components)
+    return sum(entry.size for entry in files.values())
+
+
+def _decrypt(
+    in_file: Path, out_file: Path, key, on_progress: Optional[Consumer] = None
+) -> Path:
+    buffer_size = 64 * 1024
+
+    if not in_file.exists():
+        raise DecryptError("Encrypted file not found")
+
+    size = in_file.stat().st_size
+    add_bytes(size)
+    try:
+        with progress("decrypt", size, on_progress) as bar:
+            decryptFile(str(in_file), str(out_file), key, buffer_size, bar.update)
+    except PermissionError:
+        raise DecryptError("permission error")
+    except ValueError as err:
+        raise DecryptError(err)
+
+    return out_file
+
+
+def _clean(output_folder: Path, keep_previous=True) -> Optional[Path]:
+    """Move the installation out of the way.
+
+    :param keep_previous: Keep it to roll back to, instead of deleting it.
+    :return: The kept installation, if there was one.
+    """
+    try:
+        if keep_previous:
+            previous = retire(output_folder)
+        else:
+            previous = None
+            move_to_trash(output_folder)
+    except PermissionError:
+        raise CleanError(
+            "Unable to clear installation folder. Did you close the fabricator ?"
+        )
+    except OSError as err:
+        raise CleanError(f"Unable to clear installation folder: {err}")
+
+    # Also picks up trash which previous runs were unable to delete.
+    purge_in_background(output_folder)
+    return previous
+
+
+def _extract(
+    archive, output_folder, components=None, on_progress: Optional[Consumer] = None
+) -> ExtractResult:
+    """Extract an archive.
+
+    Archives with a manifest are extracted selectively: only the components for
+    this platform and, when provided, the selected components.
+    """
+    try:
+        manifest = read_manifest(archive)
+        member_filter = None
+        if manifest is not None:
+            member_filter = manifest.member_filter(KEY_PLATFORM, components)
+        with progress(
+            "extract", _installed_size(manifest, components), on_progress
+        ) as bar:
+            result = extract_archive(
+                archive, output_folder, member_filter, callback=bar.update
+            )
+        add_bytes(result.bytes)
+        return result
+
+    except Exception as err:
+        _LOGGER.exception(err)
+        raise ExtractError(err)
+
+
+def _install(
+    fabfile: Path,
+    installation_folder: Path,
+    settings: _Settings,
+    temp_folder: Path,
+    disk_usage: Optional[DiskUsage] = None,
+    keep_previous=True,
+    on_progress: Optional[Consumer] = None,
+    on_phase: Optional[PhaseCallback] = None,
+) -> InstallResult:
+    """Decrypt and extract a fabricator file.
+
+    :param disk_usage: Tracks the downloaded file, when downloaded. Files tracked
+        by it are deleted as soon as they are no longer needed.
+    """
+    if disk_usage is None:
+        disk_usage = DiskUsage()
+
+    # Check before cleaning, so a full disk does not leave the machine without
+    # a fabricator installation.
+    if fabfile.exists():
+        check_free_space(
+            install_stages(
+                0,
+                temp_folder,
+                installation_folder,
+                archive_size=fabfile.stat().st_size,
+            )
+        )
+    with _phase("clean", on_phase):
+        previous = _clean(installation_folder, keep_previous)
+
+    archive_file = temp_folder.joinpath("fabricator.archive")
+    with _phase("decrypt", on_phase):
+        _decrypt(fabfile, archive_file, settings.key, on_progress)
+    disk_usage.add(archive_file)
+    disk_usage.remove(fabfile)
+
+    extracted_size = _extracted_size(archive_file, settings.components)
+    if extracted_size is not None:
+        check_free_space([{installation_folder: extracted_size}])
+
+    with _phase("extract", on_phase):
+        result = _extract(
+            archive_file, installation_folder, settings.components, on_progress
+        )
+    disk_usage.add(installation_folder, result.bytes, owned=False)
+    disk_usage.remove(archive_file)
+
+    return InstallResult(
+        installation_folder=installation_folder,
+        extracted_bytes=result.bytes,
+        peak_disk_usage=disk_usage.peak,
+        previous=previous,
+    )
+
+
+def _fetch_release(
+    session: Session,
+    download_url: str,
+    workspace: Path,
+    on_phase: Optional[PhaseCallback] = None,
+) -> Tuple[Release, Path]:
+    with _phase("version", on_phase):
+        version_file = download_version_file(
+            download_url,
+            workspace.joinpath("version.json"),
+            http=session.http,
+            cache=session.version_files,
+        )
+    return read_release(version_file), version_file
+
+
+def _install_release(
+    session: Session,
+    release: Release,
+    version_file: Path,
+    download_url: str,
+    installation_folder: Path,
+    workspace: Path,
+    verify=False,
+    keep_previous=True,
+    on_progress: Optional[Consumer] = None,
+    on_phase: Optional[PhaseCallback] = None,
+) -> InstallResult:
+    """Download a release after checking it fits on disk, and install it."""
+    check_supported(release)
+    url = urljoin(download_url, release.latest)
+    fabfile = workspace.joinpath("fabricator.encrypt")
+    disk_usage = DiskUsage()
+
+    def _preflight(size):
+        check_free_space(install_stages(size, workspace, installation_folder))
+        disk_usage.add(fabfile, size)
+
+    with _phase("download", on_phase):
+        download_fabfile(
+            url,
+            fabfile,
+            force_download=True,
+            preflight=_preflight,
+            release=release,
+            http=session.http,
+            on_progress=on_progress,
+        )
+
+    result = _install(
+        fabfile,
+        installation_folder,
+        session.settings,
+        workspace,
+        disk_usage=disk_usage,
+        keep_previous=keep_previous,
+        on_progress=on_progress,
+        on_phase=on_phase,
+    )
+    result.release = release
+    result.url = url
+    if verify:
+        result.verified = _verify_intact(
+            installation_folder, session.settings.components, on_phase
+        )
+    # Written last. It marks the tree complete.
+    save_installed_version(version_file, installation_folder)
+    return result
+
+
+def damage_report(result: VerifyResult) -> str:
+    if not result.damaged:
+        return (
+            f"Unable to read {len(result.unreadable)} installed files. "
+            "Please check their permissions."
+        )
+    report = (
+        f"Installation is damaged: {len(result.missing)} missing and "
+        f"{len(result.changed)} changed files. Please reinstall."
+    )
+    if result.unreadable:
+        report += f" {len(result.unreadable)} files could not be read."
+    return report
+
+
+def _verify_intact(
+    installation_folder: Path,
+    components=None,
+    on_phase: Optional[PhaseCallback] = None,
+) -> Optional[VerifyResult]:
+    """Verify a tree just installed. One without a manifest is not verified.
+
+    :raises VerifyError: When files are missing or changed.
+    """
+    with _phase("verify", on_phase):
+        result = verify_tree(installation_folder, KEY_PLATFORM, components)
+    if result is not None and not result.ok:
+        raise VerifyError(damage_report(result))
+    return result
+
+
+def check(
+    session: Optional[Session] = None, channel: Optional[str] = None
+) -> CheckResult:
+    """Check for a new release.
+
+    :param channel: Check a specific channel, a folder below the download url.
+    """
+    with _session(session) as session, session.workspace() as workspace:
+        settings = session.settings
+        _require_url(settings)
+        release, _ = _fetch_release(session, _channel_url(settings, channel), workspace)
+
+    folder = settings.installation_folder
+    return CheckResult(
+        release=release,
+        installed=release_of(folder),
+        staged=release_of(staging_folder(folder)),
+        update_available=needs_update(release, folder),
+        rolled_back=is_rolled_back(release, folder),
+    )
+
+
+def download(
+    session: Optional[Session] = None,
+    channel: Optional[str] = None,
+    verify=False,
+    on_progress: Optional[Consumer] = None,
+    on_phase: Optional[PhaseCallback] = None,
+) -> InstallResult:
+    """Download the latest release and install it.
+
+    The installation it replaces is kept to roll back to.
+
+    :param channel: Install from a specific channel, a folder below the download
+        url. If omitted the release channel is used.
+    :param verify: Verify the installed files against the manifest.
+    """
+    with _session(session) as session:
+        settings = session.settings
+        _require_key(settings)
+        _require_url(settings)
+        folder = settings.installation_folder
+        download_url = _channel_url(settings, channel)
+        with lock_installation(folder), session.workspace() as workspace:
+            check_running(folder)
+            release, version_file = _fetch_release(
+                session, download_url, workspace, on_phase
+            )
+            result = _install_release(
+                session,
+                release,
+                version_file,
+                download_url,
+                folder,
+                workspace,
+                verify=verify,
+                on_progress=on_progress,
+                on_phase=on_phase,
+            )
+            clear_rolled_back(folder)
+            return result
+
+
+def install(
+    fabfile: Path,
+    session: Optional[Session] = None,
+    verify=False,
+    on_progress: Optional[Consumer] = None,
+    on_phase: Optional[PhaseCallback] = None,
+) -> InstallResult:
+    """Install a fabricator file.
+
+    The installation it replaces is kept to roll back to.
+
+    :param verify: Verify the installed files against the manifest.
+    """
+    with _session(session) as session:
+        settings = session.settings
+        _require_key(settings)
+        folder = settings.installation_folder
+        with lock_installation(folder), session.workspace() as workspace:
+            check_running(folder)
+            result = _install(
+                Path(fabfile),
+                folder,
+                settings,
+                workspace,
+                on_progress=on_progress,
+                on_phase=on_phase,
+            )
+            if verify:
+                result.verified = _verify_intact(folder, settings.components, on_phase)
+            clear_rolled_back(folder)
+            return result
+
+
+def verify(session: Optional[Session] = None, quick=False) -> Optional[VerifyResult]:
+    """Check the installed files for missing or changed files.
+
+    :param quick: Only compare file sizes.
+    :return: The result or None when the installation has no manifest.
+    """
+    with _session(session) as session:
+        settings = session.settings
+        return verify_tree(
+            settings.installation_folder,
+            KEY_PLATFORM,
+            settings.components,
+            quick=quick,
+        )
+
+
+def rollback(session: Optional[Session] = None) -> RollbackResult:
+    """Swap the installation with the one it replaced.
+
+    Rolling back again returns to the installation rolled back from. The
+    release rolled back from is not staged again, until another release is
+    installed.
+    """
+    with _session(session) as session:
+        folder = session.settings.installation_folder
+        with lock_installation(folder):
+            check_running(folder)
+            version = installed_version(folder)
+            replaced = None if version is None else version.get("latest")
+            try:
+                with span("rollback"):
+                    roll_back(folder)
+            except FileNotFoundError:
+                raise RollbackError(f"No previous installation of {folder}.")
+            except PermissionError:
+                raise RollbackError(
+                    "Unable to replace the installation. Did you close the fabricator ?"
+                )
+            if version is not None:
+                mark_rolled_back(folder, version)
+            if replaced is not None and release_of(staging_folder(folder)) == replaced:
+                discard_staged(folder)
+        return RollbackResult(
+            installation_folder=folder,
+            release=release_of(folder),
+            replaced=replaced,
+        )
+
+
+def stage(
+    session: Optional[Session] = None,
+    on_progress: Optional[Consumer] = None,
+    on_phase: Optional[PhaseCallback] = None,
+) -> CheckResult:
+    """Prepare the latest release next to the installation, to swap in later.
+
+    Works while the fabricator is running. A staged release which is no longer
+    needed is discarded. The release rolled back from is not staged.
+
+    :return: The releases installed and staged afterwards.
+    """
+    with _session(session) as session:
+        settings = session.settings
+        _require_key(settings)
+        _require_url(settings)
+        folder = settings.installation_folder
+        with lock_installation(folder), session.workspace() as workspace:
+            release, version_file = _fetch_release(
+                session, settings.download_url, workspace, on_phase
+            )
+            if is_rolled_back(release, folder):
+                _LOGGER.info("Not staging %s, it was rolled back.", release.latest)
+                discard_staged(folder)
+            elif not needs_update(release, folder):
+                discard_staged(folder)
+            elif not is_staged(release, folder):
+                _install_release(
+                    session,
+                    release,
+                    version_file,
+                    settings.download_url,
+                    staging_folder(folder),
+                    workspace,
+                    verify=True,
+                    keep_previous=False,
+                    on_progress=on_progress,
+                    on_phase=on_phase,
+                )
+
+    return CheckResult(
+        release=release,
+        installed=release_of(folder),
+        staged=release_of(staging_folder(folder)),
+        update_available=needs_update(release, folder),
+        rolled_back=is_rolled_back(release, folder),
+    )
+
+
+def swap(session: Optional[Session] = None) -> Optional[str]:
+    """Install the staged release, unless the fabricator is running.
+
+    :return: The release installed or None when nothing was installed.
+    """
+    with _session(session) as session:
+        folder = session.settings.installation_folder
+        release = release_of(staging_folder(folder))
+        if release is None:
+            return None
+        lock = installation_lock(folder)
+        if not lock.acquire():
+            return None
+        try:
+            check_running(folder)
+            with span("swap"):
+                swap_in(folder)
+        except FabricatorRunningError:
+            return None
+        except OSError as err:
+            # Like a file which is in use. The next call tries again.
+            _LOGGER.warning("Unable to swap in %s: %s", release, err)
+            return None
+        else:
+            try:
+                clear_rolled_back(folder)
+            except OSError as err:
+                _LOGGER.warning("Unable to clear the rollback of %s: %s", folder, err)
+        finally:
+            lock.release()
+        return release
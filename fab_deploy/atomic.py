@@ -0,0 +1,31 @@
+"""Replace files atomically.
+
+A file is written next to its destination and renamed into place, so a reader
+never sees a partially written file.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+
+def write_atomic(path: Path, text: str):
+    """Replace the file at path with text.
+
+    The text is written to a temporary file in the same folder first, as
+    os.replace is only atomic within a file system.
+    """
+    fd, temp_name = tempfile.mkstemp(
+        dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as fl:
+            fl.write(text)
+            fl.flush()
+            os.fsync(fl.fileno())
+        # mkstemp creates the file readable by the owner only.
+        os.chmod(temp_name, 0o644)
+        os.replace(temp_name, str(path))
+    except BaseException:
+        os.unlink(temp_name)
+        raise
@@ -1,9 +1,20 @@
+import hashlib
+import json
 import logging
+import threading
+import time
+from collections import deque
 from pathlib import Path
 from sys import platform
 import subprocess
+from typing import Deque, Dict, Optional
 
-from fab_deploy.exceptions import FatalEchoException
+from fab_deploy.atomic import write_atomic
+from fab_deploy.const import BOOTSTRAP_TIMEOUT
+from fab_deploy.exceptions import BootstrapError
+from fab_deploy.manifest import MANIFEST_NAME
+from fab_deploy.output import secho
+from fab_deploy.release import INSTALLED_VERSION_FILE
 
 _LOGGER = logging.getLogger(__name__)
 #
@@ -25,15 +36,125 @@ _LOGGER = logging.getLogger(__name__)
 #     return process.stdout
 
 
-def execute_bootstrap(install_folder: Path):
+# Number of stderr lines kept for the error message.
+_ERROR_LINES = 50
+
+
+def _executable(install_folder: Path) -> Path:
     if platform == "linux":
-        executable = install_folder / "fabricator"
-    else:
-        executable = install_folder / "fabricator.exe"
+        return install_folder / "fabricator"
+    return install_folder / "fabricator.exe"
+
+
+def tree_fingerprint(install_folder: Path) -> str:
+    """Identify the installed tree by its release, manifest and executable."""
+    digest = hashlib.sha256()
+    for name in (INSTALLED_VERSION_FILE, MANIFEST_NAME):
+        digest.update(name.encode())
+        try:
+            digest.update(install_folder.joinpath(name).read_bytes())
+        except FileNotFoundError:
+            digest.update(b"missing")
+    try:
+        stat = _executable(install_folder).stat()
+        digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    except FileNotFoundError:
+        digest.update(b"missing")
+    return digest.hexdigest()
+
+
+def _pump(stream, lines: Deque[str]):
+    """Show the output of the bootstrap while it runs."""
+    for line in stream:
+        line = line.rstrip("\n")
+        lines.append(line)
+        secho(line)
+
+
+def run_bootstrap(executable: Path, timeout: Optional[float] = BOOTSTRAP_TIMEOUT):
+    """Run the bootstrap, showing its output live.
+
+    :return: The duration in seconds.
+    """
+    start = time.perf_counter()
+    try:
+        process = subprocess.Popen(
+            [str(executable), "--bootstrap"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf8",
+            errors="replace",
+        )
+    except OSError as err:
+        raise BootstrapError(f"Unable to start {executable}: {err}")
+
+    # Closes the pipes when done.
+    with process:
+        errors: Deque[str] = deque(maxlen=_ERROR_LINES)
+        pumps = [
+            threading.Thread(target=_pump, args=(process.stdout, deque(maxlen=1))),
+            threading.Thread(target=_pump, args=(process.stderr, errors)),
+        ]
+        for pump in pumps:
+            pump.daemon = True
+            pump.start()
+
+        try:
+            returncode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            raise BootstrapError(f"Bootstrap did not finish within {timeout} seconds")
+        finally:
+            # A child process of the fabricator may keep the pipes open.
+            for pump in pumps:
+                pump.join(timeout=5)
+
+    if returncode != 0:
+        raise BootstrapError(
+            "\n".join(errors) or f"Bootstrap failed with exit code {returncode}"
+        )
+    return time.perf_counter() - start
+
+
+def _read_cache(cache_file: Path) -> Dict[str, Dict]:
+    try:
+        with open(str(cache_file)) as fl:
+            return json.load(fl)
+    except (OSError, ValueError):
+        return {}
+
+
+def execute_bootstrap(
+    install_folder: Path,
+    timeout: Optional[float] = BOOTSTRAP_TIMEOUT,
+    cache_file: Optional[Path] = None,
+    force=False,
+) -> Optional[float]:
+    """Bootstrap an installation, unless this tree was bootstrapped before.
+
+    :param cache_file: Remembers the fingerprint of the bootstrapped trees.
+        Without it the bootstrap always runs.
+    :param force: Run even when the tree was bootstrapped before.
+    :return: The duration or None when skipped.
+    """
+    key = str(install_folder.resolve())
+    fingerprint = tree_fingerprint(install_folder)
+    if cache_file is not None and not force:
+        cached = _read_cache(cache_file).get(key, {})
+        if cached.get("fingerprint") == fingerprint:
+            _LOGGER.info("%s was bootstrapped before. Skipping", install_folder)
+            return None
 
-    process = subprocess.run(
-        [str(executable), "--bootstrap"], capture_output=True, encoding="utf8"
-    )
+    duration = run_bootstrap(_executable(install_folder), timeout)
 
-    if not process.returncode == 0:
-        raise FatalEchoException(process.stderr)
+    if cache_file is not None:
+        cache = _read_cache(cache_file)
+        cache[key] = {
+            "fingerprint": fingerprint,
+            "duration": duration,
+            "time": time.time(),
+        }
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(cache_file, json.dumps(cache, indent=2))
+    return duration
@@ -1,20 +1,28 @@
 # -*- coding: utf-8 -*-
 """Console script for fab-deploy."""
 import functools
-import json
-import shutil
 import sys
 import logging
 from pathlib import Path
 from sys import platform
-from time import sleep
-from urllib.parse import urljoin
+from time import monotonic, sleep
 import click
-import psutil
 from click import Abort
 
+from fab_deploy import api
+from fab_deploy.agent import (
+    DEFAULT_INTERVAL,
+    DEFAULT_JITTER,
+    SWAP_CHECK_INTERVAL,
+    jittered,
+)
 from fab_deploy.bootstrap import execute_bootstrap
-from fab_deploy.exceptions import EchoException, FatalEchoException
+from fab_deploy.exceptions import (
+    FatalEchoException,
+    ConfigError,
+    VerifyError,
+)
+from fab_deploy.output import echo, emit, is_batch, secho, set_batch, BATCH_ENV
 from . import __version__
 
 # from click import Abort
@@ -23,22 +31,28 @@ from . import __version__
 from fab_deploy.const import (
     INFO_COLOR,
     ERROR_COLOR,
+    _Settings,
     load_settings,
     get_file_settings,
     save_settings,
-    KEY_PLATFORM,
-    KEY_WINDOWS,
-    KEY_LINUX,
 )
 
-from fab_deploy.crypto import decryptFile
-from fab_deploy.download import download_fabfile, download_version_file
-
-from typing import TYPE_CHECKING
-
-if TYPE_CHECKING:
-    from fab_deploy.const import _Settings, _FileSettings
+from fab_deploy.metrics import (
+    RunResult,
+    get_run_result,
+    reset_run_result,
+    write_metrics,
+)
+from fab_deploy.pack import pack_tree
+from fab_deploy.progress import (
+    ClickProgressBar,
+    json_lines_consumer,
+    set_consumers,
+)
+from fab_deploy.timing import Timings, get_timings, reset_timings, span
+from fab_deploy.diskspace import format_size
 
+from typing import Optional
 
 LOGGER = logging.getLogger(__name__)
 
@@ -53,49 +67,29 @@ jumbo = r"""
 
 """
 
-click.echo(jumbo)
 
+# What the phases reported by the api are shown as.
+_PHASES = {
+    "version": "Downloading version file...",
+    "download": "Downloading release...",
+    "clean": "Cleaning output folder...",
+    "decrypt": "Decrypting...",
+    "extract": "Extracting archive...",
+    "verify": "Verifying installation...",
+}
 
-def working_done(message, done="done."):
-    def _echoer(func):
-        def _wrapper(*args, **kwargs):
 
-            click.secho(message, fg=INFO_COLOR, nl=False)
-            try:
-                result = func(*args, **kwargs)
-            except EchoException as err:
-                click.secho(str(err), bg=ERROR_COLOR)
-            # except FatalEchoException as err:
-            #     click.secho(str(err), bg=ERROR_COLOR)
-            #     raise
-            else:
-                click.secho(done, fg=INFO_COLOR)
-                return result
-
-        return _wrapper
-
-    return _echoer
-
-
-def check_running():
-    """check whether the FABtool is running."""
-    name = None
-    if KEY_PLATFORM == KEY_WINDOWS:
-        name = "fabricator.exe"
-    elif KEY_PLATFORM == KEY_LINUX:
-        name = "fabricator"
-    if name is None:
-        raise FatalEchoException("Tool should be running on either windows or linux")
-
-    for pid in psutil.pids():
-        p = psutil.Process(pid)
-        if p.name() == name:
-            raise FatalEchoException(
-                "FABtool is running. Please close it first before updating"
-            )
+def _show_phase(phase: str, status: str):
+    if status == api.STARTED:
+        secho(_PHASES.get(phase, phase), fg=INFO_COLOR, nl=False)
+    else:
+        secho("done.", fg=INFO_COLOR)
+    emit("phase", phase=phase, status=status)
 
 
 def closed_delay(delay=5):
+    if is_batch():
+        return
     for i in range(delay, 0, -1):
         print(f"closing in {i} seconds\r", end="", flush=True)
         sleep(1)
@@ -103,37 +97,30 @@ def closed_delay(delay=5):
 
 def _check_key(settings: "_Settings"):
     if settings.key is None:
-        click.secho("----------------------------------", bg=ERROR_COLOR)
-        click.secho("Error: Encryption key not provided", bg=ERROR_COLOR)
-        click.secho("----------------------------------", bg=ERROR_COLOR)
-        click.secho("Please provide an encryption key:", bg=ERROR_COLOR)
-        click.secho("enter <fab --help> to get assistance", bg=ERROR_COLOR)
-        raise FatalEchoException()
-
-
-def _install(fabfile: Path, clean, settings, temp_folder: Path):
-    if clean:
-        _clean(settings.installation_folder)
-
-    archive_file = temp_folder.joinpath("fabricator.archive")
-    _decrypt(fabfile, archive_file, settings.key)
-
-    _extract(archive_file, settings.installation_folder)
-
-    click.secho("Finished successfully.", fg="green")
-    click.secho(
-        "Fabricator tool can be found at: {}".format(settings.installation_folder),
+        secho("----------------------------------", bg=ERROR_COLOR)
+        secho("Error: Encryption key not provided", bg=ERROR_COLOR)
+        secho("----------------------------------", bg=ERROR_COLOR)
+        secho("Please provide an encryption key:", bg=ERROR_COLOR)
+        secho("enter <fab --help> to get assistance", bg=ERROR_COLOR)
+        raise ConfigError("Encryption key not provided")
+
+
+def _report_install(result: api.InstallResult):
+    get_run_result().succeeded()
+    secho("Finished successfully.", fg="green")
+    emit(
+        "finished",
+        installation_folder=result.installation_folder,
+        peak_disk_usage=result.peak_disk_usage,
+    )
+    secho(
+        "Fabricator tool can be found at: {}".format(result.installation_folder),
+        fg=INFO_COLOR,
+    )
+    secho(
+        "Peak disk usage: {}".format(format_size(result.peak_disk_usage)),
         fg=INFO_COLOR,
     )
-
-
-def _get_latest_url(download_folder: str, json_file) -> str:
-    """Get the filename of the latest fabricator release."""
-    with open(json_file) as fl:
-        _version = json.load(fl)
-
-    latest = _version["latest"]
-    return urljoin(download_folder, latest)
 
 
 def fatal_handler(func):
@@ -144,56 +131,65 @@ def fatal_handler(func):
         try:
             func(*args, **kwargs)
         except FatalEchoException as err:
-            click.secho(30 * "-", fg=ERROR_COLOR, bold=True)
-            click.secho("  ## PROBLEM !! ##", bg=ERROR_COLOR, fg="white", bold=True)
-            click.secho(30 * "-", fg=ERROR_COLOR, bold=True)
-            click.secho("  " + str(err), bold=True)
-            click.secho(30 * "-", fg=ERROR_COLOR, bold=True)
-            click.echo("")
+            get_run_result().failed(type(err).__name__, err.exit_code)
+            if is_batch():
+                secho(f"Error: {err}")
+                emit(
+                    "error",
+                    error=type(err).__name__,
+                    message=str(err),
+                    exit_code=err.exit_code,
+                )
+                sys.exit(err.exit_code)
+            secho(30 * "-", fg=ERROR_COLOR, bold=True)
+            secho("  ## PROBLEM !! ##", bg=ERROR_COLOR, fg="white", bold=True)
+            secho(30 * "-", fg=ERROR_COLOR, bold=True)
+            secho("  " + str(err), bold=True)
+            secho(30 * "-", fg=ERROR_COLOR, bold=True)
+            echo("")
             click.prompt("ENTER to EXIT", default="")
             raise Abort()
 
     return wrapper
 
 
-@working_done("Decrypting...")
-def _decrypt(in_file: Path, out_file: Path, key) -> Path:
-    buffer_size = 64 * 1024
-
-    if not in_file.exists():
-        raise FatalEchoException("Encrypted file not found")
-
-    try:
-        decryptFile(str(in_file), str(out_file), key, buffer_size)
-    except PermissionError:
-        raise FatalEchoException("permission error")
-    except ValueError as err:
-        raise FatalEchoException(err)
-
-    return out_file
-
-
-@working_done("Cleaning output folder...")
-def _clean(output_folder: Path):
-    click.secho("Cleaning installation folder.")
-    try:
-        shutil.rmtree(output_folder)
-    except FileNotFoundError:
-        click.secho("Folder does not exist. Continueing", fg=INFO_COLOR)
-    except PermissionError:
-        raise FatalEchoException(
-            "Unable to clear installation folder. Did you close the fabricator ?"
-        )
+# Maximum number of damaged files listed.
+_MAX_LISTED = 20
 
 
-@working_done("Extracting archive...")
-def _extract(archive, output_folder):
-    try:
-        shutil.unpack_archive(archive, output_folder, "bztar")
-
-    except Exception as err:
-        LOGGER.exception(err)
-        raise FatalEchoException(err)
+def _verify(session: api.Session, quick=False, required=True):
+    """Verify the installed tree against the manifest shipped with it."""
+    secho("Verifying installation...", fg=INFO_COLOR, nl=False)
+    result = api.verify(session, quick=quick)
+    if result is None:
+        if required:
+            raise VerifyError(
+                "No manifest found. This installation can not be verified."
+            )
+        secho("no manifest found. Skipping.", fg=INFO_COLOR)
+        return
+
+    secho(f"checked {result.checked} files.", fg=INFO_COLOR)
+    if result.ok:
+        return
+
+    for label, names in (
+        ("missing", result.missing),
+        ("changed", result.changed),
+        ("unreadable", result.unreadable),
+    ):
+        for name in names[:_MAX_LISTED]:
+            secho(f"  {label}: {name}", fg=ERROR_COLOR)
+        if len(names) > _MAX_LISTED:
+            secho(f"  ... {len(names) - _MAX_LISTED} more", fg=ERROR_COLOR)
+    emit(
+        "verify",
+        checked=result.checked,
+        missing=result.missing,
+        changed=result.changed,
+        unreadable=result.unreadable,
+    )
+    raise VerifyError(api.damage_report(result))
 
 
 @click.group()
@@ -201,22 +197,37 @@ def _extract(archive, output_folder):
     "--clean", default=False, help="clear the installation folder first", is_flag=True
 )
 @click.option("--bootstrap", default=False, help="bootstrap the app", is_flag=True)
+@click.option(
+    "--verify", default=False, help="verify the installed files", is_flag=True
+)
 @click.pass_context
 @fatal_handler
-def install(ctx, clean, bootstrap):
+def install(ctx, clean, bootstrap, verify):
     """Install the fabricator tool."""
-    check_running()
     file_settings = get_file_settings()
     settings = load_settings(file_settings.config_file)
+    run_result = get_run_result()
+    run_result.metrics_file = settings.metrics_file
+    run_result.installation_folder = settings.installation_folder
+    session = api.Session(settings, file_settings)
+    ctx.call_on_close(session.close)
     ctx.obj = {
-        "settings": settings,
-        "file_settings": file_settings,
+        "session": session,
         "bootstrap": bootstrap,
+        "verify": verify,
     }
 
     _check_key(settings)
 
 
+def _after_install(ctx):
+    session: api.Session = ctx.obj.get("session")
+    if ctx.obj.get("verify"):
+        _verify(session, required=False)
+    if ctx.obj.get("bootstrap"):
+        _bootstrap(session.settings)
+
+
 @install.command()
 @click.pass_context
 @click.option(
@@ -232,30 +243,21 @@ def download(ctx, channel=None):
         is used. A release channel is basically a folder which get appended to the
         base download url.
     """
-    settings = ctx.obj.get("settings")
-    file_settings: "_FileSettings" = ctx.obj.get("file_settings")
-
-    if settings.download_url is None:
-        click.secho("-----------------------", bg="red")
-        click.secho("Error: No URL provided.", bg="red")
-        click.secho("-----------------------", bg="red")
-        click.echo("")
-        click.secho("Use <fab --help> for help.")
-        raise FatalEchoException()
-    click.secho("downloading version file {}".format(str(file_settings.version_file)))
-
-    if channel:
-        download_url = f"{settings.download_url}/{channel}/"
-    else:
-        download_url = settings.download_url
-
-    version_file = download_version_file(download_url, file_settings.version_file)
-    binary_url = _get_latest_url(download_url, version_file)
-    click.secho("downloading binary {}".format(str(binary_url)))
-    fabfile = file_settings.temp_installation_folder.joinpath("fabricator.encrypt")
-    download_fabfile(binary_url, fabfile)
-
-    _install(fabfile, True, settings, file_settings.temp_installation_folder)
+    session: api.Session = ctx.obj.get("session")
+
+    if session.settings.download_url is None:
+        secho("-----------------------", bg="red")
+        secho("Error: No URL provided.", bg="red")
+        secho("-----------------------", bg="red")
+        echo("")
+        secho("Use <fab --help> for help.")
+        raise ConfigError("No URL provided")
+
+    result = api.download(session, channel=channel, on_phase=_show_phase)
+    emit("release", url=result.url)
+    secho("Downloaded {}".format(result.url))
+    _report_install(result)
+    _after_install(ctx)
 
     closed_delay()
 
@@ -266,25 +268,173 @@ def download(ctx, channel=None):
 @fatal_handler
 def from_file(ctx, file):
     """Install fabricator using a provided binary file."""
-    fabfile = Path(file)
+    session: api.Session = ctx.obj.get("session")
+
+    result = api.install(Path(file), session, on_phase=_show_phase)
+    _report_install(result)
+    _after_install(ctx)
+
+
+def _prefetch(session: api.Session) -> bool:
+    """Stage the latest release when it is not installed yet.
+
+    :return: True when a release is staged.
+    """
+    result = api.stage(session, on_phase=_show_phase)
+    if result.rolled_back:
+        secho(
+            "{} was rolled back, it is not installed again.".format(result.latest),
+            fg=INFO_COLOR,
+        )
+        return False
+    if not result.update_available:
+        secho("{} is installed.".format(result.latest), fg=INFO_COLOR)
+        return False
+    emit("staged", release=result.staged)
+    secho("{} is staged.".format(result.staged), fg=INFO_COLOR)
+    return True
+
+
+def _swap_when_closed(session: api.Session) -> bool:
+    """Install the staged release, unless the fabricator is running.
+
+    :return: True when the staged release was installed.
+    """
+    release = api.swap(session)
+    if release is None:
+        return False
+
+    get_run_result().succeeded()
+    write_metrics(get_run_result(), get_timings())
+    emit("installed", release=release)
+    secho("Installed {}".format(release), fg="green")
+    return True
+
+
+@click.command()
+@click.option(
+    "--interval",
+    default=DEFAULT_INTERVAL,
+    type=float,
+    help="Seconds between checks for a new release.",
+)
+@click.option(
+    "--jitter",
+    default=DEFAULT_JITTER,
+    type=float,
+    help="Randomize the interval by this fraction of it.",
+)
+@click.option(
+    "--once",
+    default=False,
+    is_flag=True,
+    help="Check once and install when the fabricator is closed, then exit.",
+)
+@fatal_handler
+def agent(interval, jitter, once):
+    """Keep the fabricator up to date in the background.
+
+    New releases are downloaded, decrypted and verified while the fabricator is
+    running. Once it is closed the prepared release is installed in seconds.
+    """
+    file_settings = get_file_settings()
+    settings = load_settings(file_settings.config_file)
+    run_result = get_run_result()
+    run_result.metrics_file = settings.metrics_file
+    run_result.installation_folder = settings.installation_folder
+    _check_key(settings)
+    if settings.download_url is None:
+        raise ConfigError("No URL provided. Use <fab set-url>.")
+
+    # One session for all checks, so an unchanged version file is not
+    # downloaded again.
+    with api.Session(settings, file_settings) as session:
+        next_check = monotonic()
+        while True:
+            if monotonic() >= next_check:
+                try:
+                    _prefetch(session)
+                except FatalEchoException as err:
+                    if once:
+                        raise
+                    secho("Update failed: {}".format(err), fg=ERROR_COLOR)
+                    emit("error", error=type(err).__name__, message=str(err))
+                except Exception as err:
+                    if once:
+                        raise
+                    LOGGER.exception(err)
+                    emit("error", error=type(err).__name__, message=str(err))
+                next_check = monotonic() + jittered(interval, jitter)
+
+            try:
+                _swap_when_closed(session)
+            except Exception as err:
+                if once:
+                    raise
+                LOGGER.exception(err)
+                emit("error", error=type(err).__name__, message=str(err))
+            if once:
+                return
+            sleep(SWAP_CHECK_INTERVAL)
+
+
+@click.command()
+@fatal_handler
+def check():
+    """Check for a new fabricator release."""
+    file_settings = get_file_settings()
+    settings = load_settings(file_settings.config_file)
+
+    with api.Session(settings, file_settings) as session:
+        result = api.check(session)
+    emit(
+        "check",
+        latest=result.latest,
+        installed=result.installed,
+        staged=result.staged,
+        update_available=result.update_available,
+        rolled_back=result.rolled_back,
+    )
+    secho("latest:    {}".format(result.latest), fg=INFO_COLOR)
+    secho("installed: {}".format(result.installed or "unknown"), fg=INFO_COLOR)
+    if result.staged is not None:
+        secho("staged:    {}".format(result.staged), fg=INFO_COLOR)
+    if result.rolled_back:
+        secho("{} was rolled back.".format(result.latest), fg=INFO_COLOR)
+    if result.update_available:
+        secho("An update is available.", fg="green")
 
-    settings: "_Settings" = ctx.obj.get("settings")
-    file_settings: "_FileSettings" = ctx.obj.get("file_settings")
 
-    _install(fabfile, True, settings, file_settings.temp_installation_folder)
+@click.command()
+@fatal_handler
+def rollback():
+    """Return to the installation the last install replaced.
+
+    Rolling back again returns to the installation rolled back from.
+    """
+    file_settings = get_file_settings()
+    settings = load_settings(file_settings.config_file)
+
+    with api.Session(settings, file_settings) as session:
+        result = api.rollback(session)
+    emit("rollback", release=result.release, replaced=result.replaced)
+    secho(
+        "Rolled back to {}".format(result.release or "the previous installation"),
+        fg="green",
+    )
 
 
 def _set_key(key: str):
     if len(key) != 64:
-        raise FatalEchoException("Key length incorrect.")
+        raise ConfigError("Key length incorrect.")
     file_settings = get_file_settings()
     settings = load_settings(file_settings.config_file)
     settings.key = key
 
     save_settings(settings, file_settings.config_file)
 
-    click.secho("Encryption key saved.", fg="green")
-    click.secho(key, fg="green")
+    secho("Encryption key saved.", fg="green")
+    secho(key, fg="green")
     return key
 
 
@@ -299,7 +449,7 @@ def set_key(key: str):
 def _auto_load(folder: Path):
     txt = folder / "key.txt"
     if not txt.exists():
-        raise FatalEchoException(f"No key found. {txt}")
+        raise ConfigError(f"No key found. {txt}")
 
     with open(txt) as fl:
         _key = fl.read()
@@ -313,7 +463,7 @@ def auto_load():
     """Look in the current folder for a key.txt file and automatically processes it."""
 
     current_folder = Path.cwd()
-    click.secho(f"Current working folder {current_folder}")
+    secho(f"Current working folder {current_folder}")
 
     _key = _auto_load(current_folder)
     _set_key(_key)
@@ -330,31 +480,213 @@ def set_url(download_url: str):
     settings.download_url = download_url
     save_settings(settings, file_settings.config_file)
 
-    click.secho("Download url saved.", fg="green")
-    click.secho(download_url, fg="green")
+    secho("Download url saved.", fg="green")
+    secho(download_url, fg="green")
+
+
+@click.command()
+@click.argument("components", nargs=-1)
+@fatal_handler
+def set_components(components):
+    """Select the optional components to install.
+
+    Omit COMPONENTS to install all components again. Components for another
+    platform are never installed.
+    """
+    file_settings = get_file_settings()
+    settings = load_settings(file_settings.config_file)
+
+    settings.components = list(components) if components else None
+    save_settings(settings, file_settings.config_file)
+
+    secho("Components saved.", fg="green")
+    secho(", ".join(components) or "all", fg="green")
+
+
+@click.command()
+@click.argument("metrics_file", required=False, type=click.Path(dir_okay=False))
+@fatal_handler
+def set_metrics_file(metrics_file):
+    """Write Prometheus metrics to METRICS_FILE after every install.
+
+    Point it at the textfile collector folder of node_exporter, e.g.
+    /var/lib/node_exporter/textfile_collector/fab.prom. Omit METRICS_FILE to
+    stop writing metrics.
+    """
+    file_settings = get_file_settings()
+    settings = load_settings(file_settings.config_file)
+
+    settings.metrics_file = Path(metrics_file).absolute() if metrics_file else None
+    save_settings(settings, file_settings.config_file)
+
+    secho("Metrics file saved.", fg="green")
+    secho(str(settings.metrics_file or "none"), fg="green")
+
+
+def _parse_components(components) -> dict:
+    parsed = {}
+    for component in components:
+        name, sep, folder = component.partition("=")
+        if not sep or not name or not folder:
+            raise ConfigError(f"Invalid component {component}. Use NAME=FOLDER")
+        parsed[name] = folder
+    return parsed
+
+
+@click.command()
+@click.argument("source", type=click.Path(exists=True, file_okay=False))
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option(
+    "--component",
+    "components",
+    multiple=True,
+    help="Additional component as NAME=FOLDER, FOLDER relative to SOURCE.",
+)
+@fatal_handler
+def pack(source, output, components):
+    """Pack a fabricator tree into an encrypted installation file."""
+    file_settings = get_file_settings()
+    settings = load_settings(file_settings.config_file)
+    _check_key(settings)
+
+    secho("Packing...", fg=INFO_COLOR, nl=False)
+    try:
+        manifest = pack_tree(
+            Path(source), Path(output), settings.key, _parse_components(components)
+        )
+    except ValueError as err:
+        raise ConfigError(err)
+    secho("done.", fg=INFO_COLOR)
+
+    names = ", ".join(component.name for component in manifest.components)
+    secho(f"Components: {names or 'core only'}", fg=INFO_COLOR)
+    secho(f"Saved {output}", fg="green")
+
+
+@click.command()
+@click.option("--quick", default=False, help="only compare file sizes", is_flag=True)
+@fatal_handler
+def verify_install(quick):
+    """Check the installed files for missing or changed files."""
+    file_settings = get_file_settings()
+    settings = load_settings(file_settings.config_file)
+    with api.Session(settings, file_settings) as session:
+        _verify(session, quick=quick)
+    secho("Installation is intact.", fg="green")
+
+
+def _bootstrap(settings: "_Settings", force=False, timeout: Optional[float] = None):
+    """Bootstrap the installation, unless this release was bootstrapped before."""
+    file_settings = get_file_settings()
+    secho("Bootstrapping...", fg=INFO_COLOR)
+    emit("phase", phase="bootstrap", status="started")
+    with span("bootstrap"):
+        duration = execute_bootstrap(
+            settings.installation_folder,
+            timeout=settings.bootstrap_timeout if timeout is None else timeout,
+            cache_file=file_settings.bootstrap_file,
+            force=force,
+        )
+    if duration is None:
+        secho("Already bootstrapped. Skipping.", fg=INFO_COLOR)
+        emit("phase", phase="bootstrap", status="skipped")
+        return
+    secho("Bootstrapped in {:.1f}s.".format(duration), fg=INFO_COLOR)
+    emit("phase", phase="bootstrap", status="done", duration=duration)
 
 
 @click.command()
+@click.option(
+    "--force",
+    default=False,
+    is_flag=True,
+    help="bootstrap even when this release was bootstrapped before",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=None,
+    help="seconds the bootstrap may take. Defaults to the bootstrap_timeout setting.",
+)
 @fatal_handler
-def bootstrap():
+def bootstrap(force, timeout):
 
     """Prepare the fabricator app for usage."""
     file_settings = get_file_settings()
     settings = load_settings(file_settings.config_file)
-    execute_bootstrap(settings.installation_folder)
+    _bootstrap(settings, force=force, timeout=timeout)
 
 
 @click.version_option(version=__version__)
 @click.group()
-def main():
+@click.option(
+    "--batch",
+    default=False,
+    is_flag=True,
+    envvar=BATCH_ENV,
+    help="Unattended mode: never wait for input, print JSON-lines status events "
+    "and exit with a distinct code per failure. Also set by {}=1.".format(BATCH_ENV),
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write a cProfile stats file to PROFILE and a JSON timing report to "
+    "PROFILE.json.",
+)
+@click.pass_context
+def main(ctx, batch, profile):
     """Fabtool main entrypoint"""
+    set_batch(batch)
+    if batch:
+        set_consumers([json_lines_consumer])
+    else:
+        echo(jumbo)
+        set_consumers([ClickProgressBar()])
+
+    timings = reset_timings()
+    run_result = reset_run_result()
+    profiler = None
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    ctx.call_on_close(
+        functools.partial(_finish_run, timings, run_result, profiler, profile)
+    )
+
+
+def _finish_run(
+    timings: Timings, run_result: RunResult, profiler, profile: Optional[str]
+):
+    """Report the timings and metrics of a run."""
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile)
+        timings.save(Path(f"{profile}.json"))
+
+    write_metrics(run_result, timings)
+
+    if not timings.spans:
+        return
+    emit("timings", **timings.to_dict())
+    echo("")
+    secho(timings.summary(), fg=INFO_COLOR)
 
 
 main.add_command(install)
+main.add_command(agent)
+main.add_command(check)
+main.add_command(rollback)
 main.add_command(set_key)
 main.add_command(auto_load)
 main.add_command(set_url)
 main.add_command(bootstrap)
+main.add_command(set_components)
+main.add_command(set_metrics_file)
+main.add_command(pack)
+main.add_command(verify_install)
 
 if __name__ == "__main__":
     sys.exit(main())  # pragma: no cover
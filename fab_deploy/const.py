@@ -1,9 +1,9 @@
 import json
 import logging
 from pathlib import Path
+from dataclasses import dataclass
 from sys import platform
-
-from pydantic import BaseModel, BaseSettings, validator
+from typing import Any, Dict, List, Optional, Tuple
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -22,6 +22,11 @@ class _FileSettings:
     def config_file(self):
         return self.ease_config_folder.joinpath("fab-deploy.json")
 
+    @property
+    def bootstrap_file(self):
+        """Fingerprints of the bootstrapped installations."""
+        return self.ease_config_folder.joinpath("bootstrap.json")
+
     @property
     def version_file(self):
         return self.temp_installation_folder.joinpath("version.json")
@@ -39,26 +44,99 @@ def get_file_settings() -> _FileSettings:
     return _file_settings
 
 
-class _Settings(BaseSettings):
+def platform_default(download_url: Optional[str]) -> Optional[str]:
+    """Set download url depending on platform."""
+    if download_url is None:
+        if platform == "linux":
+            return "https://motorisation.hde.nl/bin/fabricator/ubuntu18_04/"
+        elif platform == "win32":
+            return "https://motorisation.hde.nl/bin/fabricator/win10/"
+    return download_url
+
+
+# Seconds a bootstrap may take before it is stopped.
+BOOTSTRAP_TIMEOUT = 600.0
+
+
+@dataclass(init=False)
+class _Settings:
     """Fab deploy settings.
 
     download_url: # URL base folder where binaries and version info is stored.
+    components: # Optional components to install. None installs all of them.
+    metrics_file: # Optional Prometheus textfile collector file written after a run.
+    bootstrap_timeout: # Seconds a bootstrap may take before it is stopped.
     """
 
-    download_url: str = None
-    installation_folder: Path = Path.home() / "fabricator"
-    key: str = None
-
-    @validator("download_url", pre=True, always=True)
-    def platform_default(cls, v, values, **kwargs):
-        """Set download url depending on platform."""
-        if v is None:
-            if platform == "linux":
-                return "https://motorisation.hde.nl/bin/fabricator/ubuntu18_04/"
-            elif platform == "win32":
-                return "https://motorisation.hde.nl/bin/fabricator/win10/"
-        else:
-            return v
+    __slots__ = (
+        "download_url",
+        "installation_folder",
+        "key",
+        "components",
+        "metrics_file",
+        "bootstrap_timeout",
+    )
+
+    download_url: Optional[str]
+    installation_folder: Path
+    key: Optional[str]
+    components: Optional[List[str]]
+    metrics_file: Optional[Path]
+    bootstrap_timeout: float
+
+    def __init__(
+        self,
+        download_url: Optional[str] = None,
+        installation_folder: Optional[Path] = None,
+        key: Optional[str] = None,
+        components: Optional[List[str]] = None,
+        metrics_file: Optional[Path] = None,
+        bootstrap_timeout: float = BOOTSTRAP_TIMEOUT,
+    ):
+        self.download_url = platform_default(download_url)
+        if installation_folder is None:
+            installation_folder = Path.home() / "fabricator"
+        self.installation_folder = Path(installation_folder)
+        self.key = key
+        self.components = None if components is None else list(components)
+        self.metrics_file = None if metrics_file is None else Path(metrics_file)
+        self.bootstrap_timeout = float(bootstrap_timeout)
+
+    @classmethod
+    def from_dict(cls, dct: Dict[str, Any]) -> "_Settings":
+        """Create settings, ignoring unknown keys."""
+        return cls(**{key: value for key, value in dct.items() if key in cls.__slots__})
+
+    def dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def json(self) -> str:
+        dct = self.dict()
+        dct["installation_folder"] = str(self.installation_folder)
+        if self.metrics_file is not None:
+            dct["metrics_file"] = str(self.metrics_file)
+        return json.dumps(dct)
+
+
+# Parsed settings files by path, with the (mtime, size) they were read at.
+_settings_cache: Dict[Path, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+
+
+def _read_settings_file(settings_file: Path) -> Optional[Dict[str, Any]]:
+    try:
+        stat = settings_file.stat()
+    except FileNotFoundError:
+        return None
+
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _settings_cache.get(settings_file)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(settings_file) as fl:
+        dct = json.load(fl)
+    _settings_cache[settings_file] = (stamp, dct)
+    return dct
 
 
 def save_settings(settings: _Settings, settings_file: Path):
@@ -69,16 +147,10 @@ def save_settings(settings: _Settings, settings_file: Path):
 
 def load_settings(settings_file: Path) -> _Settings:
     """Load app settings"""
-
-    if not settings_file.exists():
-        settings = _Settings()
-    else:
-        with open(settings_file) as fl:
-            dct = json.load(fl)
-        settings = _Settings(**dct)
-
-    settings.installation_folder.mkdir(exist_ok=True, parents=True)
-    return settings
+    dct = _read_settings_file(settings_file)
+    if dct is None:
+        return _Settings()
+    return _Settings.from_dict(dct)
 
 
 INFO_COLOR = "cyan"
@@ -40,12 +40,13 @@
 
 # pyAesCrypt module
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, hmac
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+# fab-deploy: cryptography is imported inside the functions using it, as it is
+# slow to import and most fab commands do not need it.
 from os import urandom
 from os import stat, remove, path
 
+from fab_deploy.timing import span
+
 # pyAesCrypt version
 version = "0.4.2"
 
@@ -61,6 +62,9 @@ AESBlockSize = 16
 
 # password stretching function
 def stretch(passw, iv1):
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+
     # hash the external iv and the password 8192 times
     digest = iv1 + (16 * b"\x00")
 
@@ -113,6 +117,10 @@ def encryptFile(infile, outfile, passw, bufferSize):
 #             using a larger buffer speeds up things when dealing
 #             with long streams
 def encryptStream(fIn, fOut, passw, bufferSize):
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, hmac
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
     # validate bufferSize
     if bufferSize % AESBlockSize != 0:
         raise ValueError("Buffer size must be a multiple of AES block size.")
@@ -242,7 +250,8 @@ def encryptStream(fIn, fOut, passw, bufferSize):
 # bufferSize: decryption buffer size, must be a multiple of AES block size (16)
 #             using a larger buffer speeds up things when dealing with
 #             big files
-def decryptFile(infile, outfile, passw, bufferSize):
+# callback: optional, called with the number of ciphertext bytes processed
+def decryptFile(infile, outfile, passw, bufferSize, callback=None):
     try:
         with open(infile, "rb") as fIn:
             # check that output file does not exist
@@ -256,7 +265,9 @@ def decryptFile(infile, outfile, passw, bufferSize):
                     # get input file size
                     inputFileSize = stat(infile).st_size
 
-                    decryptStream(fIn, fOut, passw, bufferSize, inputFileSize)
+                    decryptStream(
+                        fIn, fOut, passw, bufferSize, inputFileSize, callback
+                    )
             except ValueError as exd:
                 # remove output file on error
                 remove(outfile)
@@ -279,7 +290,14 @@ def decryptFile(infile, outfile, passw, bufferSize):
 #             using a larger buffer speeds up things when dealing with
 #             long streams
 # inputLength: input stream length
-def decryptStream(fIn, fOut, passw, bufferSize, inputLength):
+# callback: optional, called with the number of ciphertext bytes processed
+def decryptStream(fIn, fOut, passw, bufferSize, inputLength, callback=None):
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, hmac
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    start = fIn.tell()
+
     # validate bufferSize
     if bufferSize % AESBlockSize != 0:
         raise ValueError("Buffer size must be a multiple of AES block size")
@@ -324,7 +342,8 @@ def decryptStream(fIn, fOut, passw, bufferSize, inputLength):
         raise ValueError("File is corrupted.")
 
     # stretch password and iv
-    key = stretch(passw, iv1)
+    with span("key_stretch"):
+        key = stretch(passw, iv1)
 
     # read encrypted main iv and key
     c_iv_key = fIn.read(48)
@@ -362,6 +381,10 @@ def decryptStream(fIn, fOut, passw, bufferSize, inputLength):
     # instantiate actual HMAC-SHA256 of the ciphertext
     hmac0Act = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
 
+    # report the header
+    if callback:
+        callback(fIn.tell() - start)
+
     while fIn.tell() < inputLength - 32 - 1 - bufferSize:
         # read data
         cText = fIn.read(bufferSize)
@@ -369,6 +392,8 @@ def decryptStream(fIn, fOut, passw, bufferSize, inputLength):
         hmac0Act.update(cText)
         # decrypt data and write it to output file
         fOut.write(decryptor0.update(cText))
+        if callback:
+            callback(len(cText))
 
     # decrypt remaining ciphertext, until last block is reached
     while fIn.tell() < inputLength - 32 - 1 - AESBlockSize:
@@ -378,6 +403,8 @@ def decryptStream(fIn, fOut, passw, bufferSize, inputLength):
         hmac0Act.update(cText)
         # decrypt data and write it to output file
         fOut.write(decryptor0.update(cText))
+        if callback:
+            callback(len(cText))
 
     # last block reached, remove padding if needed
     # read last block
@@ -414,6 +441,10 @@ def decryptStream(fIn, fOut, passw, bufferSize, inputLength):
     if len(hmac0) != 32:
         raise ValueError("File is corrupted.")
 
+    # report the last block, the file size byte and the HMAC
+    if callback:
+        callback(len(cText) + len(fs16) + len(hmac0))
+
     # HMAC check
     if hmac0 != hmac0Act.finalize():
         raise ValueError("Bad HMAC (file is corrupted).")
@@ -0,0 +1,131 @@
+"""Disk space bookkeeping for the install pipeline.
+
+An install keeps the encrypted file, the decrypted archive and the extracted
+tree on disk during overlapping stages. The free space is checked for the
+worst stage before anything is deleted, and intermediate files are removed as
+soon as the next stage is done with them.
+"""
+
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fab_deploy.exceptions import DiskSpaceError
+
+_LOGGER = logging.getLogger(__name__)
+
+# Size of the extracted tree relative to the archive, used when the archive
+# has no manifest telling the actual size.
+DEFAULT_EXPANSION = 3.0
+
+# Space kept free on top of the estimate.
+MARGIN = 50 * 1024 * 1024
+
+# A stage maps folders to the number of bytes stored in them at the same time.
+Stage = Dict[Path, int]
+
+
+def format_size(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}MB"
+
+
+def _existing(folder: Path) -> Path:
+    """Return the folder or the first of its parents which exists."""
+    folder = Path(os.path.abspath(str(folder)))
+    while not folder.exists() and folder.parent != folder:
+        folder = folder.parent
+    return folder
+
+
+def required_space(stages: List[Stage]) -> Dict[int, Tuple[Path, int]]:
+    """Return the space needed per disk.
+
+    :return: {device id: (a folder on that disk, required bytes)}
+    """
+    required: Dict[int, Tuple[Path, int]] = {}
+    for stage in stages:
+        per_device: Dict[int, Tuple[Path, int]] = {}
+        for folder, size in stage.items():
+            existing = _existing(folder)
+            device = existing.stat().st_dev
+            _, current = per_device.get(device, (existing, 0))
+            per_device[device] = (existing, current + size)
+        for device, (folder, size) in per_device.items():
+            if size > required.get(device, (folder, 0))[1]:
+                required[device] = (folder, size)
+    return required
+
+
+def check_free_space(stages: List[Stage]):
+    """Raise a DiskSpaceError when a disk is too small for the stages."""
+    for folder, size in required_space(stages).values():
+        free = shutil.disk_usage(str(folder)).free
+        _LOGGER.debug("%s needs %s, %s free", folder, size, free)
+        if free < size + MARGIN:
+            raise DiskSpaceError(
+                f"Not enough disk space at {folder}. "
+                f"{format_size(size + MARGIN)} needed, {format_size(free)} free."
+            )
+
+
+def install_stages(
+    encrypted_size: int,
+    temp_folder: Path,
+    installation_folder: Path,
+    extracted_size: Optional[int] = None,
+    archive_size: Optional[int] = None,
+) -> List[Stage]:
+    """Return the stages of an install.
+
+    :param encrypted_size: Size of the encrypted file still to be written.
+        Zero when it is already on disk.
+    :param archive_size: Size of the decrypted archive. Defaults to the
+        encrypted size, which it is about equal to.
+    """
+    if archive_size is None:
+        archive_size = encrypted_size
+    if extracted_size is None:
+        extracted_size = int(archive_size * DEFAULT_EXPANSION)
+    return [
+        {temp_folder: encrypted_size + archive_size},
+        {temp_folder: archive_size, installation_folder: extracted_size},
+    ]
+
+
+class DiskUsage:
+    """Keep track of the bytes written by an install and their peak."""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._entries: Dict[Path, Tuple[int, bool]] = {}
+
+    def add(self, path: Path, size: Optional[int] = None, owned: bool = True):
+        """Register a file or folder.
+
+        :param size: Defaults to the size of the file.
+        :param owned: Only owned paths are deleted by remove.
+        """
+        if size is None:
+            size = path.stat().st_size
+        self.discard(path)
+        self._entries[path] = (size, owned)
+        self.current += size
+        self.peak = max(self.peak, self.current)
+
+    def discard(self, path: Path):
+        """Stop tracking a path without deleting it."""
+        size, _ = self._entries.pop(path, (0, False))
+        self.current -= size
+
+    def remove(self, path: Path):
+        """Delete a path if it is owned and stop tracking it."""
+        _, owned = self._entries.get(path, (0, False))
+        if owned:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self.discard(path)
@@ -2,62 +2,176 @@
 
 import logging
 from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
 from urllib.parse import urljoin
 
 import click
-import requests
 
 # from click import Abort
 
-from fab_deploy.const import INFO_COLOR, ERROR_COLOR
-from fab_deploy.exceptions import FatalEchoException
+from fab_deploy.exceptions import DownloadError
+from fab_deploy.output import is_batch
+from fab_deploy.progress import Consumer, progress
+from fab_deploy.release import Release, ReleaseVerifier
+from fab_deploy.timing import add_bytes
+from fab_deploy.transfer import AdaptiveBlockSize, copy_stream, preallocate
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def download_fabfile(download_url: str, dest: Path, force_download=True):
+def download_fabfile(
+    download_url: str,
+    dest: Path,
+    force_download=True,
+    preflight: Optional[Callable[[int], None]] = None,
+    release: Optional[Release] = None,
+    http=None,
+    on_progress: Optional[Consumer] = None,
+):
+    """Download the encrypted fabricator file.
+
+    :param preflight: Called with the download size before anything is written.
+    :param release: The published release, verified while downloading.
+    :param http: A requests session, to reuse its connections.
+    :param on_progress: Also receives the progress of the download.
+    """
+    return _download_file(
+        download_url,
+        dest,
+        force_download=force_download,
+        preflight=preflight,
+        release=release,
+        http=http,
+        on_progress=on_progress,
+    )
+
+
+def download_version_file(
+    download_url: str,
+    dest: Path,
+    http=None,
+    cache: Optional[Dict[str, Tuple[str, bytes]]] = None,
+) -> Path:
+    """Download the version file.
 
-    return _download_file(download_url, dest, force_download=force_download)
+    :param http: A requests session, to reuse its connections.
+    :param cache: Version files downloaded before by url, with their ETag. A
+        version file which did not change is taken from it.
+    """
+    version_url = urljoin(download_url, "version.json")
+    if cache is None:
+        return _download_file(
+            version_url, dest, force_download=True, phase="version", http=http
+        )
 
+    cached = cache.get(version_url)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = _get(version_url, http, headers=headers)
+    if cached is not None and response.status_code == 304:
+        _LOGGER.debug("%s did not change", version_url)
+        dest.write_bytes(cached[1])
+        return dest
+    _check_status(version_url, response)
+    dest.write_bytes(response.content)
+    add_bytes(len(response.content))
+    etag = response.headers.get("ETag")
+    if etag:
+        cache[version_url] = (etag, response.content)
+    return dest
 
-def download_version_file(download_url: str, dest: Path):
-    version_url = urljoin(download_url, "version.json")
-    return _download_file(version_url, dest, force_download=True)
+
+def _get(url: str, http=None, **kwargs):
+    # requests takes a large part of the start-up time. Only import it when used.
+    import requests
+
+    try:
+        return (http or requests).get(url, **kwargs)
+    except requests.exceptions.ConnectionError as err:
+        _LOGGER.exception(err)
+        raise DownloadError(f"Unable to make a connection {url}")
+
+
+def _check_status(url: str, response):
+    if response.status_code not in (200, 201, 202):
+        _LOGGER.error(response)
+        raise DownloadError(
+            f"Unable to connect to {url} status code {response.status_code}"
+        )
+
+
+def _remove(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _content_length(response) -> Optional[int]:
+    try:
+        return int(response.headers["content-length"])
+    except (KeyError, ValueError):
+        return None
 
 
 def _download_file(
     url,
     dest: Path,
-    chunk_size=1024,
+    block_size: Optional[AdaptiveBlockSize] = None,
     force_download=False,
-    label="Downloading ({size:.2f}MB)",
+    phase="download",
+    preflight: Optional[Callable[[int], None]] = None,
+    release: Optional[Release] = None,
+    http=None,
+    on_progress: Optional[Consumer] = None,
 ) -> Path:
 
     if dest.exists():
-        if not force_download:
+        if not force_download and not is_batch():
 
             if not click.confirm("File already exists. Replace {}?".format(dest)):
                 return dest
-    try:
-        request = requests.get(url, stream=True)
-    except requests.exceptions.ConnectionError as err:
-        _LOGGER.exception(err)
-        raise FatalEchoException(f"Unable to make a connection {url}")
-
-    if request.status_code not in (200, 201, 202):
-        _LOGGER.error(request)
-        raise FatalEchoException(
-            f"Unable to connect to {url} status code {request.status_code}"
+    # The content-length and the published size and digests are of the file
+    # itself, so ask for it as is.
+    request = _get(url, http, stream=True, headers={"Accept-Encoding": "identity"})
+    _check_status(url, request)
+
+    # requests takes a large part of the start-up time. Only import it when used.
+    import requests
+    from urllib3.exceptions import HTTPError
+
+    published = None if release is None else release.size
+    size = _content_length(request)
+    if size is None:
+        # Like a chunked response.
+        size = published
+    elif published is not None and size != published:
+        raise DownloadError(
+            f"{url} is {size} bytes, but {published} bytes were published"
         )
+    if preflight is not None and size is not None:
+        preflight(size)
+    verifier = ReleaseVerifier(release or Release(latest=dest.name))
+
+    def _update(block):
+        verifier.update(block)
+        bar.update(len(block))
 
-    size = int(request.headers.get("content-length"))
-    label = label.format(dest=dest, dest_basename=dest.name, size=size / 1024.0 / 1024)
-    with click.open_file(dest, "wb") as f:
-        content_iter = request.iter_content(chunk_size=chunk_size)
-        with click.progressbar(content_iter, length=size / 1024, label=label) as bar:
-            for chunk in bar:
-                if chunk:
-                    f.write(chunk)
-                    # f.flush()
-    click.secho("Finished. Saved {}".format(dest))
+    try:
+        with click.open_file(dest, "wb") as f:
+            if size is not None:
+                preallocate(f, size)
+            with progress(phase, size, on_progress) as bar:
+                copied = copy_stream(request.raw.readinto, f.write, _update, block_size)
+            if size is not None and copied != size:
+                raise ValueError(f"{copied} of {size} bytes received")
+            verifier.finish()
+    except ValueError as err:
+        _remove(dest)
+        raise DownloadError(f"Downloaded file {url} is damaged: {err}")
+    except (requests.RequestException, HTTPError, OSError) as err:
+        # Like a connection which broke off, or a full disk.
+        _remove(dest)
+        raise DownloadError(f"Unable to download {url}: {err}")
+    add_bytes(dest.stat().st_size)
+    _LOGGER.info("Saved %s", dest)
     return dest
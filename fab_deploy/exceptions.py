@@ -8,4 +8,60 @@ class EchoException(Exception):
 
 
 class FatalEchoException(Exception):
-    pass
+    """A problem which stops the current command.
+
+    Every subclass is a failure class with its own exit code, so callers of
+    fab can tell what went wrong without parsing the output.
+    """
+
+    exit_code = 1
+
+
+class ConfigError(FatalEchoException):
+    """Missing or invalid settings, like the key or download url."""
+
+    exit_code = 2
+
+
+class FabricatorRunningError(FatalEchoException):
+    exit_code = 3
+
+
+class DownloadError(FatalEchoException):
+    exit_code = 4
+
+
+class DecryptError(FatalEchoException):
+    exit_code = 5
+
+
+class CleanError(FatalEchoException):
+    exit_code = 6
+
+
+class ExtractError(FatalEchoException):
+    exit_code = 7
+
+
+class DiskSpaceError(FatalEchoException):
+    exit_code = 8
+
+
+class VerifyError(FatalEchoException):
+    exit_code = 9
+
+
+class BootstrapError(FatalEchoException):
+    exit_code = 10
+
+
+class LockedError(FatalEchoException):
+    """Another fab run is installing to the same installation folder."""
+
+    exit_code = 11
+
+
+class RollbackError(FatalEchoException):
+    """No previous installation to roll back to."""
+
+    exit_code = 12
@@ -0,0 +1,186 @@
+"""Extract fabricator archives.
+
+The archive is read sequentially (bz2 can only be decompressed front to back),
+but creating and writing the files is handed to a pool of threads. On Windows
+every file open is slowed down by antivirus hooks, so overlapping those calls
+is where the time is won.
+"""
+
+import logging
+import os
+import shutil
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Set, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+# File creation is I/O bound, so more threads than cores pays off.
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Upper limit of file data read from the archive but not yet written to disk.
+DEFAULT_MAX_PENDING_BYTES = 64 * 1024 * 1024
+
+# Files larger than this are written by the reading thread itself.
+INLINE_WRITE_SIZE = 8 * 1024 * 1024
+
+# Number of queued writes after which finished ones are collected.
+_PRUNE_PENDING = 1024
+
+MemberFilter = Callable[[tarfile.TarInfo], bool]
+
+
+class ExtractResult(NamedTuple):
+    files: int
+    bytes: int
+
+
+class _ByteBudget:
+    """Bound the amount of file data held in memory by pending writes."""
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int):
+        with self._condition:
+            # A single item larger than the limit is let through once
+            # nothing else is pending.
+            while self._used and self._used + size > self._limit:
+                self._condition.wait()
+            self._used += size
+
+    def release(self, size: int):
+        with self._condition:
+            self._used -= size
+            self._condition.notify_all()
+
+
+def _target_path(output_folder: Path, name: str) -> Path:
+    """Return the destination of an archive member.
+
+    Raises a ValueError for members that would end up outside the output folder.
+    """
+    target = Path(os.path.normpath(os.path.join(str(output_folder), name)))
+    if target != output_folder and output_folder not in target.parents:
+        raise ValueError(f"Archive member {name} points outside of the target folder")
+    return target
+
+
+def _set_attributes(path: Path, member: tarfile.TarInfo):
+    os.chmod(str(path), member.mode)
+    os.utime(str(path), (member.mtime, member.mtime))
+
+
+def _write_file(path: Path, data: bytes, member: tarfile.TarInfo, budget: _ByteBudget):
+    try:
+        with open(str(path), "wb") as fl:
+            fl.write(data)
+        _set_attributes(path, member)
+    finally:
+        budget.release(len(data))
+
+
+def _collect(pending: List[Future], wait=False) -> List[Future]:
+    """Raise errors of finished writes and return the unfinished ones."""
+    remaining = []
+    for future in pending:
+        if wait or future.done():
+            future.result()
+        else:
+            remaining.append(future)
+    return remaining
+
+
+class _DirectoryCache:
+    """Create every directory only once."""
+
+    def __init__(self):
+        self._created: Set[Path] = set()
+
+    def make(self, folder: Path):
+        if folder in self._created:
+            return
+        folder.mkdir(parents=True, exist_ok=True)
+        self._created.add(folder)
+
+
+def extract_archive(
+    archive: Path,
+    output_folder: Path,
+    member_filter: Optional[MemberFilter] = None,
+    workers: int = DEFAULT_WORKERS,
+    max_pending_bytes: int = DEFAULT_MAX_PENDING_BYTES,
+    callback: Optional[Callable[[int], None]] = None,
+) -> ExtractResult:
+    """Extract a tar archive using a pool of file writers.
+
+    :param archive: The (compressed) tar archive.
+    :param output_folder: Folder to extract into. Created when missing.
+    :param member_filter: Optional callable. Members for which it returns False
+        are skipped.
+    :param workers: Number of file writing threads.
+    :param max_pending_bytes: Maximum amount of file data kept in memory.
+    :param callback: Called with the size of every extracted member.
+    :return: The number of extracted files and their total size.
+    """
+    output_folder = Path(os.path.abspath(str(output_folder)))
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    budget = _ByteBudget(max_pending_bytes)
+    folders = _DirectoryCache()
+    directories: List[Tuple[Path, tarfile.TarInfo]] = []
+    pending: List[Future] = []
+    count = 0
+    size = 0
+
+    with tarfile.open(str(archive), "r:*") as tar, ThreadPoolExecutor(
+        max_workers=workers
+    ) as pool:
+        if hasattr(tarfile, "tar_filter"):
+            tar.extraction_filter = tarfile.tar_filter
+
+        for member in tar:
+            if member_filter is not None and not member_filter(member):
+                continue
+            target = _target_path(output_folder, member.name)
+
+            if member.isdir():
+                folders.make(target)
+                directories.append((target, member))
+                continue
+
+            folders.make(target.parent)
+            if member.isreg():
+                source = tar.extractfile(member)
+                if member.size > INLINE_WRITE_SIZE:
+                    with open(str(target), "wb") as fl:
+                        shutil.copyfileobj(source, fl, 1024 * 1024)
+                    _set_attributes(target, member)
+                else:
+                    data = source.read()
+                    budget.acquire(len(data))
+                    pending.append(
+                        pool.submit(_write_file, target, data, member, budget)
+                    )
+                    if len(pending) >= _PRUNE_PENDING:
+                        pending = _collect(pending)
+            else:
+                # Links may point to files which are still being written.
+                pending = _collect(pending, wait=True)
+                tar.extract(member, str(output_folder), set_attrs=True)
+            count += 1
+            size += member.size
+            if callback is not None:
+                callback(member.size)
+
+        _collect(pending, wait=True)
+
+    # Directory attributes last, so writing into them was still allowed.
+    for target, member in reversed(directories):
+        _set_attributes(target, member)
+
+    return ExtractResult(count, size)
@@ -0,0 +1,51 @@
+"""Hash files."""
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# hashlib releases the GIL for large updates, so hashing scales with threads.
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+
+def file_sha256(path: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    """Return the sha256 hex digest of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(str(path), "rb", buffering=0) as fl:
+        while True:
+            size = fl.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def _hash_or_none(path: Path) -> Optional[str]:
+    try:
+        return file_sha256(path)
+    except (FileNotFoundError, IsADirectoryError, PermissionError):
+        return None
+
+
+def hash_files(
+    root: Path, names: Iterable[str], workers: int = DEFAULT_WORKERS
+) -> Dict[str, Optional[str]]:
+    """Hash files on a thread pool.
+
+    :param root: Folder the names are relative to.
+    :param names: Relative posix paths.
+    :return: {name: digest}. The digest is None when a file can not be read.
+    """
+    names = list(names)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = pool.map(_hash_or_none, (root.joinpath(name) for name in names))
+        return dict(zip(names, digests))
@@ -0,0 +1,113 @@
+"""Inter-process locks.
+
+An installation folder is locked for the duration of an install, so two fab
+runs never install to the same folder at once. The lock is held on a file next
+to the installation folder, as the folder itself is renamed while installing.
+The operating system releases the lock when a process dies, so a lock is never
+left behind.
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from fab_deploy.exceptions import LockedError
+
+_LOGGER = logging.getLogger(__name__)
+
+LOCK_SUFFIX = ".lock"
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def _unlock(fd: int):
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def _unlock(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class FileLock:
+    """An exclusive, non-blocking lock on a file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """Take the lock.
+
+        :return: False when another process (or lock) holds it.
+        """
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        if not _try_lock(fd):
+            os.close(fd)
+            return False
+        # For whoever wonders who holds the lock.
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        os.lseek(fd, 0, os.SEEK_SET)
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            _unlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        if not self.acquire():
+            raise LockedError(f"{self.path} is locked by another process.")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def installation_lock(installation_folder: Path) -> FileLock:
+    return FileLock(
+        installation_folder.with_name(f"{installation_folder.name}{LOCK_SUFFIX}")
+    )
+
+
+def lock_installation(installation_folder: Path) -> FileLock:
+    """Lock an installation folder.
+
+    :raises LockedError: When another fab run is installing to it.
+    """
+    lock = installation_lock(installation_folder)
+    if not lock.acquire():
+        raise LockedError(
+            f"Another fab run is installing to {installation_folder}. "
+            "Wait for it to finish."
+        )
+    return lock
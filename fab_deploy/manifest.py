@@ -0,0 +1,175 @@
+"""Archive manifest.
+
+The manifest is the first member of a fabricator archive. It divides the
+archive into components, each being a set of folders. Components can be bound
+to a platform, so an install only extracts what the machine needs.
+
+It also lists the size and sha256 of every file, which is used to verify an
+installed tree.
+"""
+
+import json
+import logging
+import tarfile
+from dataclasses import dataclass, field, asdict
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, Optional
+
+from fab_deploy.const import KEY_LINUX, KEY_WINDOWS
+from fab_deploy.extract import MemberFilter
+from fab_deploy.hashing import hash_files
+
+_LOGGER = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".fab-manifest.json"
+MANIFEST_VERSION = 1
+
+# Component which holds everything not claimed by another component.
+CORE_COMPONENT = "core"
+
+PLATFORM_COMPONENTS = {
+    "linux": ("resources/linux", KEY_LINUX),
+    "win10": ("resources/win10", KEY_WINDOWS),
+}
+
+
+def normalize_name(name: str) -> str:
+    """Return an archive member name without leading "./"."""
+    path = PurePosixPath(name)
+    return str(PurePosixPath(*[part for part in path.parts if part != "."]))
+
+
+@dataclass
+class Component:
+    name: str
+    paths: List[str] = field(default_factory=list)
+    platform: Optional[str] = None
+
+
+@dataclass
+class FileEntry:
+    size: int
+    sha256: str
+
+
+@dataclass
+class Manifest:
+    version: int = MANIFEST_VERSION
+    components: List[Component] = field(default_factory=list)
+    files: Dict[str, FileEntry] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, dct: Dict) -> "Manifest":
+        return cls(
+            version=dct.get("version", MANIFEST_VERSION),
+            components=[Component(**item) for item in dct.get("components", [])],
+            files={
+                name: FileEntry(**entry) for name, entry in dct.get("files", {}).items()
+            },
+        )
+
+    @classmethod
+    def from_file(cls, path: Path) -> "Manifest":
+        with open(str(path)) as fl:
+            return cls.from_dict(json.load(fl))
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def component_of(self, name: str) -> Optional[Component]:
+        """Return the component an archive member belongs to.
+
+        The most specific (longest) matching path wins. None means the member
+        belongs to the core component.
+        """
+        parts = PurePosixPath(normalize_name(name)).parts
+        found = None
+        found_length = -1
+        for component in self.components:
+            for path in component.paths:
+                prefix = PurePosixPath(path).parts
+                if parts[: len(prefix)] == prefix and len(prefix) > found_length:
+                    found = component
+                    found_length = len(prefix)
+        return found
+
+    def includes(
+        self, name: str, platform: str, selected: Optional[Iterable[str]] = None
+    ) -> bool:
+        """Return whether a path is part of an install.
+
+        :param platform: Components for another platform are excluded, the ones
+            for this platform are always included.
+        :param selected: When provided only these components are included, next
+            to the core and platform components.
+        """
+        component = self.component_of(name)
+        if component is None:
+            return True
+        if component.platform is not None:
+            return component.platform == platform
+        return selected is None or component.name in selected
+
+    def member_filter(
+        self, platform: str, selected: Optional[Iterable[str]] = None
+    ) -> MemberFilter:
+        """Return a filter for extract_archive. See includes."""
+        selected = None if selected is None else set(selected)
+
+        def _filter(member: tarfile.TarInfo) -> bool:
+            return self.includes(member.name, platform, selected)
+
+        return _filter
+
+    def installed_files(
+        self, platform: str, selected: Optional[Iterable[str]] = None
+    ) -> Dict[str, FileEntry]:
+        """Return the files an install is expected to contain."""
+        selected = None if selected is None else set(selected)
+        return {
+            name: entry
+            for name, entry in self.files.items()
+            if self.includes(name, platform, selected)
+        }
+
+
+def build_manifest(source: Path, extra: Optional[Dict[str, str]] = None) -> Manifest:
+    """Create a manifest for a fabricator tree.
+
+    :param source: The fabricator tree.
+    :param extra: Additional components as {name: folder}.
+    """
+    components = [
+        Component(name=name, paths=[path], platform=platform)
+        for name, (path, platform) in PLATFORM_COMPONENTS.items()
+        if source.joinpath(path).exists()
+    ]
+    for name, path in (extra or {}).items():
+        if name == CORE_COMPONENT:
+            raise ValueError(f"{CORE_COMPONENT} is a reserved component name")
+        components.append(Component(name=name, paths=[normalize_name(path)]))
+
+    paths = {
+        path.relative_to(source).as_posix(): path
+        for path in source.rglob("*")
+        if path.is_file() and not path.is_symlink() and path.name != MANIFEST_NAME
+    }
+    digests = hash_files(source, paths)
+    files = {
+        name: FileEntry(size=paths[name].stat().st_size, sha256=digests[name])
+        for name in sorted(paths)
+    }
+    return Manifest(components=components, files=files)
+
+
+def read_manifest(archive: Path) -> Optional[Manifest]:
+    """Read the manifest of an archive.
+
+    Only the first member is read, so this does not decompress the archive.
+    Returns None for archives without a manifest.
+    """
+    with tarfile.open(str(archive), "r:*") as tar:
+        member = tar.next()
+        if member is None or normalize_name(member.name) != MANIFEST_NAME:
+            return None
+        return Manifest.from_dict(json.load(tar.extractfile(member)))
@@ -0,0 +1,174 @@
+"""Prometheus textfile collector metrics of a run.
+
+After a run the outcome, the phase timings and the installed release are
+written to the metrics file set in the settings, for node_exporter to pick
+up. The file is replaced atomically, so a partially written file is never read.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fab_deploy.atomic import write_atomic
+from fab_deploy.release import installed_version
+from fab_deploy.timing import Timings
+
+_LOGGER = logging.getLogger(__name__)
+
+PREFIX = "fab"
+
+OUTCOME_SUCCESS = "success"
+OUTCOME_FAILURE = "failure"
+
+# Fields of version.json which name the installed release. Others, like the
+# digests, would add a time series per release.
+INFO_LABELS = ("app", "flow", "latest", "previous")
+
+
+@dataclass
+class RunResult:
+    """The outcome of a run and where to report it."""
+
+    outcome: Optional[str] = None
+    error: Optional[str] = None
+    exit_code: int = 0
+    metrics_file: Optional[Path] = None
+    installation_folder: Optional[Path] = None
+
+    def succeeded(self):
+        self.outcome = OUTCOME_SUCCESS
+
+    def failed(self, error: str, exit_code: int):
+        self.outcome = OUTCOME_FAILURE
+        self.error = error
+        self.exit_code = exit_code
+
+
+_run_result = RunResult()
+
+
+def get_run_result() -> RunResult:
+    return _run_result
+
+
+def reset_run_result() -> RunResult:
+    global _run_result
+    _run_result = RunResult()
+    return _run_result
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+        self._described = set()
+
+    def add(self, name: str, value, help: str, labels: Dict[str, Any] = None):
+        name = f"{PREFIX}_{name}"
+        if name not in self._described:
+            self._described.add(name)
+            self.lines.append(f"# HELP {name} {help}")
+            self.lines.append(f"# TYPE {name} gauge")
+        self.lines.append(f"{name}{_labels(labels or {})} {float(value)!r}")
+
+
+def render(
+    result: RunResult,
+    timings: Timings,
+    version: Optional[Dict[str, Any]] = None,
+    now: Optional[float] = None,
+) -> str:
+    """Return the metrics in the Prometheus text format."""
+    writer = _Writer()
+    writer.add(
+        "run_timestamp_seconds",
+        time.time() if now is None else now,
+        "Time the last run finished.",
+    )
+    writer.add(
+        "run_success",
+        result.outcome == OUTCOME_SUCCESS,
+        "Whether the last run succeeded.",
+    )
+    writer.add("run_exit_code", result.exit_code, "Exit code of the last run.")
+    if result.error is not None:
+        writer.add(
+            "run_error", 1, "Error the last run failed with.", {"error": result.error}
+        )
+
+    # A phase can run more than once. Each metric must occur only once.
+    durations: Dict[str, float] = {}
+    sizes: Dict[str, int] = {}
+    for span in timings.spans:
+        durations[span.name] = durations.get(span.name, 0.0) + span.duration
+        if span.bytes is not None:
+            sizes[span.name] = sizes.get(span.name, 0) + span.bytes
+
+    for name, duration in durations.items():
+        writer.add(
+            "phase_duration_seconds",
+            duration,
+            "Duration of a phase of the last run.",
+            {"phase": name},
+        )
+    for name, size in sizes.items():
+        writer.add("phase_bytes", size, "Bytes processed by a phase.", {"phase": name})
+        if durations[name] > 0:
+            writer.add(
+                "phase_throughput_bytes_per_second",
+                size / durations[name],
+                "Throughput of a phase of the last run.",
+                {"phase": name},
+            )
+    writer.add(
+        "downloaded_bytes",
+        sizes.get("download", 0),
+        "Bytes downloaded by the last run.",
+    )
+
+    if version is not None:
+        labels = {
+            key: version[key]
+            for key in INFO_LABELS
+            if isinstance(version.get(key), (str, int, float))
+        }
+        writer.add("installed_info", 1, "The installed fabricator release.", labels)
+        if isinstance(version.get("size"), int):
+            writer.add(
+                "installed_size_bytes",
+                version["size"],
+                "Size of the installed fabricator file.",
+            )
+
+    return "\n".join(writer.lines) + "\n"
+
+
+def write_metrics(result: RunResult, timings: Timings) -> bool:
+    """Write the metrics of a run, when a metrics file is set.
+
+    Failing to write metrics never fails the run.
+    """
+    if result.metrics_file is None or result.outcome is None:
+        return False
+
+    version = None
+    if result.installation_folder is not None:
+        version = installed_version(result.installation_folder)
+    try:
+        write_atomic(result.metrics_file, render(result, timings, version))
+    except OSError as err:
+        _LOGGER.warning("Unable to write metrics to %s: %s", result.metrics_file, err)
+        return False
+    return True
@@ -0,0 +1,48 @@
+"""Console output.
+
+In batch mode the output is meant for a program instead of an operator:
+nothing waits for input, stdout only carries JSON-lines status events and the
+human readable text is written to stderr.
+"""
+
+import json
+import logging
+import time
+
+import click
+
+_LOGGER = logging.getLogger(__name__)
+
+BATCH_ENV = "FAB_BATCH"
+
+_batch = False
+
+
+def set_batch(batch: bool):
+    global _batch
+    _batch = batch
+
+
+def is_batch() -> bool:
+    return _batch
+
+
+def secho(message=None, nl=True, **styles):
+    """Print text for an operator."""
+    if _batch:
+        click.echo(message, nl=nl, err=True)
+    else:
+        click.secho(message, nl=nl, **styles)
+
+
+def echo(message=None, nl=True):
+    secho(message, nl=nl)
+
+
+def emit(event: str, **fields):
+    """Write a status event as a JSON line. Only in batch mode."""
+    if not _batch:
+        return
+    record = {"event": event, "time": round(time.time(), 3)}
+    record.update(fields)
+    click.echo(json.dumps(record, default=str))
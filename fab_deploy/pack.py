@@ -0,0 +1,49 @@
+"""Pack a fabricator tree into an encrypted installation file."""
+
+import io
+import json
+import logging
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from fab_deploy.crypto import encryptFile
+from fab_deploy.manifest import MANIFEST_NAME, Manifest, build_manifest
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def create_archive(source: Path, archive: Path, manifest: Manifest):
+    """Create a bz2 archive of a tree with the manifest as first member."""
+    data = json.dumps(manifest.to_dict(), indent=2).encode("utf8")
+    info = tarfile.TarInfo(MANIFEST_NAME)
+    info.size = len(data)
+    info.mode = 0o644
+    info.mtime = int(time.time())
+
+    with tarfile.open(str(archive), "w:bz2") as tar:
+        tar.addfile(info, io.BytesIO(data))
+        for child in sorted(source.iterdir()):
+            if child.name == MANIFEST_NAME:
+                continue
+            tar.add(str(child), arcname=child.name)
+
+
+def pack_tree(
+    source: Path, output: Path, key: str, components: Optional[Dict[str, str]] = None
+) -> Manifest:
+    """Pack and encrypt a fabricator tree.
+
+    :param source: The fabricator tree.
+    :param output: The encrypted installation file.
+    :param key: Encryption key.
+    :param components: Additional components as {name: folder}.
+    """
+    manifest = build_manifest(source, components)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = Path(tmp) / "fabricator.archive"
+        create_archive(source, archive, manifest)
+        encryptFile(str(archive), str(output), key, 64 * 1024)
+    return manifest
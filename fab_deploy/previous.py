@@ -0,0 +1,115 @@
+"""Keep the installation an install replaced, to roll back to.
+
+Installing renames the installation folder to a ``<name>.previous`` sibling
+instead of moving it to the trash, which is just as instant. One previous
+installation is kept: the one before it goes to the trash.
+
+A rollback leaves a ``<name>.rolled-back`` file next to the installation,
+naming the release rolled back from, so the agent does not install it again.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fab_deploy.atomic import write_atomic
+from fab_deploy.trash import move_to_trash, purge_in_background
+
+_LOGGER = logging.getLogger(__name__)
+
+PREVIOUS_MARKER = ".previous"
+# The installation while it is swapped with the previous one.
+ROLLBACK_MARKER = ".rollback"
+ROLLED_BACK_MARKER = ".rolled-back"
+
+
+def previous_folder(installation_folder: Path) -> Path:
+    return installation_folder.with_name(f"{installation_folder.name}{PREVIOUS_MARKER}")
+
+
+def retire(installation_folder: Path) -> Optional[Path]:
+    """Move the installation out of the way, keeping it as the previous one.
+
+    :return: The previous installation or None when there is no installation.
+    :raises PermissionError: When a file of the installation is in use.
+    """
+    if not installation_folder.exists():
+        return None
+    previous = previous_folder(installation_folder)
+    trash = move_to_trash(previous)
+    try:
+        installation_folder.rename(previous)
+    except OSError:
+        if trash is not None:
+            trash.rename(previous)
+        raise
+    purge_in_background(previous)
+    return previous
+
+
+def roll_back(installation_folder: Path) -> Optional[Path]:
+    """Swap the installation with the previous one.
+
+    Rolling back twice returns to the installation rolled back from.
+
+    :return: The installation rolled back from, which is the previous one now,
+        or None when there was no installation.
+    :raises FileNotFoundError: When there is no previous installation.
+    :raises PermissionError: When a file of the installation is in use.
+    """
+    previous = previous_folder(installation_folder)
+    if not previous.exists():
+        raise FileNotFoundError(f"No previous installation of {installation_folder}")
+
+    swapping = installation_folder.with_name(
+        f"{installation_folder.name}{ROLLBACK_MARKER}"
+    )
+    if move_to_trash(swapping) is not None:
+        _LOGGER.warning("Removed %s left by a rollback which died.", swapping)
+        purge_in_background(swapping)
+    try:
+        installation_folder.rename(swapping)
+    except FileNotFoundError:
+        swapping = None
+    try:
+        previous.rename(installation_folder)
+    except OSError:
+        if swapping is not None:
+            swapping.rename(installation_folder)
+        raise
+    if swapping is None:
+        return None
+    swapping.rename(previous)
+    return previous
+
+
+def rolled_back_file(installation_folder: Path) -> Path:
+    return installation_folder.with_name(
+        f"{installation_folder.name}{ROLLED_BACK_MARKER}"
+    )
+
+
+def mark_rolled_back(installation_folder: Path, version: Dict[str, Any]):
+    """Remember the release rolled back from.
+
+    :param version: The version file of the release.
+    """
+    marker = {key: version[key] for key in ("latest", "sha256") if key in version}
+    write_atomic(rolled_back_file(installation_folder), json.dumps(marker))
+
+
+def rolled_back_from(installation_folder: Path) -> Optional[Dict[str, Any]]:
+    """Return the release rolled back from, while it is not cleared."""
+    try:
+        with open(str(rolled_back_file(installation_folder))) as fl:
+            return json.load(fl)
+    except (OSError, ValueError):
+        return None
+
+
+def clear_rolled_back(installation_folder: Path):
+    try:
+        rolled_back_file(installation_folder).unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,81 @@
+"""Detect a running fabricator."""
+
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from fab_deploy.const import KEY_LINUX, KEY_PLATFORM, KEY_WINDOWS
+
+_LOGGER = logging.getLogger(__name__)
+
+# Written by the fabricator into its installation folder when it starts.
+PID_FILE = "fabricator.pid"
+
+EXECUTABLE_NAMES = {KEY_WINDOWS: "fabricator.exe", KEY_LINUX: "fabricator"}
+
+
+def executable_name(platform: str = KEY_PLATFORM) -> Optional[str]:
+    return EXECUTABLE_NAMES.get(platform)
+
+
+def _resolve(path) -> str:
+    return os.path.normcase(os.path.realpath(str(path)))
+
+
+def _is_fabricator(info: dict, folder: str, name: str) -> bool:
+    """Check the attributes of a process.
+
+    Any executable inside the installation folder counts, as it keeps files
+    locked. The name is only used for processes we are not allowed to inspect.
+    """
+    exe = info.get("exe")
+    if exe:
+        return _resolve(exe).startswith(folder + os.sep)
+    return info.get("name") == name
+
+
+def _read_pid(pid_file: Path) -> Optional[int]:
+    try:
+        with open(str(pid_file)) as fl:
+            return int(fl.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _check_pid_file(folder: str, name: str, pid_file: Path) -> Optional[int]:
+    """Find the fabricator using the pid file.
+
+    :return: None when the pid file is missing or unreadable, or was left behind
+        by a fabricator which did not close properly. Its pid may be reused by
+        another process by now.
+    """
+    import psutil
+
+    pid = _read_pid(pid_file)
+    if pid is None:
+        return None
+    try:
+        process = psutil.Process(pid)
+        info = process.as_dict(attrs=["name", "exe"], ad_value=None)
+    except psutil.NoSuchProcess:
+        return None
+    return pid if _is_fabricator(info, folder, name) else None
+
+
+def find_running(installation_folder: Path, name: str) -> Optional[int]:
+    """Return the pid of a fabricator running from the installation folder."""
+    import psutil
+
+    folder = _resolve(installation_folder)
+    pid_file = installation_folder.joinpath(PID_FILE)
+
+    pid = _check_pid_file(folder, name, pid_file)
+    if pid is not None:
+        return pid
+
+    # A stale pid file does not tell the fabricator is closed.
+    for process in psutil.process_iter(attrs=["name", "exe"], ad_value=None):
+        if _is_fabricator(process.info, folder, name):
+            return process.pid
+    return None
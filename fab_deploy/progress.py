@@ -0,0 +1,170 @@
+"""Progress events.
+
+Long running phases (download, decrypt, extract, upload) publish their
+progress here instead of drawing a progress bar themselves. Consumers, like a
+click progress bar or a JSON-lines emitter, are registered by the entry point.
+Events are rate limited, so publishing is cheap inside a loop.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional
+
+import click
+
+from fab_deploy.output import emit
+
+_LOGGER = logging.getLogger(__name__)
+
+# Minimum number of seconds between two events of a phase.
+DEFAULT_INTERVAL = 0.2
+
+
+@dataclass
+class ProgressEvent:
+    phase: str
+    done: int
+    total: Optional[int]
+    throughput: float
+    finished: bool = False
+
+
+Consumer = Callable[[ProgressEvent], None]
+
+_consumers: List[Consumer] = []
+
+
+def set_consumers(consumers: List[Consumer]):
+    _consumers[:] = consumers
+
+
+def add_consumer(consumer: Consumer):
+    _consumers.append(consumer)
+
+
+def remove_consumer(consumer: Consumer):
+    _consumers.remove(consumer)
+
+
+class Progress:
+    """Publishes the progress of one phase."""
+
+    def __init__(
+        self,
+        phase: str,
+        total: Optional[int] = None,
+        consumers: Optional[List[Consumer]] = None,
+        interval: float = DEFAULT_INTERVAL,
+    ):
+        self.phase = phase
+        self.total = total
+        self.done = 0
+        self._consumers = list(_consumers if consumers is None else consumers)
+        self._interval = interval
+        self._start = time.monotonic()
+        self._last = self._start
+        self._finished = False
+
+    def __enter__(self) -> "Progress":
+        self._publish()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.finish()
+
+    def update(self, size: int):
+        self.done += size
+        if not self._consumers:
+            return
+        now = time.monotonic()
+        if now - self._last >= self._interval:
+            self._last = now
+            self._publish()
+
+    def finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        self._publish()
+
+    def _publish(self):
+        elapsed = time.monotonic() - self._start
+        event = ProgressEvent(
+            phase=self.phase,
+            done=self.done,
+            total=self.total,
+            throughput=self.done / elapsed if elapsed > 0 else 0.0,
+            finished=self._finished,
+        )
+        for consumer in self._consumers:
+            consumer(event)
+
+
+def progress(
+    phase: str, total: Optional[int] = None, consumer: Optional[Consumer] = None
+) -> Progress:
+    """Create a publisher for a phase using the registered consumers.
+
+    :param consumer: Also publish to this consumer, like a callback passed to a
+        single call.
+    """
+    consumers = list(_consumers)
+    if consumer is not None:
+        consumers.append(consumer)
+    return Progress(phase, total, consumers)
+
+
+def json_lines_consumer(event: ProgressEvent):
+    """Publish events as JSON-lines status events."""
+    emit("progress", **asdict(event))
+
+
+class ClickProgressBar:
+    """Draw a click progress bar per phase.
+
+    Phases which run at the same time, like concurrent uploads, publish from
+    their own threads. They share one bar, as bars on the same line would
+    overwrite each other.
+    """
+
+    def __init__(self, file=None):
+        self._file = file
+        self._lock = threading.Lock()
+        self._bar = None
+        # The bytes shown of the phases in the bar.
+        self._shown: Dict[str, int] = {}
+
+    def _label(self, length: int) -> str:
+        first = next(iter(self._shown))
+        others = f" +{len(self._shown) - 1}" if len(self._shown) > 1 else ""
+        return f"{first.capitalize()}{others} ({length / 1024 / 1024:.2f}MB)"
+
+    def __call__(self, event: ProgressEvent):
+        if event.total is None:
+            # Nothing to draw a bar against.
+            return
+
+        with self._lock:
+            if event.phase not in self._shown:
+                self._shown[event.phase] = 0
+                if self._bar is None:
+                    self._bar = click.progressbar(
+                        length=event.total,
+                        label=self._label(event.total),
+                        file=self._file,
+                    )
+                    self._bar.__enter__()
+                else:
+                    self._bar.length += event.total
+                    self._bar.label = self._label(self._bar.length)
+
+            self._bar.update(event.done - self._shown[event.phase])
+            self._shown[event.phase] = event.done
+
+            if event.finished:
+                del self._shown[event.phase]
+                if not self._shown:
+                    self._bar.__exit__(None, None, None)
+                    self._bar = None
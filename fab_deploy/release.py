@@ -0,0 +1,268 @@
+"""The version file published next to the fabricator releases.
+
+It names the latest release. Publishing adds what a client needs to download
+it well: the size to preallocate, the sha256 of the file and of every chunk of
+it to verify while downloading, the container and codec to refuse a release
+this fab cannot install, and the release before it. All of these are
+optional, so old version files still parse and old clients, which only read
+`latest`, still work.
+
+A copy of it is kept in the installation folder, so it is known which release
+is installed.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fab_deploy.exceptions import DownloadError
+
+_LOGGER = logging.getLogger(__name__)
+
+INSTALLED_VERSION_FILE = ".fab-version.json"
+
+RELEASE_SCHEMA = 2
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# The AES Crypt file format. The header is "AES" and the format version.
+CONTAINER_MAGIC = b"AES"
+SUPPORTED_CONTAINERS = ("aescrypt-2",)
+# What the decrypted file is. extract_archive reads any of these.
+SUPPORTED_CODECS = ("tar", "tar.gz", "tar.bz2", "tar.xz")
+# What fab pack writes.
+DEFAULT_CODEC = "tar.bz2"
+
+_SHA256 = re.compile(r"^[0-9a-fA-F]{64}$")
+
+
+def _check_sha256(value, name: str):
+    if not isinstance(value, str) or not _SHA256.match(value):
+        raise ValueError(f"{name} is no sha256 hex digest: {value!r}")
+
+
+@dataclass
+class Release:
+    latest: str
+    schema: int = 1
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    container: Optional[str] = None
+    codec: Optional[str] = None
+    chunk_size: Optional[int] = None
+    chunks: List[str] = field(default_factory=list)
+    previous: Optional[str] = None
+    # Keys this fab does not know, like "app". Kept when written back.
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, dct: Dict[str, Any]) -> "Release":
+        """Create a release, checking the fields.
+
+        :raises ValueError: When a field is missing or invalid.
+        """
+        if not isinstance(dct.get("latest"), str):
+            raise ValueError("The version file does not name the latest release.")
+        known = {name for name in cls.__dataclass_fields__ if name != "extra"}
+        release = cls(
+            **{key: value for key, value in dct.items() if key in known},
+            extra={key: value for key, value in dct.items() if key not in known},
+        )
+        release.validate()
+        return release
+
+    @classmethod
+    def from_file(cls, path: Path) -> "Release":
+        with open(str(path)) as fl:
+            return cls.from_dict(json.load(fl))
+
+    def validate(self):
+        for name in ("size", "chunk_size"):
+            value = getattr(self, name)
+            if value is not None and (not isinstance(value, int) or value < 0):
+                raise ValueError(f"{name} is no size: {value!r}")
+        if self.sha256 is not None:
+            _check_sha256(self.sha256, "sha256")
+        if not isinstance(self.chunks, list):
+            raise ValueError(f"chunks is no list: {self.chunks!r}")
+        for chunk in self.chunks:
+            _check_sha256(chunk, "chunk")
+        if self.chunks:
+            if not self.chunk_size or self.size is None:
+                raise ValueError("Chunk hashes need a chunk_size and a size.")
+            if len(self.chunks) != chunk_count(self.size, self.chunk_size):
+                raise ValueError(
+                    f"{len(self.chunks)} chunk hashes for "
+                    f"{chunk_count(self.size, self.chunk_size)} chunks."
+                )
+
+    def to_dict(self) -> Dict[str, Any]:
+        dct = dict(self.extra)
+        dct["latest"] = self.latest
+        dct["schema"] = self.schema
+        for name in ("size", "sha256", "container", "codec", "chunk_size"):
+            if getattr(self, name) is not None:
+                dct[name] = getattr(self, name)
+        if self.chunks:
+            dct["chunks"] = self.chunks
+        if self.previous is not None:
+            dct["previous"] = self.previous
+        return dct
+
+    def save(self, path: Path):
+        with open(str(path), "w") as fl:
+            json.dump(self.to_dict(), fl, indent=2)
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return (size + chunk_size - 1) // chunk_size
+
+
+def container_of(path: Path) -> Optional[str]:
+    """Return the container format of a release file, if it is known."""
+    with open(str(path), "rb") as fl:
+        header = fl.read(4)
+    if len(header) == 4 and header[:3] == CONTAINER_MAGIC:
+        return f"aescrypt-{header[3]}"
+    return None
+
+
+def build_release(
+    path: Path,
+    codec: str = DEFAULT_CODEC,
+    previous: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    base: Optional[Release] = None,
+) -> Release:
+    """Describe a release file.
+
+    :param base: The version file written by hand, whose other keys are kept.
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    with open(str(path), "rb") as fl:
+        for block in iter(lambda: fl.read(chunk_size), b""):
+            digest.update(block)
+            chunks.append(hashlib.sha256(block).hexdigest())
+            size += len(block)
+    return Release(
+        latest=base.latest if base else path.name,
+        schema=RELEASE_SCHEMA,
+        size=size,
+        sha256=digest.hexdigest(),
+        container=container_of(path),
+        codec=codec,
+        chunk_size=chunk_size,
+        chunks=chunks,
+        previous=previous,
+        extra=dict(base.extra) if base else {},
+    )
+
+
+def check_supported(release: Release):
+    """Refuse a release this fab cannot install, before downloading it.
+
+    :raises DownloadError: When its container or codec is unknown.
+    """
+    if release.container is not None and release.container not in SUPPORTED_CONTAINERS:
+        raise DownloadError(
+            f"{release.latest} is a {release.container} file, which this fab "
+            "cannot decrypt. Update fab."
+        )
+    if release.codec is not None and release.codec not in SUPPORTED_CODECS:
+        raise DownloadError(
+            f"{release.latest} is a {release.codec} archive, which this fab "
+            "cannot extract. Update fab."
+        )
+
+
+class ReleaseVerifier:
+    """Verify a release while it streams in.
+
+    A damaged chunk fails the download right away instead of at its end.
+    """
+
+    def __init__(self, release: Release):
+        self.release = release
+        self._digest = hashlib.sha256()
+        self._chunk = hashlib.sha256()
+        self._chunk_filled = 0
+        self._chunk_index = 0
+        self._size = 0
+
+    def _check_chunk(self):
+        expected = self.release.chunks[self._chunk_index].lower()
+        if self._chunk.hexdigest() != expected:
+            raise ValueError(
+                f"chunk {self._chunk_index} at offset "
+                f"{self._chunk_index * self.release.chunk_size} is damaged"
+            )
+        self._chunk = hashlib.sha256()
+        self._chunk_filled = 0
+        self._chunk_index += 1
+
+    def update(self, block: bytes):
+        """:raises ValueError: When the data does not match the release."""
+        self._digest.update(block)
+        self._size += len(block)
+        if self.release.size is not None and self._size > self.release.size:
+            raise ValueError(f"more than the {self.release.size} bytes published")
+        if not self.release.chunks:
+            return
+        view = memoryview(block)
+        while view:
+            take = min(len(view), self.release.chunk_size - self._chunk_filled)
+            self._chunk.update(view[:take])
+            self._chunk_filled += take
+            view = view[take:]
+            if self._chunk_filled == self.release.chunk_size:
+                self._check_chunk()
+
+    def finish(self):
+        """:raises ValueError: When the data does not match the release."""
+        if self._chunk_filled:
+            self._check_chunk()
+        if self.release.size is not None and self._size != self.release.size:
+            raise ValueError(f"{self._size} bytes, published {self.release.size}")
+        if self.release.sha256 is not None:
+            if self._digest.hexdigest() != self.release.sha256.lower():
+                raise ValueError(
+                    f"sha256 {self._digest.hexdigest()}, "
+                    f"published {self.release.sha256}"
+                )
+
+
+def read_version_file(version_file: Path) -> Dict[str, Any]:
+    with open(str(version_file)) as fl:
+        return json.load(fl)
+
+
+def read_release(version_file: Path) -> Release:
+    """Read a downloaded version file.
+
+    :raises DownloadError: When it is no valid version file.
+    """
+    try:
+        return Release.from_file(version_file)
+    except ValueError as err:
+        raise DownloadError(f"The published version file is invalid: {err}")
+
+
+def save_installed_version(version_file: Path, installation_folder: Path):
+    """Keep the version file of the release just installed."""
+    shutil.copyfile(
+        str(version_file), str(installation_folder.joinpath(INSTALLED_VERSION_FILE))
+    )
+
+
+def installed_version(installation_folder: Path) -> Optional[Dict[str, Any]]:
+    """Return the version file of the installed release, if it is known."""
+    try:
+        return read_version_file(installation_folder.joinpath(INSTALLED_VERSION_FILE))
+    except (OSError, ValueError):
+        return None
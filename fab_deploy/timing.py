@@ -0,0 +1,107 @@
+"""Timing of the install phases.
+
+Every phase (download, decrypt, extract, ...) is recorded as a span with its
+duration and the number of bytes it processed. Spans can be nested, like the
+key stretching inside decrypting.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration: float = 0.0
+    bytes: Optional[int] = None
+    depth: int = 0
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Bytes per second."""
+        if self.bytes is None or self.duration <= 0:
+            return None
+        return self.bytes / self.duration
+
+    def to_dict(self) -> Dict:
+        dct = asdict(self)
+        dct["throughput"] = self.throughput
+        return dct
+
+
+class Timings:
+    """Records the spans of one run."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._open: List[Span] = []
+
+    @contextmanager
+    def span(self, name: str, bytes: Optional[int] = None):
+        span = Span(
+            name=name, start=time.perf_counter(), bytes=bytes, depth=len(self._open)
+        )
+        self.spans.append(span)
+        self._open.append(span)
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self._open.remove(span)
+
+    def add_bytes(self, size: int):
+        """Add processed bytes to the innermost open span."""
+        if not self._open:
+            return
+        span = self._open[-1]
+        span.bytes = (span.bytes or 0) + size
+
+    def summary(self) -> str:
+        """Return a table of the recorded spans."""
+        lines = [f"{'phase':<24}{'time':>10}{'size':>12}{'speed':>14}"]
+        for span in self.spans:
+            name = "  " * span.depth + span.name
+            size = speed = ""
+            if span.bytes is not None:
+                size = f"{span.bytes / 1024 / 1024:.1f}MB"
+            if span.throughput is not None:
+                speed = f"{span.throughput / 1024 / 1024:.1f}MB/s"
+            lines.append(f"{name:<24}{span.duration:>9.2f}s{size:>12}{speed:>14}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict:
+        return {"spans": [span.to_dict() for span in self.spans]}
+
+    def save(self, json_file: Path):
+        with open(str(json_file), "w") as fl:
+            json.dump(self.to_dict(), fl, indent=2)
+
+
+_timings = Timings()
+
+
+def get_timings() -> Timings:
+    return _timings
+
+
+def reset_timings() -> Timings:
+    global _timings
+    _timings = Timings()
+    return _timings
+
+
+def span(name: str, bytes: Optional[int] = None):
+    """Record a span on the timings of this run."""
+    return _timings.span(name, bytes)
+
+
+def add_bytes(size: int):
+    _timings.add_bytes(size)
@@ -0,0 +1,98 @@
+"""Copy data between streams with an adaptive block size.
+
+A fixed small block size means millions of Python loop iterations for a large
+payload. The block size used here doubles while an iteration takes less than
+the target time and halves when it takes much longer, so a fast connection
+moves several MB per iteration and a slow one still reports progress
+regularly. Blocks are read into one reused buffer.
+"""
+
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+MIN_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Target duration of one read/write iteration in seconds.
+TARGET_TIME = 0.05
+
+
+class AdaptiveBlockSize:
+    """Tune a block size towards a target time per iteration."""
+
+    def __init__(
+        self,
+        minimum: int = MIN_BLOCK_SIZE,
+        maximum: int = MAX_BLOCK_SIZE,
+        target: float = TARGET_TIME,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.size = minimum
+
+    @classmethod
+    def fixed(cls, size: int) -> "AdaptiveBlockSize":
+        return cls(minimum=size, maximum=size)
+
+    def record(self, seconds: float):
+        """Adjust the size after an iteration which took seconds."""
+        if seconds < self.target / 2:
+            self.size = min(self.size * 2, self.maximum)
+        elif seconds > self.target * 2:
+            self.size = max(self.size // 2, self.minimum)
+
+
+def copy_stream(
+    readinto: Callable[[memoryview], Optional[int]],
+    write: Callable[[memoryview], object],
+    callback: Optional[Callable[[memoryview], None]] = None,
+    block_size: Optional[AdaptiveBlockSize] = None,
+) -> int:
+    """Copy until readinto returns no more data.
+
+    :param readinto: Fills the passed buffer, returns the number of bytes read.
+    :param write: Writes the passed buffer completely.
+    :param callback: Called with every block written.
+    :param block_size: Defaults to an adaptive block size.
+    :return: The number of bytes copied.
+    """
+    if block_size is None:
+        block_size = AdaptiveBlockSize()
+    view = memoryview(bytearray(block_size.maximum))
+    total = 0
+    while True:
+        start = time.perf_counter()
+        size = readinto(view[: block_size.size])
+        if not size:
+            break
+        block = view[:size]
+        write(block)
+        if callback is not None:
+            callback(block)
+        total += size
+        block_size.record(time.perf_counter() - start)
+    return total
+
+
+def preallocate(fileobj, size: int):
+    """Reserve the disk space of a file about to be written.
+
+    The file system can then lay it out in one piece, and a full disk shows
+    before the download instead of halfway.
+    """
+    if size <= 0:
+        return
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fileobj.fileno(), 0, size)
+            return
+        except OSError as err:
+            # Not every file system supports it.
+            _LOGGER.debug("posix_fallocate failed: %s", err)
+    fileobj.truncate(size)
+    fileobj.seek(0)
@@ -0,0 +1,133 @@
+"""Remove old installations without blocking an install.
+
+The old installation folder is renamed to a
+``<name>.trash-<timestamp>-<pid>-<count>`` sibling, which is instant. The
+actual deletion happens on a background thread. Whatever is left behind (the
+process exited, a file was locked) is picked up by the next run.
+"""
+
+import itertools
+import logging
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+TRASH_MARKER = ".trash-"
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 0.5
+
+# Keeps the trash names of one process apart within the same second.
+_counter = itertools.count()
+
+
+def move_to_trash(folder: Path) -> Optional[Path]:
+    """Rename a folder out of the way.
+
+    :return: The trash folder or None when the folder does not exist.
+    :raises PermissionError: When the folder is locked.
+    """
+    timestamp = time.strftime("%Y%m%d%H%M%S")
+    prefix = f"{folder.name}{TRASH_MARKER}{timestamp}-{os.getpid()}"
+    trash = folder.with_name(f"{prefix}-{next(_counter)}")
+    while trash.exists():
+        # Left by an earlier process with the same pid.
+        trash = folder.with_name(f"{prefix}-{next(_counter)}")
+    try:
+        folder.rename(trash)
+    except FileNotFoundError:
+        return None
+    return trash
+
+
+def find_trash(folder: Path) -> List[Path]:
+    """Return the trash folders left behind for a folder."""
+    if not folder.parent.exists():
+        return []
+    return sorted(folder.parent.glob(f"{folder.name}{TRASH_MARKER}*"))
+
+
+def _make_writable_and_retry(func, path, _exc_info):
+    # Read-only files can not be removed on windows.
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+
+def _rmtree(path: Path):
+    if path.is_dir() and not path.is_symlink():
+        if sys.version_info >= (3, 12):
+            shutil.rmtree(path, onexc=_make_writable_and_retry)
+        else:
+            shutil.rmtree(path, onerror=_make_writable_and_retry)
+    else:
+        try:
+            path.unlink()
+        except PermissionError:
+            os.chmod(str(path), stat.S_IWRITE)
+            path.unlink()
+
+
+def _remove(path: Path, retries: int, retry_delay: float) -> bool:
+    for attempt in range(retries):
+        try:
+            _rmtree(path)
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError as err:
+            # Most likely a file which is locked by another process.
+            _LOGGER.debug("Unable to remove %s (attempt %s): %s", path, attempt, err)
+            time.sleep(retry_delay)
+    _LOGGER.warning("Unable to remove %s. Retrying on the next run.", path)
+    return False
+
+
+def purge(
+    trash_folders: List[Path],
+    workers: int = DEFAULT_WORKERS,
+    retries: int = DEFAULT_RETRIES,
+    retry_delay: float = DEFAULT_RETRY_DELAY,
+) -> List[Path]:
+    """Delete trash folders, one thread per subfolder.
+
+    :return: The trash folders which could not be removed completely.
+    """
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for trash in trash_folders:
+            try:
+                children = list(trash.iterdir())
+            except FileNotFoundError:
+                continue
+            results = pool.map(
+                lambda child: _remove(child, retries, retry_delay), children
+            )
+            if all(list(results)) and _remove(trash, retries, retry_delay):
+                continue
+            failed.append(trash)
+    return failed
+
+
+def purge_in_background(folder: Path, **kwargs) -> Optional[threading.Thread]:
+    """Delete the trash of a folder on a daemon thread.
+
+    :return: The started thread or None when there is nothing to delete.
+    """
+    trash_folders = find_trash(folder)
+    if not trash_folders:
+        return None
+
+    thread = threading.Thread(
+        target=purge, args=(trash_folders,), kwargs=kwargs, daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,84 @@
+"""Verify an installed fabricator tree against its manifest."""
+
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from fab_deploy.hashing import DEFAULT_WORKERS, hash_files
+from fab_deploy.manifest import MANIFEST_NAME, Manifest
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class VerifyResult:
+    checked: int = 0
+    missing: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    # Present, but not allowed to be read. A reinstall does not fix these.
+    unreadable: List[str] = field(default_factory=list)
+
+    @property
+    def damaged(self) -> bool:
+        return bool(self.missing or self.changed)
+
+    @property
+    def ok(self) -> bool:
+        return not self.damaged and not self.unreadable
+
+
+def verify_tree(
+    folder: Path,
+    platform: str,
+    selected: Optional[Iterable[str]] = None,
+    quick: bool = False,
+    workers: int = DEFAULT_WORKERS,
+) -> Optional[VerifyResult]:
+    """Compare an installed tree with the manifest shipped inside it.
+
+    :param folder: The installation folder.
+    :param platform: Platform the tree was installed for.
+    :param selected: The components selected during install.
+    :param quick: Only compare file sizes.
+    :return: The result or None when the tree has no manifest.
+    """
+    manifest_file = folder.joinpath(MANIFEST_NAME)
+    if not manifest_file.exists():
+        return None
+
+    expected = Manifest.from_file(manifest_file).installed_files(platform, selected)
+    result = VerifyResult(checked=len(expected))
+
+    present = {}
+    for name, entry in expected.items():
+        try:
+            size = folder.joinpath(name).stat().st_size
+        except FileNotFoundError:
+            result.missing.append(name)
+            continue
+        except PermissionError:
+            result.unreadable.append(name)
+            continue
+        if size != entry.size:
+            result.changed.append(name)
+        else:
+            present[name] = entry
+
+    if not quick:
+        digests = hash_files(folder, present, workers)
+        for name, entry in present.items():
+            digest = digests[name]
+            if digest is None:
+                # It was there a moment ago, when its size was checked.
+                if folder.joinpath(name).exists():
+                    result.unreadable.append(name)
+                else:
+                    result.missing.append(name)
+            elif digest != entry.sha256:
+                result.changed.append(name)
+
+    result.missing.sort()
+    result.changed.sort()
+    result.unreadable.sort()
+    return result
@@ -0,0 +1,80 @@
+"""Per-run working folders.
+
+Every run downloads and decrypts into its own folder below the temp
+installation folder, so concurrent runs never overwrite each other's files.
+A run holds a lock inside its workspace. Workspaces nobody holds a lock on
+were left behind by a run which died and are removed.
+"""
+
+import logging
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from fab_deploy.locking import FileLock
+
+_LOGGER = logging.getLogger(__name__)
+
+WORKSPACE_PREFIX = "run-"
+LOCK_FILE = ".lock"
+
+# A workspace is locked right after it is created. Leave younger ones alone, so
+# one is not taken for stale in between.
+MIN_STALE_AGE = 60.0
+
+
+def remove_stale_workspaces(root: Path, min_age: float = MIN_STALE_AGE) -> List[Path]:
+    """Remove workspaces of runs which no longer exist.
+
+    :return: The removed workspaces.
+    """
+    removed = []
+    if not root.exists():
+        return removed
+    now = time.time()
+    for workspace in root.glob(f"{WORKSPACE_PREFIX}*"):
+        try:
+            if now - workspace.stat().st_mtime < min_age:
+                continue
+        except FileNotFoundError:
+            continue
+        lock = FileLock(workspace.joinpath(LOCK_FILE))
+        if not lock.acquire():
+            continue
+        lock.release()
+        _LOGGER.info("Removing stale workspace %s", workspace)
+        shutil.rmtree(str(workspace), ignore_errors=True)
+        removed.append(workspace)
+    return removed
+
+
+class Workspace:
+    """A working folder owned by this run."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.path: Optional[Path] = None
+        self._lock: Optional[FileLock] = None
+
+    def open(self) -> Path:
+        remove_stale_workspaces(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.path = Path(tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=str(self.root)))
+        self._lock = FileLock(self.path.joinpath(LOCK_FILE))
+        self._lock.acquire()
+        return self.path
+
+    def close(self):
+        if self.path is None:
+            return
+        self._lock.release()
+        shutil.rmtree(str(self.path), ignore_errors=True)
+        self.path = None
+
+    def __enter__(self) -> Path:
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
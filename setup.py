@@ -16,7 +16,6 @@ setup(
         "idna==2.8",
         "psutil==5.6.3",
         "pycparser==2.19",
-        "pydantic==0.24",
         "requests==2.21.0",
         "six==1.12.0",
         "urllib3==1.24.2",
@@ -2,3 +2,11 @@ from pathlib import Path
 
 HERE = Path(__file__).parent.absolute()
 # TEST_TEMP_FOLDER: Path = HERE.joinpath(".ease", "bin")
+
+KEY = "abcABC"
+ARCHIVE_FILE = HERE.joinpath("test_files", "archive.ease.tar.bz2")
+FAB_FILE = HERE.joinpath("test_files", "fabricator.encrypt")
+FAKE_FAB_FILE = HERE.joinpath("test_files", "archive.ease_fake.aes")
+VERSION_FILE = HERE.joinpath("test_files", "version.json")
+
+DUMMY_DOWNLOAD_URL = "https://motorisation.hde.nl/fabricator/win10/"
@@ -1,9 +1,13 @@
+import json
 import time
 from pathlib import Path
 from shutil import rmtree
 
 import pytest
 
+from fab_deploy.const import _Settings, _FileSettings
+from tests.common import DUMMY_DOWNLOAD_URL, FAB_FILE, KEY, VERSION_FILE
+
 
 # test_location = "http://localhost:8000/fabricator.ease"
 
@@ -31,3 +35,44 @@ def clean():
 
     if _wait:
         time.sleep(1)
+
+
+@pytest.fixture
+def dummy_settings(tmp_path):
+    settings = _Settings(
+        installation_folder=tmp_path / "install_folder",
+        key=KEY,
+        download_url=DUMMY_DOWNLOAD_URL,
+    )
+    settings.installation_folder.mkdir(exist_ok=True, parents=True)
+    return settings
+
+
+@pytest.fixture
+def dummy_file_settings(tmp_path):
+    _FileSettings.temp_installation_folder = tmp_path.joinpath("temp_install")
+    _FileSettings.ease_config_folder = tmp_path.joinpath(".ease")
+    file_settings = _FileSettings()
+
+    return file_settings
+
+
+@pytest.fixture
+def mock_download_version_file(monkeypatch):
+    def version_file(download_url, dest_file, **kwargs):
+        with open(VERSION_FILE) as fl:
+            _js = json.load(fl)
+        with open(dest_file, "w") as fl:
+            json.dump(_js, fl)
+        return dest_file
+
+    monkeypatch.setattr("fab_deploy.api.download_version_file", version_file)
+
+
+@pytest.fixture
+def mock_download_release(monkeypatch, mock_download_version_file):
+    def _download_fabfile(binary_url, fabfile, preflight=None, **kwargs):
+        preflight(FAB_FILE.stat().st_size)
+        fabfile.write_bytes(FAB_FILE.read_bytes())
+
+    monkeypatch.setattr("fab_deploy.api.download_fabfile", _download_fabfile)
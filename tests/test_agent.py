@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from fab_deploy.agent import (
+    is_rolled_back,
+    is_staged,
+    jittered,
+    needs_update,
+    release_of,
+    staging_folder,
+    swap_in,
+)
+from fab_deploy.previous import mark_rolled_back
+from fab_deploy.release import INSTALLED_VERSION_FILE, Release
+
+
+def _release(folder, latest, **fields):
+    folder.mkdir(parents=True, exist_ok=True)
+    with open(folder / INSTALLED_VERSION_FILE, "w") as fl:
+        json.dump(dict(fields, latest=latest), fl)
+
+
+def test_jittered():
+    assert jittered(100, 0.2, rand=lambda: 0.0) == pytest.approx(80)
+    assert jittered(100, 0.2, rand=lambda: 0.5) == pytest.approx(100)
+    assert jittered(100, 0.2, rand=lambda: 1.0) == pytest.approx(120)
+
+
+def test_needs_update(tmp_path):
+    folder = tmp_path / "fabricator"
+    version = Release(latest="fab-2.fab")
+
+    assert needs_update(version, folder)
+    assert not is_staged(version, folder)
+
+    _release(staging_folder(folder), "fab-2.fab")
+    assert is_staged(version, folder)
+
+    _release(folder, "fab-2.fab")
+    assert not needs_update(version, folder)
+
+
+def test_needs_update_republished(tmp_path):
+    folder = tmp_path / "fabricator"
+    _release(folder, "fab-2.fab", sha256="a" * 64)
+
+    assert not needs_update(Release(latest="fab-2.fab", sha256="A" * 64), folder)
+    assert needs_update(Release(latest="fab-2.fab", sha256="b" * 64), folder)
+
+
+def test_swap_in(tmp_path):
+    folder = tmp_path / "fabricator"
+    _release(folder, "fab-1.fab")
+    _release(staging_folder(folder), "fab-2.fab")
+
+    previous = swap_in(folder)
+
+    assert release_of(folder) == "fab-2.fab"
+    assert not staging_folder(folder).exists()
+    # Kept to roll back to.
+    assert release_of(previous) == "fab-1.fab"
+
+
+def test_swap_in_failed(tmp_path):
+    folder = tmp_path / "fabricator"
+    _release(folder, "fab-1.fab")
+
+    # Nothing staged: the old installation is put back.
+    with pytest.raises(FileNotFoundError):
+        swap_in(folder)
+
+    assert release_of(folder) == "fab-1.fab"
+
+
+def test_is_rolled_back(tmp_path):
+    folder = tmp_path / "fabricator"
+    release = Release(latest="fab-2.fab", sha256="a" * 64)
+    assert not is_rolled_back(release, folder)
+
+    mark_rolled_back(folder, {"latest": "fab-2.fab", "sha256": "a" * 64})
+
+    assert is_rolled_back(release, folder)
+    assert not is_rolled_back(Release(latest="fab-3.fab"), folder)
+    # Published again with a fix.
+    assert not is_rolled_back(Release(latest="fab-2.fab", sha256="b" * 64), folder)
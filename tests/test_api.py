@@ -0,0 +1,283 @@
+import json
+
+import pytest
+
+from fab_deploy import api
+from fab_deploy.agent import release_of, staging_folder
+from fab_deploy.api import _clean, _decrypt, _extract, _install
+from fab_deploy.exceptions import (
+    CleanError,
+    FabricatorRunningError,
+    FatalEchoException,
+    LockedError,
+    RollbackError,
+)
+from fab_deploy.locking import lock_installation
+from fab_deploy.previous import previous_folder, rolled_back_from
+from fab_deploy.release import INSTALLED_VERSION_FILE
+from fab_deploy.verify import VerifyResult
+from tests.common import ARCHIVE_FILE, FAB_FILE, FAKE_FAB_FILE, KEY
+
+LATEST = "win10-fabricator-app0.11-ease1.0.fab"
+
+
+@pytest.fixture
+def not_running(monkeypatch):
+    monkeypatch.setattr("fab_deploy.api.check_running", lambda *args: None)
+
+
+@pytest.fixture
+def session(dummy_settings, dummy_file_settings):
+    with api.Session(dummy_settings, dummy_file_settings) as session:
+        yield session
+
+
+def _release(folder, latest):
+    folder.mkdir(parents=True, exist_ok=True)
+    with open(folder / INSTALLED_VERSION_FILE, "w") as fl:
+        json.dump({"latest": latest}, fl)
+
+
+def test_extract(dummy_file_settings):
+
+    _extract(ARCHIVE_FILE, dummy_file_settings.temp_installation_folder)
+
+    # assert only one file (the one inside the archive)
+    # is in the folder.
+    files = list(dummy_file_settings.temp_installation_folder.glob("**/*.*"))
+    assert len(files) == 1
+
+    # Add an arbitrary file.
+    with open(
+        dummy_file_settings.temp_installation_folder.joinpath("out.txt"), "w"
+    ) as fl:
+        fl.write("a")
+
+    files = list(dummy_file_settings.temp_installation_folder.glob("**/*.*"))
+    assert len(files) == 2
+
+    _extract(ARCHIVE_FILE, dummy_file_settings.temp_installation_folder)
+
+    files = list(dummy_file_settings.temp_installation_folder.glob("*.*"))
+    assert len(files) == 2
+
+    _clean(dummy_file_settings.temp_installation_folder)
+    _extract(ARCHIVE_FILE, dummy_file_settings.temp_installation_folder)
+    files = list(dummy_file_settings.temp_installation_folder.glob("*.*"))
+    assert len(files) == 1
+
+
+def test_clean_error(tmp_path, monkeypatch):
+    def _retire(folder):
+        raise OSError(39, "Directory not empty")
+
+    monkeypatch.setattr("fab_deploy.api.retire", _retire)
+
+    with pytest.raises(CleanError):
+        _clean(tmp_path / "fabricator")
+
+
+def test_decrypt_wrong_file(dummy_file_settings, clean):
+    """No file to encrypt found"""
+    with pytest.raises(FatalEchoException):
+        _decrypt(FAKE_FAB_FILE, dummy_file_settings.temp_installation_folder, KEY)
+
+
+def test_decrypt_file(dummy_file_settings, clean):
+
+    assert dummy_file_settings.temp_installation_folder.exists()
+    assert not dummy_file_settings.temp_installation_folder.is_file()
+
+    archive_file = dummy_file_settings.temp_installation_folder.joinpath(
+        "fabricator.archive"
+    )
+    _decrypt(FAB_FILE, archive_file, KEY)
+
+    assert archive_file.exists()
+
+
+def test_decrypt_reports_every_byte(dummy_file_settings, clean):
+    events = []
+    archive_file = dummy_file_settings.temp_installation_folder.joinpath(
+        "fabricator.archive"
+    )
+    _decrypt(FAB_FILE, archive_file, KEY, on_progress=events.append)
+
+    assert events[-1].finished
+    assert events[-1].done == FAB_FILE.stat().st_size
+
+
+def test_decrypt_wrong_key(dummy_file_settings, clean):
+    assert dummy_file_settings.temp_installation_folder.exists()
+    assert not dummy_file_settings.temp_installation_folder.is_file()
+
+    key = "wrong_key"
+    archive_file = dummy_file_settings.temp_installation_folder.joinpath(
+        "fabricator.archive"
+    )
+    with pytest.raises(FatalEchoException):
+        _decrypt(FAB_FILE, archive_file, key)
+
+
+def test__install(dummy_settings, dummy_file_settings):
+
+    _install(
+        FAB_FILE,
+        dummy_settings.installation_folder,
+        dummy_settings,
+        dummy_file_settings.temp_installation_folder,
+    )
+
+    files = list(dummy_settings.installation_folder.glob("**/*.*"))
+    assert len(files) > 0
+
+
+def test_install(not_running, session, dummy_settings):
+    folder = dummy_settings.installation_folder
+    folder.joinpath("old.txt").write_text("old")
+    events = []
+    phases = []
+
+    result = api.install(
+        FAB_FILE,
+        session,
+        on_progress=events.append,
+        on_phase=lambda phase, status: phases.append((phase, status)),
+    )
+
+    assert result.installation_folder == folder
+    assert result.extracted_bytes > 0
+    assert result.previous == previous_folder(folder)
+    assert result.previous.joinpath("old.txt").exists()
+    assert not folder.joinpath("old.txt").exists()
+    assert [phase for phase, status in phases if status == api.DONE] == [
+        "clean",
+        "decrypt",
+        "extract",
+    ]
+    assert {event.phase for event in events if event.finished} == {
+        "decrypt",
+        "extract",
+    }
+
+
+def test_install_locked(not_running, session, dummy_settings):
+    with lock_installation(dummy_settings.installation_folder):
+        with pytest.raises(LockedError):
+            api.install(FAB_FILE, session)
+
+
+def test_check(session, mock_download_version_file):
+    result = api.check(session)
+
+    assert result.latest == LATEST
+    assert result.installed is None
+    assert result.update_available
+
+
+def test_download(not_running, session, dummy_settings, mock_download_release):
+    result = api.download(session)
+
+    assert result.release.latest == LATEST
+    assert result.url == session.settings.download_url + LATEST
+    assert release_of(dummy_settings.installation_folder) == LATEST
+    assert not api.check(session).update_available
+
+
+def test_stage_and_swap(session, dummy_settings, mock_download_release, monkeypatch):
+    def _running(*args):
+        raise FabricatorRunningError("running")
+
+    monkeypatch.setattr("fab_deploy.api.check_running", _running)
+    folder = dummy_settings.installation_folder
+
+    result = api.stage(session)
+
+    assert result.staged == LATEST
+    assert result.update_available
+    assert api.swap(session) is None
+
+    monkeypatch.setattr("fab_deploy.api.check_running", lambda *args: None)
+    assert api.swap(session) == LATEST
+    assert release_of(folder) == LATEST
+    assert not staging_folder(folder).exists()
+
+
+def test_swap_failed(not_running, session, dummy_settings, monkeypatch):
+    folder = dummy_settings.installation_folder
+    _release(staging_folder(folder), LATEST)
+
+    def _swap_in(folder):
+        raise OSError(18, "Invalid cross-device link")
+
+    monkeypatch.setattr("fab_deploy.api.swap_in", _swap_in)
+
+    assert api.swap(session) is None
+    # The lock is released, to try again.
+    with lock_installation(folder):
+        pass
+
+
+def test_rollback(not_running, session, dummy_settings):
+    folder = dummy_settings.installation_folder
+    _release(folder, "fab-2.fab")
+    _release(previous_folder(folder), "fab-1.fab")
+
+    result = api.rollback(session)
+
+    assert result.release == "fab-1.fab"
+    assert result.replaced == "fab-2.fab"
+    assert release_of(folder) == "fab-1.fab"
+
+    # Rolling back again returns to where it started.
+    assert api.rollback(session).release == "fab-2.fab"
+
+
+def test_rollback_nothing_to_roll_back_to(not_running, session):
+    with pytest.raises(RollbackError):
+        api.rollback(session)
+
+
+def test_stage_after_rollback(
+    not_running, session, dummy_settings, mock_download_release
+):
+    folder = dummy_settings.installation_folder
+    _release(folder, "fab-1.fab")
+    api.stage(session)
+    assert api.swap(session) == LATEST
+
+    api.rollback(session)
+    assert rolled_back_from(folder)["latest"] == LATEST
+
+    # The agent leaves the rollback alone.
+    result = api.stage(session)
+
+    assert result.rolled_back
+    assert result.staged is None
+    assert api.swap(session) is None
+    assert release_of(folder) == "fab-1.fab"
+
+    # Until a release is installed.
+    api.download(session)
+
+    assert rolled_back_from(folder) is None
+    assert not api.check(session).rolled_back
+
+
+def test_rollback_discards_staged(not_running, session, dummy_settings):
+    folder = dummy_settings.installation_folder
+    _release(folder, "fab-2.fab")
+    _release(previous_folder(folder), "fab-1.fab")
+    _release(staging_folder(folder), "fab-2.fab")
+
+    api.rollback(session)
+
+    assert not staging_folder(folder).exists()
+    assert api.swap(session) is None
+
+
+def test_damage_report_unreadable():
+    report = api.damage_report(VerifyResult(checked=2, unreadable=["bin/fab"]))
+
+    assert "permissions" in report
+    assert "reinstall" not in report
@@ -0,0 +1,11 @@
+from fab_deploy.atomic import write_atomic
+
+
+def test_write_atomic(tmp_path):
+    path = tmp_path / "fab.prom"
+    path.write_text("old")
+
+    write_atomic(path, "new\n")
+
+    assert path.read_text() == "new\n"
+    assert [item.name for item in tmp_path.iterdir()] == ["fab.prom"]
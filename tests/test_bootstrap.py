@@ -0,0 +1,74 @@
+import sys
+
+import pytest
+
+from fab_deploy.bootstrap import execute_bootstrap, tree_fingerprint
+from fab_deploy.exceptions import BootstrapError
+from fab_deploy.manifest import MANIFEST_NAME
+
+pytestmark = pytest.mark.skipif(
+    sys.platform != "linux", reason="uses a script as fabricator executable"
+)
+
+
+def _fabricator(folder, script):
+    folder.mkdir(exist_ok=True)
+    executable = folder / "fabricator"
+    executable.write_text(f"#!{sys.executable}\nimport sys, time\n{script}\n")
+    executable.chmod(0o755)
+    return folder
+
+
+def test_bootstrap_cached(tmp_path, capsys):
+    folder = _fabricator(
+        tmp_path / "fabricator",
+        "open(sys.argv[0] + '.count', 'a').write('x')\nprint('bootstrapped')",
+    )
+    cache_file = tmp_path / "bootstrap.json"
+
+    assert execute_bootstrap(folder, cache_file=cache_file) is not None
+    assert "bootstrapped" in capsys.readouterr().out
+
+    # Same tree: skipped.
+    assert execute_bootstrap(folder, cache_file=cache_file) is None
+    assert execute_bootstrap(folder, cache_file=cache_file, force=True) is not None
+
+    # Another release: bootstrapped again.
+    (folder / MANIFEST_NAME).write_text("{}")
+    assert execute_bootstrap(folder, cache_file=cache_file) is not None
+
+    assert (folder / "fabricator.count").read_text() == "xxx"
+
+
+def test_fingerprint_changes(tmp_path):
+    folder = _fabricator(tmp_path / "fabricator", "")
+    before = tree_fingerprint(folder)
+
+    (folder / MANIFEST_NAME).write_text("{}")
+
+    assert tree_fingerprint(folder) != before
+
+
+def test_bootstrap_failed(tmp_path):
+    folder = _fabricator(
+        tmp_path / "fabricator", "print('broken', file=sys.stderr)\nsys.exit(3)"
+    )
+    cache_file = tmp_path / "bootstrap.json"
+
+    with pytest.raises(BootstrapError, match="broken"):
+        execute_bootstrap(folder, cache_file=cache_file)
+
+    # A failed bootstrap is not remembered.
+    assert not cache_file.exists()
+
+
+def test_bootstrap_timeout(tmp_path):
+    folder = _fabricator(tmp_path / "fabricator", "time.sleep(30)")
+
+    with pytest.raises(BootstrapError, match="did not finish"):
+        execute_bootstrap(folder, timeout=0.5)
+
+
+def test_bootstrap_missing(tmp_path):
+    with pytest.raises(BootstrapError):
+        execute_bootstrap(tmp_path)
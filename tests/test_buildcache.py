@@ -0,0 +1,61 @@
+import pytest
+
+from tools.buildcache import BuildCache, fingerprint
+
+
+def test_fingerprint(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    source.joinpath("a.py").write_text("a = 1")
+    source.joinpath("__pycache__").mkdir()
+    source.joinpath("__pycache__", "a.pyc").write_bytes(b"compiled")
+
+    digest = fingerprint(source, "1.0", root=tmp_path)
+
+    source.joinpath("__pycache__", "a.pyc").write_bytes(b"recompiled")
+    assert fingerprint(source, "1.0", root=tmp_path) == digest
+    assert fingerprint(source, "1.1", root=tmp_path) != digest
+
+    source.joinpath("a.py").write_text("a = 2")
+    assert fingerprint(source, "1.0", root=tmp_path) != digest
+
+
+def test_build_cache(tmp_path):
+    output = tmp_path / "output"
+    runs = []
+
+    def _build():
+        runs.append(1)
+        output.write_text("built")
+
+    cache = BuildCache(tmp_path / "cache.json")
+    assert cache.run("binary", "digest-1", _build, outputs=[output])
+    assert not cache.run("binary", "digest-1", _build, outputs=[output])
+
+    # The cache is kept between builds.
+    cache = BuildCache(tmp_path / "cache.json")
+    assert not cache.run("binary", "digest-1", _build, outputs=[output])
+    assert cache.run("binary", "digest-2", _build, outputs=[output])
+
+    output.unlink()
+    assert cache.run("binary", "digest-2", _build, outputs=[output])
+    assert len(runs) == 3
+
+    assert cache.run("pull", None, _build)
+    assert cache.run("pull", None, _build)
+
+    report = cache.report()
+    assert "binary" in report
+    assert "cached" in report
+    assert "total" in report
+
+
+def test_build_cache_failed_stage(tmp_path):
+    def _fail():
+        raise RuntimeError("build failed")
+
+    cache = BuildCache(tmp_path / "cache.json")
+    with pytest.raises(RuntimeError):
+        cache.run("binary", "digest-1", _fail)
+
+    assert not cache.is_current("binary", "digest-1")
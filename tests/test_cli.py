@@ -1,5 +1,5 @@
 import json
-from unittest.mock import Mock
+from unittest.mock import ANY, Mock
 from urllib.parse import urljoin
 
 import pytest
@@ -8,52 +8,30 @@ from click import Abort
 from click.testing import CliRunner
 
 from fab_deploy.cli import (
-    _extract,
-    _decrypt,
-    _clean,
-    _install,
-    _get_latest_url,
     main,
     _set_key,
     _auto_load,
 )
-from fab_deploy import cli
-from fab_deploy.const import _Settings, _FileSettings
-from fab_deploy.download import download_fabfile, download_version_file
-from fab_deploy.exceptions import FatalEchoException
-from tests.common import HERE
-
-KEY = "abcABC"
-ARCHIVE_FILE = HERE.joinpath("test_files", "archive.ease.tar.bz2")
-FAB_FILE = HERE.joinpath("test_files", "fabricator.encrypt")
-FAKE_FAB_FILE = HERE.joinpath("test_files", "archive.ease_fake.aes")
-VERSION_FILE = HERE.joinpath("test_files", "version.json")
+from fab_deploy import api
+from fab_deploy.const import _Settings
+from fab_deploy.download import download_fabfile
+from fab_deploy.agent import release_of, staging_folder
+from fab_deploy.exceptions import (
+    DecryptError,
+    FabricatorRunningError,
+    FatalEchoException,
+    LockedError,
+    RollbackError,
+)
+from fab_deploy.locking import lock_installation
+from fab_deploy.output import BATCH_ENV, set_batch
+from fab_deploy.previous import previous_folder
+from fab_deploy.release import INSTALLED_VERSION_FILE
+from tests.common import FAB_FILE
 
 good_key = "dsfsdfsdgtry4y45ygrth56u64h56uhy45gerg46h5u756y45terferfghryujh6"
 bad_key = "abcdefsdfwert445tyer"
 
-DUMMY_DOWNLOAD_URL = "https://motorisation.hde.nl/fabricator/win10/"
-
-
-@pytest.fixture
-def dummy_settings(tmp_path):
-    settings = _Settings(
-        installation_folder=tmp_path / "install_folder",
-        key=KEY,
-        download_url=DUMMY_DOWNLOAD_URL,
-    )
-    settings.installation_folder.mkdir(exist_ok=True, parents=True)
-    return settings
-
-
-@pytest.fixture
-def dummy_file_settings(tmp_path):
-    _FileSettings.temp_installation_folder = tmp_path.joinpath("temp_install")
-    _FileSettings.ease_config_folder = tmp_path.joinpath(".ease")
-    file_settings = _FileSettings()
-
-    return file_settings
-
 
 @pytest.fixture
 def mock_settings(monkeypatch, dummy_settings, dummy_file_settings):
@@ -85,66 +63,6 @@ def test_settings():
     assert settings is not None
 
 
-def test_extract(dummy_file_settings):
-
-    _extract(ARCHIVE_FILE, dummy_file_settings.temp_installation_folder)
-
-    # assert only one file (the one inside the archive)
-    # is in the folder.
-    files = list(dummy_file_settings.temp_installation_folder.glob("**/*.*"))
-    assert len(files) == 1
-
-    # Add an arbitrary file.
-    with open(
-        dummy_file_settings.temp_installation_folder.joinpath("out.txt"), "w"
-    ) as fl:
-        fl.write("a")
-
-    files = list(dummy_file_settings.temp_installation_folder.glob("**/*.*"))
-    assert len(files) == 2
-
-    _extract(ARCHIVE_FILE, dummy_file_settings.temp_installation_folder)
-
-    files = list(dummy_file_settings.temp_installation_folder.glob("*.*"))
-    assert len(files) == 2
-
-    _clean(dummy_file_settings.temp_installation_folder)
-    _extract(ARCHIVE_FILE, dummy_file_settings.temp_installation_folder)
-    files = list(dummy_file_settings.temp_installation_folder.glob("*.*"))
-    assert len(files) == 1
-
-
-def test_decrypt_wrong_file(dummy_file_settings, clean):
-    """No file to encrypt found"""
-    with pytest.raises(FatalEchoException):
-        _decrypt(FAKE_FAB_FILE, dummy_file_settings.temp_installation_folder, KEY)
-
-
-def test_decrypt_file(dummy_file_settings, clean):
-
-    assert dummy_file_settings.temp_installation_folder.exists()
-    assert not dummy_file_settings.temp_installation_folder.is_file()
-
-    archive_file = dummy_file_settings.temp_installation_folder.joinpath(
-        "fabricator.archive"
-    )
-    _decrypt(FAB_FILE, archive_file, KEY)
-
-    assert archive_file.exists()
-
-
-def test_decrypt_wrong_key(dummy_file_settings, clean):
-    assert dummy_file_settings.temp_installation_folder.exists()
-    assert not dummy_file_settings.temp_installation_folder.is_file()
-
-    key = "wrong_key"
-    archive_file = dummy_file_settings.temp_installation_folder.joinpath(
-        "fabricator.archive"
-    )
-    with pytest.raises(FatalEchoException):
-        _decrypt(FAB_FILE, archive_file, key)
-
-
 @responses.activate
 def test_download_fab_file(dummy_file_settings, clean, dummy_settings):
 
@@ -158,65 +76,59 @@ def test_download_fab_file(dummy_file_settings, clean, dummy_settings):
         download_fabfile(dummy_settings.download_url, fab_file)
 
 
-def test__install(dummy_settings, mock_settings, dummy_file_settings):
-
-    _install(
-        FAB_FILE, True, dummy_settings, dummy_file_settings.temp_installation_folder
-    )
-
-    files = list(dummy_settings.installation_folder.glob("**/*.*"))
-    assert len(files) > 0
-
-
-@pytest.fixture
-def mock_download_version_file(monkeypatch):
-    def version_file(download_url, dest_file):
-        with open(VERSION_FILE) as fl:
-            _js = json.load(fl)
-        with open(dest_file, "w") as fl:
-            json.dump(_js, fl)
-        return dest_file
-
-    monkeypatch.setattr("fab_deploy.cli.download_version_file", version_file)
-
-
 @pytest.fixture
 def mock_download_fabfile(monkeypatch):
     mock = Mock()
 
-    monkeypatch.setattr("fab_deploy.cli.download_fabfile", mock)
+    monkeypatch.setattr("fab_deploy.api.download_fabfile", mock)
     return mock
 
 
 @pytest.fixture
-def mock_install_function(monkeypatch):
-    mock_install = Mock()
+def mock_install_function(monkeypatch, dummy_settings):
+    mock_install = Mock(
+        return_value=api.InstallResult(dummy_settings.installation_folder)
+    )
 
-    monkeypatch.setattr("fab_deploy.cli._install", mock_install)
+    monkeypatch.setattr("fab_deploy.api._install", mock_install)
     return mock_install
 
 
-def mock_check_running(*args, **kwargs):
-    pass
+@pytest.fixture
+def not_running(monkeypatch):
+    def mock_check_running(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr("fab_deploy.api.check_running", mock_check_running)
 
 
 def test_cli_file(
-    mock_settings, dummy_file_settings, dummy_settings, mock_install_function
+    not_running,
+    mock_settings,
+    dummy_file_settings,
+    dummy_settings,
+    mock_install_function,
 ):
-    cli.check_running = mock_check_running
     runner = CliRunner()
     result = runner.invoke(main, ["install", "from-file", str(FAB_FILE)])
 
     mock_install_function.assert_called_with(
         FAB_FILE,
-        True,
+        dummy_settings.installation_folder,
         dummy_settings,
-        dummy_file_settings.temp_installation_folder,
+        ANY,
+        on_progress=None,
+        on_phase=ANY,
     )
+    # A workspace of its own, removed when done.
+    workspace = mock_install_function.call_args[0][3]
+    assert workspace.parent == dummy_file_settings.temp_installation_folder
+    assert not workspace.exists()
     assert result.exit_code == 0
 
 
 def test_cli_download(
+    not_running,
     mock_settings,
     dummy_file_settings,
     dummy_settings,
@@ -224,39 +136,48 @@ def test_cli_download(
     mock_download_fabfile,
     mock_install_function,
 ):
-    cli.check_running = mock_check_running
-    fab_encrypted = dummy_file_settings.temp_installation_folder.joinpath(
-        "fabricator.encrypt"
-    )
-
     runner = CliRunner()
     result = runner.invoke(main, ["install", "download"])
 
-    assert dummy_file_settings.version_file.exists()
+    assert dummy_settings.installation_folder.joinpath(INSTALLED_VERSION_FILE).exists()
 
+    workspace = mock_install_function.call_args[0][3]
+    assert workspace.parent == dummy_file_settings.temp_installation_folder
+    fab_encrypted = workspace.joinpath("fabricator.encrypt")
     mock_download_fabfile.assert_called_with(
         "https://motorisation.hde.nl/fabricator/win10/win10-fabricator-app0.11-ease1.0.fab",
         fab_encrypted,
         force_download=True,
+        preflight=ANY,
+        release=ANY,
+        http=ANY,
+        on_progress=None,
     )
 
     mock_install_function.assert_called_with(
         fab_encrypted,
-        True,
+        dummy_settings.installation_folder,
         dummy_settings,
-        dummy_file_settings.temp_installation_folder,
+        workspace,
+        disk_usage=ANY,
+        keep_previous=True,
+        on_progress=None,
+        on_phase=ANY,
     )
 
     assert result.exit_code == 0
 
 
-def test_get_latest_url(dummy_settings):
-    latest = _get_latest_url(dummy_settings.download_url, VERSION_FILE)
+def test_cli_locked(
+    not_running, mock_settings, dummy_settings, mock_install_function, batch_mode
+):
+    with lock_installation(dummy_settings.installation_folder):
+        result = CliRunner().invoke(
+            main, ["--batch", "install", "from-file", str(FAB_FILE)]
+        )
 
-    assert (
-        latest
-        == "https://motorisation.hde.nl/fabricator/win10/win10-fabricator-app0.11-ease1.0.fab"
-    )
+    assert result.exit_code == LockedError.exit_code
+    mock_install_function.assert_not_called()
 
 
 def test_set_key():
@@ -278,3 +199,194 @@ def test_autoload_key(dummy_key_file):
 def test_autoload_not_found(tmp_path):
     with pytest.raises(FatalEchoException):
         _auto_load(tmp_path)
+
+
+@pytest.fixture
+def batch_mode():
+    yield
+    set_batch(False)
+
+
+def test_cli_batch_error(
+    not_running, batch_mode, mock_settings, dummy_file_settings, mock_install_function
+):
+    mock_install_function.side_effect = DecryptError("Bad HMAC")
+
+    runner = CliRunner(env={BATCH_ENV: "1"})
+    result = runner.invoke(main, ["install", "from-file", str(FAB_FILE)])
+
+    assert result.exit_code == DecryptError.exit_code
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    assert events[-1]["event"] == "error"
+    assert events[-1]["error"] == "DecryptError"
+    assert events[-1]["message"] == "Bad HMAC"
+
+
+def test_cli_batch_install(not_running, batch_mode, mock_settings, dummy_settings):
+    runner = CliRunner()
+    result = runner.invoke(main, ["--batch", "install", "from-file", str(FAB_FILE)])
+
+    assert result.exit_code == 0
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    phases = [event["phase"] for event in events if event.get("status") == "done"]
+    assert phases == ["clean", "decrypt", "extract"]
+    assert events[-2]["event"] == "finished"
+    assert events[-1]["event"] == "timings"
+
+
+def test_cli_profile(not_running, mock_settings, dummy_settings, tmp_path):
+    profile = tmp_path / "fab.prof"
+
+    runner = CliRunner()
+    result = runner.invoke(
+        main, ["--profile", str(profile), "install", "from-file", str(FAB_FILE)]
+    )
+
+    assert result.exit_code == 0
+    assert profile.exists()
+    with open(f"{profile}.json") as fl:
+        spans = {span["name"]: span for span in json.load(fl)["spans"]}
+    assert spans["key_stretch"]["depth"] == 1
+    assert spans["extract"]["bytes"] > 0
+    assert "key_stretch" in result.output
+
+
+def _metric_samples(metrics_file):
+    lines = metrics_file.read_text().splitlines()
+    return dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+
+
+def test_cli_metrics(not_running, mock_settings, dummy_settings, tmp_path):
+    dummy_settings.metrics_file = tmp_path / "fab.prom"
+
+    result = CliRunner().invoke(main, ["install", "from-file", str(FAB_FILE)])
+
+    assert result.exit_code == 0
+    samples = _metric_samples(dummy_settings.metrics_file)
+    assert samples["fab_run_success"] == "1.0"
+    assert 'fab_phase_throughput_bytes_per_second{phase="decrypt"}' in samples
+    assert 'fab_phase_duration_seconds{phase="extract"}' in samples
+
+
+def test_cli_metrics_failure(
+    not_running, mock_settings, dummy_settings, tmp_path, monkeypatch
+):
+    dummy_settings.metrics_file = tmp_path / "fab.prom"
+
+    def _install(*args, **kwargs):
+        raise DecryptError("Bad HMAC")
+
+    monkeypatch.setattr("fab_deploy.api._install", _install)
+
+    CliRunner().invoke(main, ["install", "from-file", str(FAB_FILE)], input="\n")
+
+    samples = _metric_samples(dummy_settings.metrics_file)
+    assert samples["fab_run_success"] == "0.0"
+    assert samples["fab_run_exit_code"] == str(float(DecryptError.exit_code))
+
+
+def test_cli_agent(not_running, mock_settings, dummy_settings, mock_download_release):
+    result = CliRunner().invoke(main, ["agent", "--once"])
+
+    assert result.exit_code == 0, result.output
+    folder = dummy_settings.installation_folder
+    assert release_of(folder) == "win10-fabricator-app0.11-ease1.0.fab"
+    assert len(list(folder.glob("**/*.*"))) > 1
+    assert not staging_folder(folder).exists()
+
+
+def test_cli_agent_running(
+    mock_settings, dummy_settings, mock_download_release, monkeypatch
+):
+    def _running(*args, **kwargs):
+        raise FabricatorRunningError("running")
+
+    monkeypatch.setattr("fab_deploy.api.check_running", _running)
+
+    result = CliRunner().invoke(main, ["agent", "--once"])
+
+    assert result.exit_code == 0, result.output
+    folder = dummy_settings.installation_folder
+    assert release_of(folder) is None
+    assert release_of(staging_folder(folder)) == "win10-fabricator-app0.11-ease1.0.fab"
+
+    # Once closed the staged release is installed without downloading again.
+    monkeypatch.setattr("fab_deploy.api.check_running", lambda *args: None)
+    result = CliRunner().invoke(main, ["agent", "--once"])
+
+    assert result.exit_code == 0, result.output
+    assert release_of(folder) == "win10-fabricator-app0.11-ease1.0.fab"
+
+
+def test_cli_check(mock_settings, dummy_settings, mock_download_version_file):
+    result = CliRunner().invoke(main, ["check"])
+
+    assert result.exit_code == 0
+    assert "win10-fabricator-app0.11-ease1.0.fab" in result.output
+    assert "An update is available." in result.output
+
+
+def test_cli_install_bootstrap(
+    not_running, mock_settings, dummy_settings, mock_install_function, monkeypatch
+):
+    mock_bootstrap = Mock(return_value=None)
+    monkeypatch.setattr("fab_deploy.cli.execute_bootstrap", mock_bootstrap)
+
+    result = CliRunner().invoke(
+        main, ["install", "--bootstrap", "from-file", str(FAB_FILE)]
+    )
+
+    assert result.exit_code == 0
+    mock_bootstrap.assert_called_once_with(
+        dummy_settings.installation_folder,
+        timeout=dummy_settings.bootstrap_timeout,
+        cache_file=ANY,
+        force=False,
+    )
+    assert "Already bootstrapped" in result.output
+
+
+def test_cli_rollback(not_running, mock_settings, dummy_settings, batch_mode):
+    folder = dummy_settings.installation_folder
+    folder.joinpath("old.txt").write_text("old")
+
+    result = CliRunner().invoke(main, ["install", "from-file", str(FAB_FILE)])
+
+    assert result.exit_code == 0
+    assert previous_folder(folder).joinpath("old.txt").exists()
+
+    result = CliRunner().invoke(main, ["--batch", "rollback"])
+
+    assert result.exit_code == 0, result.output
+    assert folder.joinpath("old.txt").exists()
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    assert "rollback" in [event["event"] for event in events]
+
+
+def test_cli_rollback_nothing_installed(
+    not_running, mock_settings, dummy_settings, batch_mode
+):
+    result = CliRunner().invoke(main, ["--batch", "rollback"])
+
+    assert result.exit_code == RollbackError.exit_code
+
+
+def test_cli_agent_after_rollback(
+    not_running, mock_settings, dummy_settings, mock_download_release, batch_mode
+):
+    folder = dummy_settings.installation_folder
+    folder.mkdir(parents=True, exist_ok=True)
+    with open(folder / INSTALLED_VERSION_FILE, "w") as fl:
+        json.dump({"latest": "fab-1.fab"}, fl)
+    result = CliRunner().invoke(main, ["agent", "--once"])
+    assert result.exit_code == 0, result.output
+
+    result = CliRunner().invoke(main, ["--batch", "rollback"])
+    assert result.exit_code == 0, result.output
+    set_batch(False)
+
+    result = CliRunner().invoke(main, ["agent", "--once"])
+
+    assert result.exit_code == 0, result.output
+    assert "was rolled back" in result.output
+    assert release_of(folder) == "fab-1.fab"
@@ -1,7 +1,7 @@
 import logging
 
 # from fab_deploy.const import platform
-from fab_deploy.const import load_settings
+from fab_deploy.const import _Settings, load_settings, save_settings
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -23,3 +23,29 @@ def test_settings_win_url(monkeypatch, tmp_path):
     settings = load_settings(tmp_path / "settings.json")
 
     assert settings.download_url == "https://motorisation.hde.nl/bin/fabricator/win10/"
+
+
+def test_settings_round_trip(tmp_path):
+    settings_file = tmp_path / "settings.json"
+    settings = _Settings(
+        installation_folder=tmp_path / "fabricator",
+        key="abc",
+        components=["docs"],
+        metrics_file=tmp_path / "fab.prom",
+    )
+
+    save_settings(settings, settings_file)
+
+    assert load_settings(settings_file) == settings
+
+
+def test_settings_cached_until_changed(tmp_path):
+    settings_file = tmp_path / "settings.json"
+    settings_file.write_text('{"key": "abc", "unknown": 1}')
+
+    first = load_settings(settings_file)
+    first.key = "changed"
+    assert load_settings(settings_file).key == "abc"
+
+    settings_file.write_text('{"key": "defg"}')
+    assert load_settings(settings_file).key == "defg"
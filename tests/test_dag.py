@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from tools.buildcache import BuildCache
+from tools.dag import CACHED, DONE, FAILED, SKIPPED, Stage, check_graph, run_stages
+
+
+def test_independent_stages_run_concurrently(tmp_path):
+    # Both stages only pass the barrier when they run at the same time.
+    barrier = threading.Barrier(2, timeout=5)
+    order = []
+
+    def _stage(name):
+        def _action():
+            if name in ("lock", "lock-dev"):
+                barrier.wait()
+            order.append(name)
+
+        return _action
+
+    stages = [
+        Stage("pull", _stage("pull")),
+        Stage("lock", _stage("lock"), requires=["pull"]),
+        Stage("lock-dev", _stage("lock-dev"), requires=["pull"]),
+        Stage("build", _stage("build"), requires=["lock", "lock-dev"]),
+    ]
+
+    statuses = run_stages(stages, BuildCache(tmp_path / "cache.json"))
+
+    assert order[0] == "pull"
+    assert order[-1] == "build"
+    assert set(statuses.values()) == {DONE}
+
+
+def test_cached_stages(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("1")
+    runs = []
+    stages = [
+        Stage("pull", lambda: runs.append("pull")),
+        Stage(
+            "build",
+            lambda: runs.append("build"),
+            requires=["pull"],
+            inputs=lambda: [source],
+        ),
+        Stage(
+            "package",
+            lambda: runs.append("package"),
+            requires=["build"],
+            inputs=lambda: [],
+        ),
+    ]
+    cache_file = tmp_path / "cache.json"
+
+    run_stages(stages, BuildCache(cache_file))
+    statuses = run_stages(stages, BuildCache(cache_file))
+    assert statuses == {"pull": DONE, "build": CACHED, "package": CACHED}
+
+    # A changed input rebuilds the stage and the stages which require it.
+    source.write_text("2")
+    statuses = run_stages(stages, BuildCache(cache_file))
+    assert statuses == {"pull": DONE, "build": DONE, "package": DONE}
+    assert runs.count("package") == 2
+
+
+def test_failed_stage(tmp_path):
+    def _fail():
+        raise RuntimeError("lock failed")
+
+    seen = {}
+    stages = [
+        Stage("lock", _fail),
+        Stage("build", lambda: None, requires=["lock"]),
+    ]
+
+    with pytest.raises(RuntimeError):
+        run_stages(
+            stages,
+            BuildCache(tmp_path / "cache.json"),
+            status=lambda name, status: seen.__setitem__(name, status),
+        )
+
+    assert seen == {"lock": FAILED, "build": SKIPPED}
+
+
+def test_check_graph():
+    with pytest.raises(ValueError):
+        check_graph(
+            [Stage("a", None, requires=["b"]), Stage("b", None, requires=["a"])]
+        )
+    with pytest.raises(ValueError):
+        check_graph([Stage("a", None, requires=["missing"])])
+    with pytest.raises(ValueError):
+        check_graph([Stage("a", None), Stage("a", None)])
@@ -0,0 +1,112 @@
+import gzip
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+from tools.deb import ParallelGzipWriter, build_deb
+
+FIELDS = {
+    "Package": "fab",
+    "Version": "1.0",
+    "Architecture": "amd64",
+    "Maintainer": "s.teunissen",
+    "Description": "fabrication update tool",
+}
+
+
+def _ar_members(package):
+    content = package.read_bytes()
+    assert content.startswith(b"!<arch>\n")
+    members = {}
+    offset = 8
+    while offset < len(content):
+        header = content[offset : offset + 60]
+        name = header[:16].decode().strip()
+        size = int(header[48:58])
+        assert header[58:60] == b"`\n"
+        members[name] = content[offset + 60 : offset + 60 + size]
+        offset += 60 + size + size % 2
+    return members
+
+
+def _tree(tmp_path):
+    source = tmp_path / "fab"
+    source.joinpath("lib").mkdir(parents=True)
+    source.joinpath("fab").write_bytes(b"binary" * 1000)
+    source.joinpath("fab").chmod(0o755)
+    source.joinpath("lib", "data.bin").write_bytes(os.urandom(300000))
+    return source
+
+
+def test_parallel_gzip():
+    content = os.urandom(100000) + b"fabricator" * 50000
+    out = io.BytesIO()
+
+    writer = ParallelGzipWriter(out, workers=3, chunk_size=64 * 1024)
+    for idx in range(0, len(content), 10000):
+        writer.write(content[idx : idx + 10000])
+    writer.close()
+
+    assert gzip.decompress(out.getvalue()) == content
+
+
+@pytest.mark.parametrize(
+    "compression,suffix,decompress",
+    [("gzip", ".gz", gzip.decompress), ("xz", ".xz", lzma.decompress)],
+)
+def test_build_deb(tmp_path, compression, suffix, decompress):
+    source = _tree(tmp_path)
+    package = build_deb(source, tmp_path / "fab.deb", FIELDS, compression=compression)
+
+    members = _ar_members(package)
+    assert list(members) == [
+        "debian-binary",
+        f"control.tar{suffix}",
+        f"data.tar{suffix}",
+    ]
+    assert members["debian-binary"] == b"2.0\n"
+
+    with tarfile.open(
+        fileobj=io.BytesIO(decompress(members[f"control.tar{suffix}"]))
+    ) as tar:
+        control = tar.extractfile("./control").read().decode()
+    assert "Package: fab\n" in control
+    assert "Installed-Size: 299\n" in control
+
+    with tarfile.open(
+        fileobj=io.BytesIO(decompress(members[f"data.tar{suffix}"]))
+    ) as tar:
+        assert tar.getnames() == [
+            ".",
+            "./usr",
+            "./usr/bin",
+            "./usr/bin/fab",
+            "./usr/bin/lib",
+            "./usr/bin/lib/data.bin",
+        ]
+        binary = tar.getmember("./usr/bin/fab")
+        assert binary.mode == 0o755
+        assert binary.uname == "root"
+        assert tar.extractfile(binary).read() == b"binary" * 1000
+
+
+def test_build_deb_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        build_deb(_tree(tmp_path), tmp_path / "fab.deb", FIELDS, compression="zstd")
+    assert not (tmp_path / "fab.deb").exists()
+
+
+@pytest.mark.skipif(shutil.which("dpkg-deb") is None, reason="Needs dpkg-deb.")
+def test_build_deb_dpkg(tmp_path):
+    package = build_deb(_tree(tmp_path), tmp_path / "fab.deb", FIELDS)
+
+    subprocess.run(["dpkg-deb", "--info", str(package)], check=True)
+    extracted = tmp_path / "extracted"
+    subprocess.run(["dpkg-deb", "-x", str(package), str(extracted)], check=True)
+
+    assert extracted.joinpath("usr", "bin", "fab").read_bytes() == b"binary" * 1000
@@ -0,0 +1,45 @@
+import shutil
+
+import pytest
+
+from fab_deploy.diskspace import (
+    DiskUsage,
+    check_free_space,
+    install_stages,
+    required_space,
+)
+from fab_deploy.exceptions import FatalEchoException
+
+
+def test_required_space_same_disk(tmp_path):
+    stages = install_stages(100, tmp_path / "temp", tmp_path / "install", 500)
+
+    # The extract stage is the worst: archive (100) + extracted tree (500).
+    assert [size for _, size in required_space(stages).values()] == [600]
+
+
+def test_check_free_space(tmp_path):
+    check_free_space(install_stages(1024, tmp_path, tmp_path))
+
+    free = shutil.disk_usage(str(tmp_path)).free
+    with pytest.raises(FatalEchoException):
+        check_free_space([{tmp_path / "not_yet_created": free}])
+
+
+def test_disk_usage_peak(tmp_path):
+    encrypted = tmp_path / "fabricator.encrypt"
+    encrypted.write_bytes(b"x" * 100)
+    archive = tmp_path / "fabricator.archive"
+    archive.write_bytes(b"x" * 90)
+
+    usage = DiskUsage()
+    usage.add(encrypted)
+    usage.add(archive)
+    usage.remove(encrypted)
+    usage.add(tmp_path / "tree", 300, owned=False)
+    usage.remove(archive)
+
+    assert usage.peak == 390
+    assert usage.current == 300
+    assert not encrypted.exists()
+    assert not archive.exists()
@@ -0,0 +1,50 @@
+import io
+import tarfile
+
+import pytest
+
+from fab_deploy.extract import extract_archive
+
+
+def _make_archive(path, files):
+    with tarfile.open(path, "w:bz2") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+def test_extract_many_files(tmp_path):
+    files = {f"sub{idx % 7}/file{idx}.txt": b"x" * idx for idx in range(500)}
+    archive = _make_archive(tmp_path / "archive.tar.bz2", files)
+    output = tmp_path / "output"
+
+    result = extract_archive(archive, output, workers=4, max_pending_bytes=1024)
+
+    assert result.files == len(files)
+    assert result.bytes == sum(len(content) for content in files.values())
+    for name, content in files.items():
+        assert (output / name).read_bytes() == content
+
+
+def test_extract_member_filter(tmp_path):
+    files = {"keep/a.txt": b"a", "skip/b.txt": b"b"}
+    archive = _make_archive(tmp_path / "archive.tar.bz2", files)
+    output = tmp_path / "output"
+
+    extract_archive(
+        archive, output, member_filter=lambda member: member.name.startswith("keep")
+    )
+
+    assert (output / "keep" / "a.txt").exists()
+    assert not (output / "skip").exists()
+
+
+def test_extract_outside_target(tmp_path):
+    archive = _make_archive(tmp_path / "archive.tar.bz2", {"../evil.txt": b"evil"})
+
+    with pytest.raises(ValueError):
+        extract_archive(archive, tmp_path / "output")
+
+    assert not (tmp_path / "evil.txt").exists()
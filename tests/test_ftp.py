@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+pytest.importorskip("pyftpdlib")
+
+from ftplib import error_perm  # noqa: E402
+from functools import partial  # noqa: E402
+from unittest.mock import Mock  # noqa: E402
+
+from fab_deploy.release import Release  # noqa: E402
+from tools import ftp as ftp_module  # noqa: E402
+from tools.ftp import (  # noqa: E402
+    Artifact,
+    UploadError,
+    Uploaded,
+    _NewFtpTls,
+    _remote_sha256,
+    _ftps_connect,
+    _upload,
+    publish,
+    verify_remote,
+)
+from tools.ftpserver import (  # noqa: E402
+    PASSW,
+    USER,
+    local_ftp_server,
+    make_certificate,
+)
+
+CONTENT = bytes(range(256)) * 4096
+
+
+@pytest.fixture
+def ftp_root(tmp_path):
+    root = tmp_path / "root"
+    (root / "bin").mkdir(parents=True)
+    return root
+
+
+@pytest.fixture
+def ftp(ftp_root):
+    """A plain FTP connection. Without auth() FTP_TLS does not use TLS."""
+    with local_ftp_server(ftp_root) as (host, port):
+        ftp = _NewFtpTls()
+        ftp.connect(host, port)
+        ftp.login(USER, PASSW, secure=False)
+        yield ftp
+        ftp.close()
+
+
+def test_server_keeps_working_directory(ftp, monkeypatch):
+    """The server thread must not change the working directory of the tests."""
+    chdir = []
+    monkeypatch.setattr(os, "chdir", chdir.append)
+
+    ftp.cwd("/bin")
+
+    assert ftp.pwd() == "/bin"
+    assert chdir == []
+    with pytest.raises(error_perm):
+        ftp.cwd("/missing")
+
+
+def _sent(monkeypatch):
+    """Record the bytes sent by storbinary."""
+    sent = []
+    original = _NewFtpTls.storbinary
+
+    def storbinary(self, cmd, fp, blocksize=None, callback=None, rest=None):
+        def _callback(block):
+            sent.append(len(block))
+            callback(block)
+
+        return original(self, cmd, fp, blocksize, _callback, rest)
+
+    monkeypatch.setattr(_NewFtpTls, "storbinary", storbinary)
+    return sent
+
+
+def test_upload(ftp, ftp_root, tmp_path):
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+
+    _upload(source, "/bin", ftp)
+
+    assert (ftp_root / "bin" / "fab.deb").read_bytes() == CONTENT
+    assert not (ftp_root / "bin" / "fab.deb.part").exists()
+
+
+def test_upload_resume(ftp, ftp_root, tmp_path, monkeypatch):
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+    (ftp_root / "bin" / "fab.deb.part").write_bytes(CONTENT[:300000])
+    sent = _sent(monkeypatch)
+
+    _upload(source, "/bin", ftp)
+
+    assert (ftp_root / "bin" / "fab.deb").read_bytes() == CONTENT
+    assert sum(sent) == len(CONTENT) - 300000
+
+
+@pytest.mark.parametrize(
+    "part",
+    [
+        CONTENT + b"old",
+        b"x" * len(CONTENT),
+        # Smaller, but not the start of this file.
+        CONTENT[:100] + b"x" * 300000,
+        b"x" * 300000 + CONTENT[300000:300100],
+    ],
+)
+def test_upload_replaces(ftp, ftp_root, tmp_path, monkeypatch, part):
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+    (ftp_root / "bin" / "fab.deb.part").write_bytes(part)
+    sent = _sent(monkeypatch)
+
+    _upload(source, "/bin", ftp)
+
+    assert (ftp_root / "bin" / "fab.deb").read_bytes() == CONTENT
+    assert sum(sent) == len(CONTENT)
+
+
+def test_upload_does_not_resume_published_file(ftp, ftp_root, tmp_path, monkeypatch):
+    """A smaller file published before is not continued."""
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+    (ftp_root / "bin" / "fab.deb").write_bytes(b"old" * 1000)
+    sent = _sent(monkeypatch)
+
+    _upload(source, "/bin", ftp)
+
+    assert (ftp_root / "bin" / "fab.deb").read_bytes() == CONTENT
+    assert sum(sent) == len(CONTENT)
+
+
+def test_upload_damaged_keeps_published_file(ftp, ftp_root, tmp_path, monkeypatch):
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+    (ftp_root / "bin" / "fab.deb").write_bytes(b"old")
+
+    def _damaged(ftps, file, uploaded, resumed_at=0):
+        raise UploadError("damaged")
+
+    monkeypatch.setattr(ftp_module, "verify_remote", _damaged)
+
+    with pytest.raises(UploadError):
+        _upload(source, "/bin", ftp)
+
+    assert (ftp_root / "bin" / "fab.deb").read_bytes() == b"old"
+    assert not (ftp_root / "bin" / "fab.deb.part").exists()
+
+
+def test_upload_no_resume(ftp, ftp_root, tmp_path):
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+    (ftp_root / "bin" / "fab.deb.part").write_bytes(CONTENT[:1000])
+
+    _upload(source, "/bin", ftp, resume=False)
+
+    assert (ftp_root / "bin" / "fab.deb").read_bytes() == CONTENT
+
+
+def test_upload_digest(ftp, tmp_path):
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+
+    uploaded = _upload(source, "/bin", ftp)
+
+    assert uploaded == Uploaded(
+        "fab.deb", len(CONTENT), hashlib.sha256(CONTENT).hexdigest()
+    )
+
+
+def test_verify_remote_read_back(ftp, ftp_root, tmp_path):
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+    uploaded = _upload(source, "/bin", ftp)
+
+    # pyftpdlib can not calculate hashes.
+    assert verify_remote(ftp, source, uploaded) == "read-back"
+
+    # Damage the end of the remote file.
+    remote = ftp_root / "bin" / "fab.deb"
+    remote.write_bytes(CONTENT[:-1] + b"!")
+    with pytest.raises(UploadError, match="differ"):
+        verify_remote(ftp, source, uploaded)
+
+    remote.write_bytes(CONTENT[:-1])
+    with pytest.raises(UploadError, match="size"):
+        verify_remote(ftp, source, uploaded)
+
+
+def test_remote_sha256():
+    digest = "ab" * 32
+    ftps = Mock()
+    ftps.sendcmd.return_value = f"213 SHA-256 0-49 {digest} fab.deb"
+
+    assert _remote_sha256(ftps, "fab.deb") == digest
+    ftps.voidcmd.assert_called_with("OPTS HASH SHA-256")
+
+
+def test_remote_sha256_xsha256():
+    digest = "CD" * 32
+    ftps = Mock()
+    ftps.voidcmd.side_effect = error_perm("501 Unknown algorithm")
+    ftps.sendcmd.return_value = f"250 {digest}"
+
+    assert _remote_sha256(ftps, "fab.deb") == digest.lower()
+    ftps.sendcmd.assert_called_with("XSHA256 fab.deb")
+
+
+def test_remote_sha256_unsupported():
+    ftps = Mock()
+    ftps.sendcmd.side_effect = error_perm("500 Unknown command")
+
+    assert _remote_sha256(ftps, "fab.deb") is None
+
+
+@pytest.fixture
+def ftps_server(ftp_root, tmp_path):
+    pytest.importorskip("OpenSSL")
+    certfile = make_certificate(tmp_path)
+    with local_ftp_server(ftp_root, certfile) as (host, port):
+        yield partial(_ftps_connect, host, USER, PASSW, port=port)
+
+
+def test_upload_ftps(ftps_server, ftp_root, tmp_path):
+    source = tmp_path / "fab.deb"
+    source.write_bytes(CONTENT)
+    (ftp_root / "bin" / "fab.deb.part").write_bytes(CONTENT[:1000])
+
+    ftps = ftps_server()
+    _upload(source, "/bin", ftps)
+    ftps.quit()
+
+    assert (ftp_root / "bin" / "fab.deb").read_bytes() == CONTENT
+
+
+def test_data_connection_reuses_session(ftps_server):
+    ftps = ftps_server()
+
+    conn, _ = ftps.ntransfercmd("LIST")
+    assert conn.session_reused
+    while conn.recv(1024):
+        pass
+    conn.close()
+    ftps.voidresp()
+    ftps.quit()
+
+
+def _release(tmp_path, latest="fab.encrypt"):
+    version_file = tmp_path / "version.json"
+    version_file.write_text(json.dumps({"latest": latest, "app": "0.11"}))
+    artifacts = [Artifact(version_file, "/bin")]
+    for name in ("fab.deb", "fabtool-setup.exe", latest):
+        source = tmp_path / name
+        source.write_bytes(name.encode() * 1000)
+        artifacts.append(Artifact(source, "/bin"))
+    return artifacts
+
+
+def test_publish(ftps_server, ftp_root, tmp_path, monkeypatch):
+    uploaded = []
+    original = ftp_module._upload
+
+    def _upload_recorded(file, *args, **kwargs):
+        result = original(file, *args, **kwargs)
+        uploaded.append(file.name)
+        return result
+
+    monkeypatch.setattr(ftp_module, "_upload", _upload_recorded)
+    artifacts = _release(tmp_path)
+    local_version = (tmp_path / "version.json").read_text()
+
+    publish(artifacts, ftps_server, workers=2)
+
+    assert uploaded[-1].endswith("version.json")
+    for artifact in artifacts[1:]:
+        assert (ftp_root / "bin" / artifact.name).read_bytes() == (
+            artifact.file.read_bytes()
+        )
+    # The local version file is left as it is.
+    assert (tmp_path / "version.json").read_text() == local_version
+    version = json.loads((ftp_root / "bin" / "version.json").read_text())
+    release = (tmp_path / "fab.encrypt").read_bytes()
+    assert version["sha256"] == hashlib.sha256(release).hexdigest()
+    assert version["size"] == len(release)
+    assert version["chunks"] == [hashlib.sha256(release).hexdigest()]
+    assert version["app"] == "0.11"
+    assert "previous" not in version
+
+
+def test_publish_previous(ftps_server, ftp_root, tmp_path):
+    def _published(name):
+        folder = tmp_path / name
+        folder.mkdir(exist_ok=True)
+        publish(_release(folder, latest=name), ftps_server)
+        return Release.from_file(ftp_root / "bin" / "version.json")
+
+    assert _published("fab-1.encrypt").previous is None
+    assert _published("fab-2.encrypt").previous == "fab-1.encrypt"
+    # Published again, it still points at the release before it.
+    assert _published("fab-2.encrypt").previous == "fab-1.encrypt"
+
+
+def test_publish_failed(ftps_server, ftp_root, tmp_path, monkeypatch):
+    original = ftp_module._upload
+
+    def _upload_failing(file, *args, **kwargs):
+        if file.name == "fab.deb":
+            raise ConnectionResetError("connection lost")
+        original(file, *args, **kwargs)
+
+    monkeypatch.setattr(ftp_module, "_upload", _upload_failing)
+
+    with pytest.raises(ConnectionResetError):
+        publish(_release(tmp_path), ftps_server, workers=2)
+
+    # The release is not announced.
+    assert not (ftp_root / "bin" / "version.json").exists()
+    assert (ftp_root / "bin" / "fabtool-setup.exe").exists()
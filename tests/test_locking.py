@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from fab_deploy.exceptions import LockedError
+from fab_deploy.locking import FileLock, installation_lock, lock_installation
+from tests.common import HERE
+
+ROOT = HERE.parent
+
+
+def test_lock_exclusive(tmp_path):
+    first = FileLock(tmp_path / "fab.lock")
+    second = FileLock(tmp_path / "fab.lock")
+
+    assert first.acquire()
+    assert not second.acquire()
+
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_lock_other_process(tmp_path):
+    lock_file = tmp_path / "fab.lock"
+    code = (
+        "import sys; from pathlib import Path; "
+        "from fab_deploy.locking import FileLock; "
+        f"sys.exit(0 if FileLock(Path({str(lock_file)!r})).acquire() else 1)"
+    )
+
+    # Find fab_deploy whatever the working directory of the tests is.
+    path = os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))
+    env = dict(os.environ, PYTHONPATH=path)
+
+    def _acquire():
+        return subprocess.run(
+            [sys.executable, "-c", code], cwd=str(ROOT), env=env
+        ).returncode
+
+    with FileLock(lock_file):
+        assert _acquire() == 1
+    assert _acquire() == 0
+
+
+def test_lock_installation(tmp_path):
+    folder = tmp_path / "fabricator"
+
+    with lock_installation(folder):
+        with pytest.raises(LockedError):
+            lock_installation(folder)
+
+    # Next to the folder, as the folder itself is renamed when installing.
+    assert installation_lock(folder).path.parent == tmp_path
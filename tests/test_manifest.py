@@ -0,0 +1,53 @@
+import pytest
+
+from fab_deploy.const import KEY_LINUX, KEY_WINDOWS
+from fab_deploy.extract import extract_archive
+from fab_deploy.manifest import (
+    MANIFEST_NAME,
+    build_manifest,
+    read_manifest,
+)
+from fab_deploy.pack import create_archive
+from tests.common import HERE
+
+ARCHIVE_FILE = HERE.joinpath("test_files", "archive.ease.tar.bz2")
+
+
+@pytest.fixture
+def fabricator_tree(tmp_path):
+    tree = tmp_path / "tree"
+    for folder in ("bin", "resources/linux/shortcuts", "resources/win10", "docs"):
+        tree.joinpath(folder).mkdir(parents=True)
+        tree.joinpath(folder, "file.txt").write_text(folder)
+    return tree
+
+
+def test_build_manifest(fabricator_tree):
+    manifest = build_manifest(fabricator_tree, {"docs": "docs"})
+
+    assert manifest.component_of("bin/file.txt") is None
+    linux = manifest.component_of("./resources/linux/shortcuts/file.txt")
+    assert linux.name == "linux"
+    assert manifest.component_of("resources/win10").platform == KEY_WINDOWS
+    assert manifest.component_of("docs/file.txt").name == "docs"
+    assert manifest.component_of("documents/file.txt") is None
+
+
+def test_selective_extract(fabricator_tree, tmp_path):
+    archive = tmp_path / "archive.tar.bz2"
+    manifest = build_manifest(fabricator_tree, {"docs": "docs"})
+    create_archive(fabricator_tree, archive, manifest)
+    manifest = read_manifest(archive)
+    output = tmp_path / "output"
+
+    extract_archive(archive, output, manifest.member_filter(KEY_LINUX, selected=[]))
+
+    assert output.joinpath(MANIFEST_NAME).exists()
+    assert output.joinpath("bin", "file.txt").exists()
+    assert output.joinpath("resources", "linux", "shortcuts", "file.txt").exists()
+    assert not output.joinpath("resources", "win10").exists()
+    assert not output.joinpath("docs").exists()
+
+
+def test_read_manifest_legacy_archive():
+    assert read_manifest(ARCHIVE_FILE) is None
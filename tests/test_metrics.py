@@ -0,0 +1,87 @@
+import json
+
+from fab_deploy.metrics import RunResult, render, write_metrics
+from fab_deploy.release import INSTALLED_VERSION_FILE
+from fab_deploy.timing import Timings
+
+
+def _timings():
+    timings = Timings()
+    with timings.span("download", bytes=1000) as span:
+        pass
+    span.duration = 2.0
+    with timings.span("clean") as span:
+        pass
+    span.duration = 0.5
+    return timings
+
+
+def _samples(text):
+    return dict(
+        line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#")
+    )
+
+
+def test_render():
+    result = RunResult()
+    result.succeeded()
+
+    text = render(result, _timings(), {"app": "0.11", "latest": "fab.bin"}, now=10)
+
+    samples = _samples(text)
+    assert samples["fab_run_timestamp_seconds"] == "10.0"
+    assert samples["fab_run_success"] == "1.0"
+    assert samples['fab_phase_duration_seconds{phase="download"}'] == "2.0"
+    assert samples['fab_phase_duration_seconds{phase="clean"}'] == "0.5"
+    assert samples['fab_phase_throughput_bytes_per_second{phase="download"}'] == "500.0"
+    assert samples["fab_downloaded_bytes"] == "1000.0"
+    assert samples['fab_installed_info{app="0.11",latest="fab.bin"}'] == "1.0"
+    # Every metric is described once.
+    assert text.count("# TYPE fab_phase_duration_seconds gauge") == 1
+
+
+def test_render_release_fields():
+    version = {
+        "latest": "fab-2.bin",
+        "previous": "fab-1.bin",
+        "size": 2048,
+        "sha256": "a" * 64,
+        "chunk_size": 1024,
+    }
+
+    samples = _samples(render(RunResult(), Timings(), version))
+
+    assert samples['fab_installed_info{latest="fab-2.bin",previous="fab-1.bin"}'] == (
+        "1.0"
+    )
+    assert samples["fab_installed_size_bytes"] == "2048.0"
+
+
+def test_render_failure():
+    result = RunResult()
+    result.failed("DownloadError", 4)
+
+    samples = _samples(render(result, Timings(), now=10))
+
+    assert samples["fab_run_success"] == "0.0"
+    assert samples["fab_run_exit_code"] == "4.0"
+    assert samples['fab_run_error{error="DownloadError"}'] == "1.0"
+    assert samples["fab_downloaded_bytes"] == "0.0"
+
+
+def test_write_metrics_not_configured(tmp_path):
+    result = RunResult(installation_folder=tmp_path)
+    result.succeeded()
+
+    assert not write_metrics(result, Timings())
+
+
+def test_write_metrics_installed_version(tmp_path):
+    with open(tmp_path / INSTALLED_VERSION_FILE, "w") as fl:
+        json.dump({"app": "0.11"}, fl)
+    result = RunResult(metrics_file=tmp_path / "fab.prom", installation_folder=tmp_path)
+    result.succeeded()
+
+    assert write_metrics(result, Timings())
+
+    assert 'fab_installed_info{app="0.11"} 1.0' in result.metrics_file.read_text()
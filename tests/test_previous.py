@@ -0,0 +1,103 @@
+import pytest
+
+from fab_deploy.previous import (
+    clear_rolled_back,
+    mark_rolled_back,
+    previous_folder,
+    retire,
+    roll_back,
+    rolled_back_from,
+)
+from fab_deploy.trash import find_trash
+
+
+def _install(folder, content):
+    folder.mkdir(parents=True)
+    (folder / "release.txt").write_text(content)
+    return folder
+
+
+def _content(folder):
+    return (folder / "release.txt").read_text()
+
+
+def test_retire(tmp_path):
+    folder = _install(tmp_path / "fabricator", "1")
+
+    previous = retire(folder)
+
+    assert previous == previous_folder(folder)
+    assert not folder.exists()
+    assert _content(previous) == "1"
+
+
+def test_retire_keeps_one(tmp_path):
+    folder = _install(tmp_path / "fabricator", "1")
+    retire(folder)
+    _install(folder, "2")
+
+    previous = retire(folder)
+
+    assert _content(previous) == "2"
+    assert len(find_trash(previous)) <= 1
+
+
+def test_retire_repeatedly(tmp_path):
+    folder = tmp_path / "fabricator"
+    for content in "123":
+        _install(folder, content)
+        retire(folder)
+
+    assert _content(previous_folder(folder)) == "3"
+
+
+def test_retire_nothing_installed(tmp_path):
+    assert retire(tmp_path / "fabricator") is None
+
+
+def test_roll_back(tmp_path):
+    folder = _install(tmp_path / "fabricator", "1")
+    retire(folder)
+    _install(folder, "2")
+
+    previous = roll_back(folder)
+
+    assert _content(folder) == "1"
+    assert _content(previous) == "2"
+
+    roll_back(folder)
+
+    assert _content(folder) == "2"
+
+
+def test_roll_back_nothing_installed(tmp_path):
+    folder = _install(tmp_path / "fabricator", "1")
+    retire(folder)
+
+    assert roll_back(folder) is None
+    assert _content(folder) == "1"
+    assert not previous_folder(folder).exists()
+
+
+def test_roll_back_no_previous(tmp_path):
+    folder = _install(tmp_path / "fabricator", "1")
+
+    with pytest.raises(FileNotFoundError):
+        roll_back(folder)
+
+    assert _content(folder) == "1"
+
+
+def test_rolled_back_marker(tmp_path):
+    folder = tmp_path / "fabricator"
+    assert rolled_back_from(folder) is None
+
+    mark_rolled_back(folder, {"latest": "fab-2.fab", "sha256": "a" * 64, "app": "1"})
+
+    assert rolled_back_from(folder) == {"latest": "fab-2.fab", "sha256": "a" * 64}
+    # Next to the installation, as the folder itself is swapped.
+    assert not folder.exists()
+
+    clear_rolled_back(folder)
+    assert rolled_back_from(folder) is None
+    clear_rolled_back(folder)
@@ -0,0 +1,83 @@
+import os
+import time
+from types import SimpleNamespace
+
+import psutil
+import pytest
+
+from fab_deploy.process import PID_FILE, find_running
+
+NAME = "fabricator"
+
+
+def _processes(count, installation_folder, running=False):
+    processes = [
+        SimpleNamespace(pid=idx, info={"name": f"proc{idx}", "exe": f"/usr/bin/p{idx}"})
+        for idx in range(count)
+    ]
+    # A process with the same name, running from another folder.
+    processes.append(
+        SimpleNamespace(pid=count, info={"name": NAME, "exe": f"/opt/{NAME}/{NAME}"})
+    )
+    if running:
+        exe = str(installation_folder / NAME)
+        processes.append(
+            SimpleNamespace(pid=count + 1, info={"name": NAME, "exe": exe})
+        )
+    return processes
+
+
+@pytest.fixture
+def installation_folder(tmp_path):
+    folder = tmp_path / NAME
+    folder.mkdir()
+    return folder
+
+
+@pytest.mark.parametrize("running", [True, False])
+def test_find_running(monkeypatch, installation_folder, running):
+    processes = _processes(10, installation_folder, running)
+    monkeypatch.setattr(psutil, "process_iter", lambda **kwargs: iter(processes))
+
+    pid = find_running(installation_folder, NAME)
+
+    assert pid == (11 if running else None)
+
+
+def test_find_running_access_denied(monkeypatch, installation_folder):
+    processes = [SimpleNamespace(pid=1, info={"name": NAME, "exe": None})]
+    monkeypatch.setattr(psutil, "process_iter", lambda **kwargs: iter(processes))
+
+    assert find_running(installation_folder, NAME) == 1
+
+
+def test_find_running_scales(monkeypatch, installation_folder):
+    processes = _processes(5000, installation_folder)
+    monkeypatch.setattr(psutil, "process_iter", lambda **kwargs: iter(processes))
+
+    start = time.perf_counter()
+    assert find_running(installation_folder, NAME) is None
+    assert time.perf_counter() - start < 1
+
+
+def test_pid_file(monkeypatch, installation_folder):
+    def _fail(**kwargs):
+        raise AssertionError("The process table should not be scanned")
+
+    monkeypatch.setattr(psutil, "process_iter", _fail)
+    monkeypatch.setattr("fab_deploy.process._is_fabricator", lambda *args: True)
+
+    installation_folder.joinpath(PID_FILE).write_text(str(os.getpid()))
+    assert find_running(installation_folder, NAME) == os.getpid()
+
+
+def test_pid_file_reused(monkeypatch, installation_folder):
+    processes = _processes(10, installation_folder, running=True)
+    monkeypatch.setattr(psutil, "process_iter", lambda **kwargs: iter(processes))
+
+    # The pid of this process, which does not run from the installation folder.
+    installation_folder.joinpath(PID_FILE).write_text(str(os.getpid()))
+    assert find_running(installation_folder, NAME) == 11
+
+    processes = _processes(10, installation_folder)
+    assert find_running(installation_folder, NAME) is None
@@ -0,0 +1,51 @@
+from fab_deploy.progress import ClickProgressBar, Progress
+
+
+def test_rate_limited():
+    events = []
+    with Progress(
+        "download", total=1000, consumers=[events.append], interval=60
+    ) as bar:
+        for _ in range(100):
+            bar.update(10)
+
+    # Only the start and the finish are published within the interval.
+    assert [(event.done, event.finished) for event in events] == [
+        (0, False),
+        (1000, True),
+    ]
+
+
+def test_every_update_published():
+    events = []
+    with Progress("extract", consumers=[events.append], interval=0) as bar:
+        bar.update(5)
+        bar.update(5)
+
+    assert [event.done for event in events] == [0, 5, 10, 10]
+    assert events[-1].total is None
+
+
+def test_click_progress_bar(capsys):
+    consumer = ClickProgressBar()
+    with Progress("upload", total=100, consumers=[consumer], interval=0) as bar:
+        bar.update(100)
+    # Without a total there is nothing to draw.
+    with Progress("extract", consumers=[consumer], interval=0) as bar:
+        bar.update(100)
+
+    assert "Upload" in capsys.readouterr().out
+
+
+def test_click_progress_bar_concurrent(capsys):
+    consumer = ClickProgressBar()
+    first = Progress("upload a", total=100, consumers=[consumer], interval=0)
+    second = Progress("upload b", total=100, consumers=[consumer], interval=0)
+
+    with first, second:
+        first.update(100)
+        second.update(50)
+
+    # One bar for both, closed when the last one finished.
+    assert "Upload a +1 (0.00MB)" in capsys.readouterr().out
+    assert consumer._bar is None
@@ -0,0 +1,95 @@
+import hashlib
+import json
+
+import pytest
+
+from fab_deploy.exceptions import DownloadError
+from fab_deploy.release import (
+    RELEASE_SCHEMA,
+    Release,
+    ReleaseVerifier,
+    build_release,
+    check_supported,
+    read_release,
+)
+from tests.common import HERE
+
+VERSION_FILE = HERE.joinpath("test_files", "version.json")
+FAB_FILE = HERE.joinpath("test_files", "fabricator.encrypt")
+
+
+def test_read_old_version_file():
+    release = Release.from_file(VERSION_FILE)
+
+    assert release.latest == "win10-fabricator-app0.11-ease1.0.fab"
+    assert release.schema == 1
+    assert release.sha256 is None
+    assert release.extra == {"app": "0.11", "flow": "1.0"}
+
+
+def test_build_release(tmp_path):
+    release = build_release(FAB_FILE, previous="fab-1.fab", chunk_size=1024)
+    content = FAB_FILE.read_bytes()
+
+    assert release.schema == RELEASE_SCHEMA
+    assert release.size == len(content)
+    assert release.sha256 == hashlib.sha256(content).hexdigest()
+    assert release.container == "aescrypt-2"
+    assert release.codec == "tar.bz2"
+    assert release.chunks[0] == hashlib.sha256(content[:1024]).hexdigest()
+
+    # Written and read back, nothing is lost.
+    version_file = tmp_path / "version.json"
+    release.save(version_file)
+    assert Release.from_file(version_file) == release
+
+
+@pytest.mark.parametrize(
+    "dct",
+    [
+        {},
+        {"latest": "fab.fab", "size": -1},
+        {"latest": "fab.fab", "sha256": "not a digest"},
+        {"latest": "fab.fab", "size": 10, "chunk_size": 4, "chunks": ["0" * 64]},
+    ],
+)
+def test_invalid_release(tmp_path, dct):
+    version_file = tmp_path / "version.json"
+    version_file.write_text(json.dumps(dct))
+
+    with pytest.raises(DownloadError):
+        read_release(version_file)
+
+
+def test_check_supported():
+    check_supported(Release(latest="fab.fab", container="aescrypt-2", codec="tar.bz2"))
+
+    with pytest.raises(DownloadError):
+        check_supported(Release(latest="fab.fab", container="aescrypt-3"))
+    with pytest.raises(DownloadError):
+        check_supported(Release(latest="fab.fab", codec="tar.zst"))
+
+
+def test_verifier(tmp_path):
+    content = bytes(range(256)) * 40
+    release_file = tmp_path / "fab.fab"
+    release_file.write_bytes(content)
+    release = build_release(release_file, chunk_size=1000)
+
+    verifier = ReleaseVerifier(release)
+    for idx in range(0, len(content), 333):
+        verifier.update(content[idx : idx + 333])
+    verifier.finish()
+
+    # The damaged chunk is found before the rest arrives.
+    damaged = bytearray(content)
+    damaged[1500] ^= 0xFF
+    verifier = ReleaseVerifier(release)
+    verifier.update(bytes(damaged[:1000]))
+    with pytest.raises(ValueError, match="chunk 1"):
+        verifier.update(bytes(damaged[1000:2000]))
+
+    verifier = ReleaseVerifier(release)
+    verifier.update(content[:-1])
+    with pytest.raises(ValueError):
+        verifier.finish()
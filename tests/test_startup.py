@@ -0,0 +1,21 @@
+"""Guard the start-up time of the fab command."""
+
+from tools.bench import _import_times
+
+# Modules which are slow to import and only needed by some commands.
+HEAVY_MODULES = {"psutil", "requests", "cryptography", "pydantic"}
+
+# Cumulative import time of fab_deploy.cli in microseconds.
+IMPORT_BUDGET = 250_000
+
+
+def test_no_heavy_imports():
+    imported = {name.split(".")[0] for name in _import_times("fab_deploy.cli")}
+
+    assert not imported & HEAVY_MODULES
+
+
+def test_import_budget():
+    best = min(_import_times("fab_deploy.cli")["fab_deploy.cli"] for _ in range(3))
+
+    assert best < IMPORT_BUDGET
@@ -0,0 +1,218 @@
+import hashlib
+import io
+from types import SimpleNamespace
+
+import pytest
+import responses
+from urllib3.exceptions import ProtocolError
+
+from fab_deploy.download import _download_file, download_version_file
+from fab_deploy.exceptions import DownloadError
+from fab_deploy.release import Release
+from fab_deploy.transfer import AdaptiveBlockSize, copy_stream, preallocate
+
+
+def test_block_size_grows_when_fast():
+    block_size = AdaptiveBlockSize(minimum=4, maximum=32, target=1.0)
+
+    for _ in range(5):
+        block_size.record(0.1)
+
+    assert block_size.size == 32
+
+
+def test_block_size_shrinks_when_slow():
+    block_size = AdaptiveBlockSize(minimum=4, maximum=32, target=1.0)
+    block_size.size = 32
+
+    block_size.record(5.0)
+    assert block_size.size == 16
+
+    # Within the target range nothing changes.
+    block_size.record(1.0)
+    assert block_size.size == 16
+
+    for _ in range(5):
+        block_size.record(5.0)
+    assert block_size.size == 4
+
+
+def test_copy_stream():
+    content = bytes(range(256)) * 1000
+    source = io.BytesIO(content)
+    target = io.BytesIO()
+    blocks = []
+
+    copied = copy_stream(
+        source.readinto,
+        target.write,
+        lambda block: blocks.append(len(block)),
+        AdaptiveBlockSize(minimum=1000, maximum=8000, target=10),
+    )
+
+    assert copied == len(content)
+    assert target.getvalue() == content
+    assert sum(blocks) == len(content)
+    # Fast iterations double the block size up to the maximum.
+    assert blocks[:4] == [1000, 2000, 4000, 8000]
+
+
+def test_copy_stream_fixed():
+    source = io.BytesIO(b"x" * 10)
+    target = io.BytesIO()
+    blocks = []
+
+    copy_stream(
+        source.readinto,
+        target.write,
+        lambda block: blocks.append(len(block)),
+        AdaptiveBlockSize.fixed(4),
+    )
+
+    assert blocks == [4, 4, 2]
+
+
+@responses.activate
+def test_download_file(tmp_path):
+    content = b"fabricator" * 100000
+    responses.add(
+        responses.GET,
+        "http://test/fab.bin",
+        body=content,
+        headers={"content-length": str(len(content))},
+    )
+    dest = tmp_path / "fab.bin"
+
+    _download_file("http://test/fab.bin", dest)
+
+    assert dest.read_bytes() == content
+
+
+@responses.activate
+def test_download_file_not_encoded(tmp_path):
+    content = b"fabricator" * 100000
+    responses.add(
+        responses.GET,
+        "http://test/fab.bin",
+        body=content,
+        headers={"content-length": str(len(content))},
+    )
+
+    _download_file("http://test/fab.bin", tmp_path / "fab.bin")
+
+    assert responses.calls[0].request.headers["Accept-Encoding"] == "identity"
+
+
+@responses.activate
+def test_download_file_digest(tmp_path):
+    content = b"fabricator" * 100000
+    responses.add(
+        responses.GET,
+        "http://test/fab.bin",
+        body=content,
+        headers={"content-length": str(len(content))},
+    )
+    dest = tmp_path / "fab.bin"
+
+    _download_file(
+        "http://test/fab.bin",
+        dest,
+        release=Release(latest="fab.bin", sha256=hashlib.sha256(content).hexdigest()),
+    )
+    assert dest.read_bytes() == content
+
+    with pytest.raises(DownloadError):
+        _download_file(
+            "http://test/fab.bin",
+            dest,
+            force_download=True,
+            release=Release(latest="fab.bin", sha256="0" * 64),
+        )
+    assert not dest.exists()
+
+
+@responses.activate
+def test_download_file_size_mismatch(tmp_path):
+    content = b"fabricator" * 1000
+    responses.add(
+        responses.GET,
+        "http://test/fab.bin",
+        body=content,
+        headers={"content-length": str(len(content))},
+    )
+    dest = tmp_path / "fab.bin"
+
+    # Refused before anything is written.
+    with pytest.raises(DownloadError):
+        _download_file(
+            "http://test/fab.bin",
+            dest,
+            release=Release(latest="fab.bin", size=len(content) + 1),
+        )
+    assert not dest.exists()
+
+
+class _Http:
+    """Answers every request with the given raw stream and headers."""
+
+    def __init__(self, raw, headers=None):
+        self.raw = raw
+        self.headers = headers or {}
+
+    def get(self, url, **kwargs):
+        return SimpleNamespace(status_code=200, headers=self.headers, raw=self.raw)
+
+
+def test_download_file_without_content_length(tmp_path):
+    content = b"fabricator" * 1000
+    dest = tmp_path / "fab.bin"
+    release = Release(
+        latest="fab.bin", size=len(content), sha256=hashlib.sha256(content).hexdigest()
+    )
+
+    _download_file(
+        "http://test/fab.bin", dest, release=release, http=_Http(io.BytesIO(content))
+    )
+
+    assert dest.read_bytes() == content
+
+
+def test_download_file_broken_off(tmp_path):
+    class _Raw:
+        def readinto(self, buffer):
+            raise ProtocolError("Connection broken")
+
+    dest = tmp_path / "fab.bin"
+
+    with pytest.raises(DownloadError, match="Connection broken"):
+        _download_file(
+            "http://test/fab.bin", dest, http=_Http(_Raw(), {"content-length": "10"})
+        )
+    assert not dest.exists()
+
+
+@responses.activate
+def test_download_version_file_cached(tmp_path):
+    content = b'{"latest": "fab-1.fab"}'
+    responses.add(
+        responses.GET,
+        "http://test/version.json",
+        body=content,
+        headers={"ETag": '"v1"'},
+    )
+    responses.add(responses.GET, "http://test/version.json", status=304)
+    cache = {}
+
+    download_version_file("http://test/", tmp_path / "first.json", cache=cache)
+    download_version_file("http://test/", tmp_path / "second.json", cache=cache)
+
+    assert responses.calls[1].request.headers["If-None-Match"] == '"v1"'
+    assert (tmp_path / "second.json").read_bytes() == content
+
+
+def test_preallocate(tmp_path):
+    with open(tmp_path / "fab.bin", "wb") as fl:
+        preallocate(fl, 100000)
+        fl.write(b"fab")
+
+    assert (tmp_path / "fab.bin").stat().st_size == 100000
@@ -0,0 +1,52 @@
+from fab_deploy.trash import find_trash, move_to_trash, purge, purge_in_background
+
+
+def _make_tree(folder):
+    for sub in ("a", "b", "c/d"):
+        (folder / sub).mkdir(parents=True)
+        (folder / sub / "file.txt").write_text("content")
+    return folder
+
+
+def test_move_to_trash(tmp_path):
+    folder = _make_tree(tmp_path / "fabricator")
+
+    trash = move_to_trash(folder)
+
+    assert not folder.exists()
+    assert trash.exists()
+    assert find_trash(folder) == [trash]
+
+
+def test_move_to_trash_same_second(tmp_path):
+    folder = tmp_path / "fabricator"
+
+    trash = [move_to_trash(_make_tree(folder)) for _ in range(3)]
+
+    assert len(set(trash)) == 3
+    assert find_trash(folder) == sorted(trash)
+
+
+def test_move_to_trash_missing_folder(tmp_path):
+    assert move_to_trash(tmp_path / "fabricator") is None
+
+
+def test_purge(tmp_path):
+    folder = tmp_path / "fabricator"
+    first = move_to_trash(_make_tree(folder))
+    (first.parent / "other").mkdir()
+
+    assert purge(find_trash(folder)) == []
+    assert find_trash(folder) == []
+    assert (first.parent / "other").exists()
+
+
+def test_purge_in_background(tmp_path):
+    folder = tmp_path / "fabricator"
+    move_to_trash(_make_tree(folder))
+
+    thread = purge_in_background(folder)
+    thread.join(timeout=10)
+
+    assert find_trash(folder) == []
+    assert purge_in_background(folder) is None
@@ -0,0 +1,71 @@
+import pytest
+
+from fab_deploy import hashing
+from fab_deploy.const import KEY_LINUX, KEY_WINDOWS
+from fab_deploy.extract import extract_archive
+from fab_deploy.manifest import build_manifest
+from fab_deploy.pack import create_archive
+from fab_deploy.verify import verify_tree
+
+
+@pytest.fixture
+def installed_tree(tmp_path):
+    tree = tmp_path / "tree"
+    for folder in ("bin", "resources/linux", "resources/win10"):
+        tree.joinpath(folder).mkdir(parents=True)
+        tree.joinpath(folder, "file.txt").write_text(folder)
+
+    archive = tmp_path / "archive.tar.bz2"
+    manifest = build_manifest(tree)
+    create_archive(tree, archive, manifest)
+
+    output = tmp_path / "output"
+    extract_archive(archive, output, manifest.member_filter(KEY_LINUX))
+    return output
+
+
+def test_verify_intact(installed_tree):
+    result = verify_tree(installed_tree, KEY_LINUX)
+
+    assert result.ok
+    assert result.checked == 2
+
+
+def test_verify_damaged(installed_tree):
+    installed_tree.joinpath("bin", "file.txt").write_text("nib")
+    installed_tree.joinpath("resources", "linux", "file.txt").unlink()
+
+    result = verify_tree(installed_tree, KEY_LINUX)
+
+    assert result.changed == ["bin/file.txt"]
+    assert result.missing == ["resources/linux/file.txt"]
+    # Same size, so a quick check does not notice the change.
+    assert verify_tree(installed_tree, KEY_LINUX, quick=True).changed == []
+
+
+def test_verify_unreadable(installed_tree, monkeypatch):
+    original = hashing.file_sha256
+
+    def _file_sha256(path, *args):
+        if path.name == "file.txt" and path.parent.name == "bin":
+            raise PermissionError(13, "Permission denied", str(path))
+        return original(path, *args)
+
+    monkeypatch.setattr(hashing, "file_sha256", _file_sha256)
+
+    result = verify_tree(installed_tree, KEY_LINUX)
+
+    assert result.unreadable == ["bin/file.txt"]
+    assert result.missing == []
+    assert not result.damaged
+    assert not result.ok
+
+
+def test_verify_other_platform(installed_tree):
+    result = verify_tree(installed_tree, KEY_WINDOWS)
+
+    assert result.missing == ["resources/win10/file.txt"]
+
+
+def test_verify_without_manifest(tmp_path):
+    assert verify_tree(tmp_path, KEY_LINUX) is None
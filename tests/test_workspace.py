@@ -0,0 +1,43 @@
+import os
+import time
+
+from fab_deploy.workspace import Workspace, remove_stale_workspaces
+
+
+def _age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(str(path), (stamp, stamp))
+
+
+def test_workspaces_separate(tmp_path):
+    with Workspace(tmp_path) as first, Workspace(tmp_path) as second:
+        assert first != second
+        assert first.parent == second.parent == tmp_path
+
+    assert not first.exists()
+    assert not second.exists()
+
+
+def test_remove_stale_workspaces(tmp_path):
+    with Workspace(tmp_path) as active:
+        _age(active, 3600)
+        stale = tmp_path / "run-dead"
+        stale.mkdir()
+        _age(stale, 3600)
+        young = tmp_path / "run-young"
+        young.mkdir()
+
+        removed = remove_stale_workspaces(tmp_path)
+
+        assert removed == [stale]
+        assert active.exists()
+        assert young.exists()
+
+
+def test_workspace_removes_stale(tmp_path):
+    stale = tmp_path / "run-dead"
+    stale.mkdir()
+    _age(stale, 3600)
+
+    with Workspace(tmp_path):
+        assert not stale.exists()
@@ -0,0 +1,414 @@
+"""Benchmarks for the install pipeline."""
+
+import functools
+import http.server
+import io
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+
+import click
+
+from fab_deploy.extract import extract_archive
+from fab_deploy.transfer import AdaptiveBlockSize, copy_stream
+
+_LOGGER = logging.getLogger(__name__)
+
+CLICK_INFO_COLOR = "bright_yellow"
+CLICK_OK_COLOR = "green"
+
+# The folder fab_deploy is imported from.
+ROOT = Path(__file__).parent.parent
+
+
+def _timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _make_archive(archive: Path, count: int, size: int):
+    content = b"x" * size
+    with tarfile.open(str(archive), "w:bz2") as tar:
+        for idx in range(count):
+            info = tarfile.TarInfo(f"folder{idx % 50}/file{idx}.bin")
+            info.size = size
+            tar.addfile(info, io.BytesIO(content))
+
+
+@click.command()
+@click.option("--count", default=5000, help="Number of files in the archive.")
+@click.option("--size", default=4096, help="Size of each file in bytes.")
+@click.option("--rounds", default=3, help="Number of rounds per engine.")
+@click.option(
+    "--output",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Folder to extract into. Use a folder on the disk fabricator is "
+    "installed on, as antivirus hooks are a large part of what is measured.",
+)
+def extract(count, size, rounds, output):
+    """Compare shutil.unpack_archive with the threaded extract engine."""
+    with tempfile.TemporaryDirectory(dir=output) as tmp:
+        tmp = Path(tmp)
+        archive = tmp / "bench.tar.bz2"
+        click.secho(f"Creating archive with {count} files", fg=CLICK_INFO_COLOR)
+        _make_archive(archive, count, size)
+
+        engines = {
+            "shutil.unpack_archive": lambda out: shutil.unpack_archive(
+                str(archive), str(out), "bztar"
+            ),
+            "extract_archive": lambda out: extract_archive(archive, out),
+        }
+        for name, engine in engines.items():
+            timings = []
+            for idx in range(rounds):
+                output = tmp / f"out-{idx}"
+                timings.append(_timed(engine, output))
+                shutil.rmtree(output)
+            click.secho(
+                f"{name:<24} best {min(timings):.3f}s  "
+                f"mean {sum(timings) / len(timings):.3f}s",
+                fg=CLICK_OK_COLOR,
+            )
+
+
+def _import_times(module: str) -> dict:
+    """Return {module: cumulative import time} of a fresh interpreter."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT),
+        capture_output=True,
+        encoding="utf8",
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@click.command()
+@click.option("--rounds", default=5, help="Number of runs.")
+@click.option("--top", default=15, help="Number of slowest imports shown.")
+def startup(rounds, top):
+    """Measure start-up time of fab --help and the slowest imports."""
+    timings = [
+        _timed(
+            subprocess.run,
+            [sys.executable, "-m", "fab_deploy", "--help"],
+            capture_output=True,
+            check=True,
+        )
+        for _ in range(rounds)
+    ]
+    click.secho(
+        f"fab --help  best {min(timings):.3f}s  "
+        f"mean {sum(timings) / len(timings):.3f}s",
+        fg=CLICK_OK_COLOR,
+    )
+
+    times = _import_times("fab_deploy.cli")
+    for name, cumulative in sorted(times.items(), key=lambda item: -item[1])[:top]:
+        click.secho(f"{cumulative / 1000:8.1f}ms  {name}", fg=CLICK_INFO_COLOR)
+
+
+@click.command()
+@click.option("--rounds", default=1000, help="Number of loads.")
+def settings(rounds):
+    """Measure loading the settings file."""
+    from fab_deploy.const import _Settings, load_settings, save_settings
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings_file = Path(tmp) / "fab-deploy.json"
+        save_settings(_Settings(key="a" * 64), settings_file)
+
+        elapsed = _timed(lambda: [load_settings(settings_file) for _ in range(rounds)])
+        click.secho(
+            f"load_settings  {elapsed / rounds * 1e6:.1f}us per load", fg=CLICK_OK_COLOR
+        )
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve_folder(folder: Path) -> http.server.ThreadingHTTPServer:
+    handler = functools.partial(_QuietHandler, directory=str(folder))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _socket_sink() -> socket.socket:
+    """Listen on a local port and discard everything received."""
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def _drain():
+        while True:
+            conn, _ = listener.accept()
+            with conn:
+                while conn.recv(1024 * 1024):
+                    pass
+
+    threading.Thread(target=_drain, daemon=True).start()
+    return listener
+
+
+def _download_fixed(url: str, dest: Path, chunk_size: int):
+    """The download loop as it was, with a fixed chunk size."""
+    import requests
+
+    with requests.get(url, stream=True) as response, open(str(dest), "wb") as fl:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            fl.write(chunk)
+
+
+def _download_adaptive(url: str, dest: Path):
+    import requests
+
+    with requests.get(url, stream=True) as response, open(str(dest), "wb") as fl:
+        copy_stream(response.raw.readinto, fl.write)
+
+
+def _upload(address, source: Path, block_size):
+    with socket.create_connection(address) as conn, open(str(source), "rb") as fl:
+        copy_stream(fl.readinto, conn.sendall, None, block_size)
+
+
+@click.command()
+@click.option("--size", default=256, help="Size of the payload in MB.")
+@click.option("--chunk-size", default=1024, help="The fixed chunk size compared.")
+def transfer(size, chunk_size):
+    """Compare fixed and adaptive block sizes for downloading and uploading."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        payload = tmp / "payload.bin"
+        with open(str(payload), "wb") as fl:
+            block = b"x" * 1024 * 1024
+            for _ in range(size):
+                fl.write(block)
+
+        server = _serve_folder(tmp)
+        url = f"http://127.0.0.1:{server.server_address[1]}/payload.bin"
+        sink = _socket_sink()
+        address = sink.getsockname()
+
+        results = {
+            f"download fixed {chunk_size}": _timed(
+                _download_fixed, url, tmp / "fixed.bin", chunk_size
+            ),
+            "download adaptive": _timed(_download_adaptive, url, tmp / "adaptive.bin"),
+            f"upload fixed {chunk_size}": _timed(
+                _upload, address, payload, AdaptiveBlockSize.fixed(chunk_size)
+            ),
+            "upload adaptive": _timed(_upload, address, payload, None),
+        }
+        server.shutdown()
+        sink.close()
+
+        for name, elapsed in results.items():
+            click.secho(
+                f"{name:<24} {elapsed:.3f}s  {size / elapsed:8.1f}MB/s",
+                fg=CLICK_OK_COLOR,
+            )
+
+
+@click.command()
+@click.option("--size", default=64, help="Size of the payload in MB.")
+@click.option("--block-size", default=1024, help="The fixed block size compared.")
+@click.option("--tls/--no-tls", default=True, help="Upload over FTPS.")
+def ftp(size, block_size, tls):
+    """Compare fixed and adaptive blocks uploading to a local FTP(S) server."""
+    from tools.ftp import _NewFtpTls, _ftps_connect, _upload
+    from tools.ftpserver import PASSW, USER, local_ftp_server, make_certificate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "root"
+        root.mkdir()
+        payload = tmp / "payload.bin"
+        with open(str(payload), "wb") as fl:
+            block = b"x" * 1024 * 1024
+            for _ in range(size):
+                fl.write(block)
+
+        certfile = make_certificate(tmp) if tls else None
+        with local_ftp_server(root, certfile) as (host, port):
+            for name, blocks in (
+                (f"fixed {block_size}", block_size),
+                ("adaptive", None),
+            ):
+                if tls:
+                    connection = _ftps_connect(host, USER, PASSW, port=port)
+                else:
+                    connection = _NewFtpTls()
+                    connection.connect(host, port)
+                    connection.login(USER, PASSW, secure=False)
+                elapsed = _timed(
+                    _upload, payload, "/", connection, blocks, resume=False
+                )
+                connection.quit()
+                click.secho(
+                    f"upload {name:<16} {elapsed:.3f}s  {size / elapsed:8.1f}MB/s",
+                    fg=CLICK_OK_COLOR,
+                )
+
+
+def _bundle_size(bundle: Path) -> Dict[Path, int]:
+    """Return the size of every top level entry of a bundle."""
+    sizes = {}
+    for root, _, files in os.walk(str(bundle)):
+        for name in files:
+            path = Path(root, name)
+            top = bundle / path.relative_to(bundle).parts[0]
+            # Newer pyinstaller puts everything below _internal.
+            if top.name == "_internal":
+                top = top / (
+                    "*" if path.parent == top else path.relative_to(top).parts[0]
+                )
+            sizes[top] = sizes.get(top, 0) + path.lstat().st_size
+    return sizes
+
+
+def _evict(bundle: Path) -> bool:
+    """Drop the files of a bundle from the page cache, for a cold start.
+
+    :return: False when the platform does not support it.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for root, _, files in os.walk(str(bundle)):
+        for name in files:
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def _frozen_run(executable: Path, args, env) -> float:
+    return _timed(
+        subprocess.run,
+        [str(executable), *args],
+        env=env,
+        capture_output=True,
+        check=True,
+    )
+
+
+@click.command()
+@click.argument(
+    "bundle", type=click.Path(exists=True, file_okay=False), default="dist/fab"
+)
+@click.option("--rounds", default=5, help="Number of runs per command.")
+@click.option(
+    "--max-startup",
+    type=float,
+    default=None,
+    help="Fail when a warm start of fab --help takes longer, in seconds.",
+)
+@click.option(
+    "--max-size",
+    type=float,
+    default=None,
+    help="Fail when the bundle is larger, in MB.",
+)
+def frozen(bundle, rounds, max_startup, max_size):
+    """Measure start-up and size of a pyinstaller bundle."""
+    from fab_deploy.const import _Settings, save_settings
+
+    bundle = Path(bundle)
+    executable = bundle / ("fab.exe" if sys.platform == "win32" else "fab")
+
+    sizes = _bundle_size(bundle)
+    total = sum(sizes.values()) / 1e6
+    for path, size in sorted(sizes.items(), key=lambda item: -item[1])[:10]:
+        click.secho(
+            f"{size / 1e6:8.1f}MB  {path.relative_to(bundle)}", fg=CLICK_INFO_COLOR
+        )
+    click.secho(f"bundle  {total:.1f}MB", fg=CLICK_OK_COLOR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        release = tmp / "release"
+        release.mkdir()
+        release.joinpath("version.json").write_text('{"latest": "fab-1.fab"}')
+        server = _serve_folder(release)
+
+        # A home of its own, so fab check reads settings pointing to the server.
+        home = tmp / "home"
+        config_folder = home / ".ease"
+        config_folder.mkdir(parents=True)
+        save_settings(
+            _Settings(
+                download_url=f"http://127.0.0.1:{server.server_address[1]}",
+                installation_folder=home / "fabricator",
+            ),
+            config_folder / "fab-deploy.json",
+        )
+        env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+
+        warm_help = None
+        for args in (["--help"], ["check"]):
+            name = "fab " + " ".join(args)
+            cold = []
+            for _ in range(rounds):
+                if not _evict(bundle):
+                    break
+                cold.append(_frozen_run(executable, args, env))
+            _frozen_run(executable, args, env)
+            warm = [_frozen_run(executable, args, env) for _ in range(rounds)]
+            if args == ["--help"]:
+                warm_help = min(warm)
+            for kind, timings in (("cold", cold), ("warm", warm)):
+                if not timings:
+                    click.secho(f"{name:<12} {kind}  not supported here")
+                    continue
+                click.secho(
+                    f"{name:<12} {kind}  best {min(timings):.3f}s  "
+                    f"mean {sum(timings) / len(timings):.3f}s",
+                    fg=CLICK_OK_COLOR,
+                )
+        server.shutdown()
+
+    if max_size is not None and total > max_size:
+        raise click.ClickException(f"Bundle is {total:.1f}MB, over {max_size}MB.")
+    if max_startup is not None and warm_help > max_startup:
+        raise click.ClickException(
+            f"fab --help starts in {warm_help:.3f}s, over {max_startup}s."
+        )
+
+
+@click.group()
+def cli():
+    """Benchmarks"""
+    pass
+
+
+cli.add_command(extract)
+cli.add_command(startup)
+cli.add_command(settings)
+cli.add_command(transfer)
+cli.add_command(ftp)
+cli.add_command(frozen)
+
+if __name__ == "__main__":
+    cli()
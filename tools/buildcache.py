@@ -0,0 +1,146 @@
+"""Skip build stages whose inputs did not change.
+
+Every stage is keyed by a digest of its inputs. The digest is stored once the
+stage succeeded. The next build runs a stage only when its digest changed or
+one of its outputs is missing. A stage which depends on another one includes
+that stage's digest in its own, so a rebuild ripples down.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_FILE = ".build-cache.json"
+
+# Compiled and editor files which are no input to any stage.
+IGNORED_SUFFIXES = (".pyc", ".pyo", ".swp")
+IGNORED_FOLDERS = ("__pycache__",)
+
+
+def _files(path: Path) -> Iterable[Path]:
+    if path.is_file():
+        yield path
+        return
+    for folder, folders, files in os.walk(str(path)):
+        folders[:] = sorted(fl for fl in folders if fl not in IGNORED_FOLDERS)
+        for name in sorted(files):
+            if not name.endswith(IGNORED_SUFFIXES):
+                yield Path(folder, name)
+
+
+def fingerprint(*inputs: Union[Path, str], root: Optional[Path] = None) -> str:
+    """Return a digest of the content and names of files and folders.
+
+    Strings are hashed as they are, for inputs like a version or a digest of
+    another stage.
+
+    :param root: Paths are hashed relative to it, so a moved tree keeps its digest.
+    """
+    digest = hashlib.sha256()
+    for item in inputs:
+        if isinstance(item, str):
+            digest.update(b"str\0" + item.encode() + b"\0")
+            continue
+        if not item.exists():
+            digest.update(b"missing\0" + str(item).encode() + b"\0")
+            continue
+        for fl in _files(item):
+            name = fl.relative_to(root) if root else fl
+            digest.update(b"file\0" + name.as_posix().encode() + b"\0")
+            with open(fl, "rb") as source:
+                for block in iter(lambda: source.read(1024 * 1024), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+class StageTiming(NamedTuple):
+    name: str
+    seconds: float
+    cached: bool
+
+
+class BuildCache:
+    """The input digests of stages which built successfully."""
+
+    def __init__(self, file: Path):
+        self.file = file
+        self.timings: List[StageTiming] = []
+        self._digests: Dict[str, str] = {}
+        # Stages may run concurrently.
+        self._lock = threading.Lock()
+        try:
+            with open(file) as fl:
+                self._digests = json.load(fl)
+        except (FileNotFoundError, ValueError):
+            _LOGGER.info("No usable build cache at %s", file)
+
+    def is_current(self, name: str, digest: str, outputs: Iterable[Path] = ()) -> bool:
+        if self._digests.get(name) != digest:
+            return False
+        return all(output.exists() for output in outputs)
+
+    def record(self, name: str, digest: str):
+        """Store a stage as built. Written right away, so an aborted build keeps it."""
+        with self._lock:
+            self._digests[name] = digest
+            tmp = self.file.with_name(self.file.name + ".tmp")
+            with open(tmp, "w") as fl:
+                json.dump(self._digests, fl, indent=2, sort_keys=True)
+            os.replace(str(tmp), str(self.file))
+
+    def forget(self):
+        self._digests = {}
+        if self.file.exists():
+            self.file.unlink()
+
+    def run(
+        self,
+        name: str,
+        digest: Optional[str],
+        action: Callable[[], None],
+        outputs: Iterable[Path] = (),
+    ) -> bool:
+        """Run a stage unless it is current.
+
+        :param digest: None for a stage which always runs.
+        :return: True when the stage ran.
+        """
+        outputs = list(outputs)
+        if digest is not None and self.is_current(name, digest, outputs):
+            _LOGGER.info("Stage %s is up to date", name)
+            self._add_timing(StageTiming(name, 0.0, True))
+            return False
+        start = time.perf_counter()
+        action()
+        self._add_timing(StageTiming(name, time.perf_counter() - start, False))
+        if digest is not None:
+            self.record(name, digest)
+        return True
+
+    def _add_timing(self, timing: StageTiming):
+        with self._lock:
+            self.timings.append(timing)
+
+    def report(self, elapsed: Optional[float] = None) -> str:
+        """A table of the time every stage took.
+
+        :param elapsed: The wall clock time of the build, which is less than the
+            total when stages ran concurrently.
+        """
+        width = max([len(timing.name) for timing in self.timings] + [7])
+        lines = []
+        for timing in self.timings:
+            status = "cached" if timing.cached else f"{timing.seconds:8.1f}s"
+            lines.append(f"{timing.name:<{width}}  {status:>9}")
+        total = sum(timing.seconds for timing in self.timings)
+        lines.append(f"{'total':<{width}}  {total:8.1f}s")
+        if elapsed is not None:
+            lines.append(f"{'elapsed':<{width}}  {elapsed:8.1f}s")
+        return "\n".join(lines)
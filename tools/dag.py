@@ -0,0 +1,144 @@
+"""Run build stages as a dependency graph.
+
+A stage starts once the stages it requires are done, so stages which do not
+depend on each other run at the same time. Every stage goes through the build
+cache: its digest covers its declared inputs and the digests of the stages it
+requires, and a stage whose digest did not change is skipped.
+"""
+
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Union
+
+from tools.buildcache import BuildCache, fingerprint
+
+_LOGGER = logging.getLogger(__name__)
+
+WAITING = "waiting"
+RUNNING = "running"
+DONE = "done"
+CACHED = "cached"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+Inputs = Sequence[Union[Path, str]]
+
+
+class Stage(NamedTuple):
+    name: str
+    action: Callable[[], None]
+    requires: Sequence[str] = ()
+    # Called when the stage is about to run, as earlier stages may change the
+    # inputs. None for a stage which always runs.
+    inputs: Optional[Callable[[], Inputs]] = None
+    outputs: Sequence[Path] = ()
+
+
+def _log_status(name: str, status: str):
+    _LOGGER.info("%s %s", name, status)
+
+
+def check_graph(stages: Sequence[Stage]):
+    """Check every stage is known and the graph has no cycles.
+
+    :raises ValueError: When it is no valid graph.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("Stage names must be unique.")
+    for stage in stages:
+        for required in stage.requires:
+            if required not in by_name:
+                raise ValueError(f"{stage.name} requires unknown stage {required}.")
+
+    visited = set()
+    path = []
+
+    def _visit(name):
+        if name in path:
+            cycle = " -> ".join(path[path.index(name) :] + [name])
+            raise ValueError(f"Stages depend on each other: {cycle}")
+        if name in visited:
+            return
+        path.append(name)
+        for required in by_name[name].requires:
+            _visit(required)
+        path.pop()
+        visited.add(name)
+
+    for stage in stages:
+        _visit(stage.name)
+
+
+def run_stages(
+    stages: Sequence[Stage],
+    cache: BuildCache,
+    workers: int = 4,
+    status: Callable[[str, str], None] = _log_status,
+    root: Optional[Path] = None,
+) -> Dict[str, str]:
+    """Run all stages, independent ones concurrently.
+
+    After a failure no new stages are started. Running ones are finished.
+
+    :param status: Called with a stage name and its new status.
+    :param root: Input paths are hashed relative to it.
+    :return: The final status of every stage.
+    :raises Exception: The error of the first stage which failed.
+    """
+    check_graph(stages)
+    statuses = {stage.name: WAITING for stage in stages}
+    digests: Dict[str, Optional[str]] = {}
+    status_lock = threading.Lock()
+
+    def _set_status(name, value):
+        with status_lock:
+            statuses[name] = value
+            status(name, value)
+
+    def _run_stage(stage: Stage) -> Optional[str]:
+        digest = None
+        if stage.inputs is not None:
+            required = [digests[name] for name in stage.requires if digests[name]]
+            digest = fingerprint(*required, *stage.inputs(), root=root)
+
+        def _action():
+            _set_status(stage.name, RUNNING)
+            stage.action()
+
+        ran = cache.run(stage.name, digest, _action, outputs=stage.outputs)
+        _set_status(stage.name, DONE if ran else CACHED)
+        return digest
+
+    pending = list(stages)
+    running: Dict[Future, Stage] = {}
+    errors: List[Exception] = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            if not errors:
+                for stage in [stage for stage in pending if _ready(stage, digests)]:
+                    pending.remove(stage)
+                    running[pool.submit(_run_stage, stage)] = stage
+            if not running:
+                break
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    digests[stage.name] = future.result()
+                except Exception as err:
+                    _LOGGER.error("Stage %s failed: %s", stage.name, err)
+                    _set_status(stage.name, FAILED)
+                    errors.append(err)
+
+    for stage in pending:
+        _set_status(stage.name, SKIPPED)
+    if errors:
+        raise errors[0]
+    return statuses
+
+
+def _ready(stage: Stage, done: Dict[str, Optional[str]]) -> bool:
+    return all(name in done for name in stage.requires)
@@ -0,0 +1,272 @@
+"""Write debian packages without dpkg-deb.
+
+A .deb file is an ar archive of three members: `debian-binary`, a tarball with
+the control file and a tarball with the files to install. The data tarball is
+streamed straight from the pyinstaller output into the package, so the tree is
+never copied. Its size is patched into the ar header afterwards.
+
+gzip is compressed on all cores the way pigz does it: the stream is cut into
+chunks which are deflated concurrently, each primed with the end of the chunk
+before it, and joined into one ordinary gzip stream.
+"""
+
+import io
+import logging
+import lzma
+import os
+import struct
+import tarfile
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+AR_MAGIC = b"!<arch>\n"
+DEBIAN_BINARY = b"2.0\n"
+
+GZIP = "gzip"
+XZ = "xz"
+NONE = "none"
+COMPRESSIONS = (GZIP, XZ, NONE)
+_SUFFIXES = {GZIP: ".gz", XZ: ".xz", NONE: ""}
+
+CHUNK_SIZE = 1024 * 1024
+# Deflate looks back this far. Every chunk is primed with it.
+WINDOW_SIZE = 32 * 1024
+
+
+def _deflate(data: bytes, zdict: bytes, level: int, last: bool) -> bytes:
+    if zdict:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+    else:
+        comp = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # A sync flush ends byte aligned without closing the stream, so the
+    # deflated chunks can be joined.
+    return comp.compress(data) + comp.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+
+
+class ParallelGzipWriter:
+    """Write a gzip stream, deflating chunks of it concurrently."""
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        level: int = 6,
+        workers: Optional[int] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self._fileobj = fileobj
+        self._level = level
+        self._workers = workers or os.cpu_count() or 1
+        self._chunk_size = chunk_size
+        self._pool = ThreadPoolExecutor(max_workers=self._workers)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._zdict = b""
+        self._crc = 0
+        self._size = 0
+        # No file name, no mtime, so equal input gives an equal package.
+        self._fileobj.write(b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03")
+
+    def write(self, data: bytes) -> int:
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self._chunk_size:
+            chunk = bytes(self._buffer[: self._chunk_size])
+            del self._buffer[: self._chunk_size]
+            self._submit(chunk, last=False)
+        return len(data)
+
+    def _submit(self, chunk: bytes, last: bool):
+        self._pending.append(
+            self._pool.submit(_deflate, chunk, self._zdict, self._level, last)
+        )
+        self._zdict = chunk[-WINDOW_SIZE:]
+        # Bounds the memory held by chunks which are not written yet.
+        while len(self._pending) > 2 * self._workers:
+            self._fileobj.write(self._pending.popleft().result())
+
+    def close(self):
+        if self._pool is None:
+            return
+        self._submit(bytes(self._buffer), last=True)
+        while self._pending:
+            self._fileobj.write(self._pending.popleft().result())
+        self._fileobj.write(struct.pack("<II", self._crc, self._size & 0xFFFFFFFF))
+        self._pool.shutdown()
+        self._pool = None
+
+
+class _LzmaWriter:
+    """Write an xz stream. Python's lzma compresses on a single core."""
+
+    def __init__(self, fileobj: BinaryIO, preset: int = 6):
+        self._fileobj = fileobj
+        self._compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=preset)
+
+    def write(self, data: bytes) -> int:
+        self._fileobj.write(self._compressor.compress(data))
+        return len(data)
+
+    def close(self):
+        self._fileobj.write(self._compressor.flush())
+
+
+class _PlainWriter:
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+
+    def write(self, data: bytes) -> int:
+        return self._fileobj.write(data)
+
+    def close(self):
+        pass
+
+
+def _writer(compression: str, fileobj: BinaryIO, workers: Optional[int] = None):
+    if compression == GZIP:
+        return ParallelGzipWriter(fileobj, workers=workers)
+    if compression == XZ:
+        return _LzmaWriter(fileobj)
+    if compression == NONE:
+        return _PlainWriter(fileobj)
+    raise ValueError(f"Unknown compression {compression}, use one of {COMPRESSIONS}")
+
+
+def control_file(fields: Dict[str, str]) -> str:
+    return (
+        "\n".join("{}: {}".format(key, value) for key, value in fields.items()) + "\n"
+    )
+
+
+def installed_size(folder: Path) -> int:
+    """The size of a tree in KiB, as the Installed-Size field expects."""
+    size = 0
+    for root, _, files in os.walk(str(folder)):
+        for name in files:
+            size += os.lstat(os.path.join(root, name)).st_size
+    return (size + 1023) // 1024
+
+
+def _as_root(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    info.uid = info.gid = 0
+    info.uname = info.gname = "root"
+    return info
+
+
+def _folder_info(name: str, mtime: int) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE
+    info.mode = 0o755
+    info.mtime = mtime
+    return _as_root(info)
+
+
+class _ArWriter:
+    def __init__(self, fileobj: BinaryIO, mtime: int):
+        self._fileobj = fileobj
+        self._mtime = mtime
+        fileobj.write(AR_MAGIC)
+
+    def _header(self, name: str, size: int) -> bytes:
+        header = "{:<16}{:<12}{:<6}{:<6}{:<8}{:<10}`\n".format(
+            name, self._mtime, 0, 0, "100644", size
+        )
+        return header.encode("ascii")
+
+    def _pad(self, size: int):
+        if size % 2:
+            self._fileobj.write(b"\n")
+
+    def add(self, name: str, content: bytes):
+        self._fileobj.write(self._header(name, len(content)))
+        self._fileobj.write(content)
+        self._pad(len(content))
+
+    def add_stream(self, name: str, write: Callable[[BinaryIO], None]):
+        """Add a member of unknown size. Its header is rewritten afterwards."""
+        header_at = self._fileobj.tell()
+        self._fileobj.write(self._header(name, 0))
+        start = self._fileobj.tell()
+        write(self._fileobj)
+        end = self._fileobj.tell()
+        self._fileobj.seek(header_at)
+        self._fileobj.write(self._header(name, end - start))
+        self._fileobj.seek(end)
+        self._pad(end - start)
+
+
+def _write_tar(
+    fileobj: BinaryIO,
+    compression: str,
+    fill: Callable[[tarfile.TarFile], None],
+    workers: Optional[int] = None,
+):
+    writer = _writer(compression, fileobj, workers)
+    with tarfile.open(fileobj=writer, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+        fill(tar)
+    writer.close()
+
+
+def build_deb(
+    source: Path,
+    target: Path,
+    fields: Dict[str, str],
+    install_folder: str = "usr/bin",
+    compression: str = GZIP,
+    workers: Optional[int] = None,
+) -> Path:
+    """Pack a folder into a debian package.
+
+    :param source: The folder whose content is installed.
+    :param fields: The control fields. Installed-Size is added.
+    :param install_folder: Where the content of source is installed.
+    :param workers: Number of threads compressing, all cores by default.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(
+            f"Unknown compression {compression}, use one of {COMPRESSIONS}"
+        )
+    mtime = int(os.environ.get("SOURCE_DATE_EPOCH", time.time()))
+    fields = dict(fields)
+    fields["Installed-Size"] = str(installed_size(source))
+
+    def _control(tar: tarfile.TarFile):
+        content = control_file(fields).encode()
+        tar.addfile(_folder_info("./", mtime))
+        info = _as_root(tarfile.TarInfo("./control"))
+        info.size = len(content)
+        info.mode = 0o644
+        info.mtime = mtime
+        tar.addfile(info, io.BytesIO(content))
+
+    def _data(tar: tarfile.TarFile):
+        tar.addfile(_folder_info("./", mtime))
+        parts = install_folder.strip("/").split("/")
+        for idx in range(1, len(parts)):
+            tar.addfile(_folder_info("./{}/".format("/".join(parts[:idx])), mtime))
+        tar.add(str(source), arcname="./" + "/".join(parts), filter=_as_root)
+
+    control = io.BytesIO()
+    _write_tar(control, compression, _control)
+
+    suffix = _SUFFIXES[compression]
+    tmp = target.with_name(target.name + ".tmp")
+    with open(tmp, "wb") as fl:
+        ar = _ArWriter(fl, mtime)
+        ar.add("debian-binary", DEBIAN_BINARY)
+        ar.add(f"control.tar{suffix}", control.getvalue())
+        ar.add_stream(
+            f"data.tar{suffix}",
+            lambda out: _write_tar(out, compression, _data, workers),
+        )
+    os.replace(str(tmp), str(target))
+    _LOGGER.info("Wrote %s", target)
+    return target
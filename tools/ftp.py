@@ -1,20 +1,52 @@
+import hashlib
+import io
+import json
 import logging
 import os
+import queue
+import re
 import ssl
-from ftplib import FTP_TLS
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from ftplib import FTP, FTP_TLS, error_perm, error_reply, error_temp
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 
 
 import click
 
+from fab_deploy.progress import ClickProgressBar, add_consumer, progress
+from fab_deploy.release import Release, build_release
+from fab_deploy.transfer import AdaptiveBlockSize, copy_stream
+
 _LOGGER = logging.getLogger(__name__)
 
 CLICK_INFO_COLOR = "bright_yellow"
 CLICK_OK_COLOR = "green"
 CLICK_ERROR_COLOR = "red"
 
+# Number of bytes per range read back to check an upload.
+READ_BACK_SIZE = 64 * 1024
+
+# A file is uploaded under this suffix and renamed into place once verified,
+# so a download never gets a partially uploaded file.
+PART_SUFFIX = ".part"
+
+_DIGEST = re.compile(r"\b([0-9a-fA-F]{64})\b")
+
+
+class UploadError(Exception):
+    """The remote file does not match the uploaded file."""
+
+
+class Uploaded(NamedTuple):
+    name: str
+    size: int
+    sha256: str
+
 
 class _NewFtpTls(FTP_TLS):
     """
@@ -26,14 +58,14 @@ class _NewFtpTls(FTP_TLS):
 
     """
 
-    def storbinary(self, cmd, fp, blocksize=8192, callback=None, rest=None):
+    def storbinary(self, cmd, fp, blocksize=None, callback=None, rest=None):
         """Store a file in binary mode.  A new port is created for you.
 
         Args:
         cmd: A STOR command.
-        fp: A file-like object with a read(num_bytes) method.
-        blocksize: The maximum data size to read from fp and send over
-            the connection at once.  [default: 8192]
+        fp: A file-like object with a readinto(buffer) method.
+        blocksize: Send fixed blocks of this size. When omitted the block size
+            adapts to the connection speed.  [default: None]
         callback: An optional single parameter callable that is called on
             each block of data after it is sent.  [default: None]
         rest: Passed to transfercmd().  [default: None]
@@ -41,15 +73,10 @@ class _NewFtpTls(FTP_TLS):
         Returns:
         The response code.
         """
+        block_size = None if blocksize is None else AdaptiveBlockSize.fixed(blocksize)
         self.voidcmd("TYPE I")
         with self.transfercmd(cmd, rest) as conn:
-            while 1:
-                buf = fp.read(blocksize)
-                if not buf:
-                    break
-                conn.sendall(buf)
-                if callback:
-                    callback(buf)
+            copy_stream(fp.readinto, conn.sendall, callback, block_size)
             ## shutdown ssl layer
             # if _SSLSocket is not None and isinstance(conn, _SSLSocket):
             #   conn.unwrap()
@@ -60,23 +87,28 @@ class _NewFtpTls(FTP_TLS):
         host = self.sock.getpeername()[0]
         return host, port
 
+    def ntransfercmd(self, cmd, rest=None):
+        """Open a data connection which reuses the TLS session of the control
+        connection.
+
+        This saves a full handshake per transfer, and servers requiring
+        session reuse (vsftpd, FileZilla server) accept the data connection.
+        """
+        conn, size = FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p:
+            conn = self.context.wrap_socket(
+                conn, server_hostname=self.host, session=self.sock.session
+            )
+        return conn, size
+
 
-def _ftps_connect(ftp_host, user, passw) -> _NewFtpTls:
+def _ftps_connect(ftp_host, user, passw, port=21) -> _NewFtpTls:
     """Connect to an fps ftp server.
 
     ftp_host: eg: ftp://test.com
     """
-    _old_makepasv = _NewFtpTls.makepasv
-
-    def _new_makepasv(self):
-        host, port = _old_makepasv(self)
-        host = self.sock.getpeername()[0]
-        return host, port
-
-    _NewFtpTls.makepasv = _new_makepasv
-
     ftps = _NewFtpTls(context=ssl.SSLContext(protocol=ssl.PROTOCOL_TLSv1_2))
-    ftps.connect(host=ftp_host, port=21)
+    ftps.connect(host=ftp_host, port=port)
 
     ftps.auth()
 
@@ -86,13 +118,151 @@ def _ftps_connect(ftp_host, user, passw) -> _NewFtpTls:
     return ftps
 
 
+def _remote_size(ftps, name: str) -> Optional[int]:
+    """Return the size of a remote file or None when it does not exist."""
+    try:
+        # SIZE is only reliable in binary mode.
+        ftps.voidcmd("TYPE I")
+        return ftps.size(name)
+    except error_perm:
+        return None
+
+
+def _remote_sha256(ftps, name: str) -> Optional[str]:
+    """Ask the server for the sha256 of a file.
+
+    Tries HASH (draft-bryan-ftp-hash) and the older XSHA256.
+
+    :return: None when the server supports neither.
+    """
+    for option, command in (("OPTS HASH SHA-256", "HASH"), (None, "XSHA256")):
+        try:
+            if option is not None:
+                ftps.voidcmd(option)
+            response = ftps.sendcmd(f"{command} {name}")
+        except (error_perm, error_reply):
+            continue
+        match = _DIGEST.search(response)
+        if match:
+            return match.group(1).lower()
+    return None
+
+
+def _read_remote(ftps, name: str, offset: int, size: int) -> bytes:
+    """Read a range of a remote file."""
+    ftps.voidcmd("TYPE I")
+    data = bytearray()
+    with ftps.transfercmd(f"RETR {name}", rest=offset or None) as conn:
+        while len(data) < size:
+            chunk = conn.recv(min(size - len(data), READ_BACK_SIZE))
+            if not chunk:
+                break
+            data += chunk
+    try:
+        ftps.voidresp()
+    except error_temp:
+        # Closing the data connection early aborts the transfer.
+        pass
+    return bytes(data)
+
+
+def _read_back_ranges(length: int, resumed_at: int = 0) -> List[Tuple[int, int]]:
+    """Return the ranges to compare: the start, the end and where an upload
+    was resumed."""
+    starts = {0, max(0, length - READ_BACK_SIZE)}
+    if resumed_at:
+        starts.add(max(0, resumed_at - READ_BACK_SIZE // 2))
+    return [(start, min(READ_BACK_SIZE, length - start)) for start in sorted(starts)]
+
+
+def verify_remote(ftps, file: Path, uploaded: Uploaded, resumed_at: int = 0) -> str:
+    """Check an uploaded file without downloading it.
+
+    Compares the size, then the sha256 when the server can calculate it.
+    Otherwise a few ranges are read back and compared.
+
+    :return: The check which was done.
+    :raises UploadError: When the remote file differs.
+    """
+    remote_size = _remote_size(ftps, uploaded.name)
+    if remote_size != uploaded.size:
+        raise UploadError(
+            f"{uploaded.name}: remote size {remote_size}, expected {uploaded.size}"
+        )
+
+    digest = _remote_sha256(ftps, uploaded.name)
+    if digest is not None:
+        if digest != uploaded.sha256:
+            raise UploadError(f"{uploaded.name}: remote sha256 {digest} differs")
+        return "sha256"
+
+    with open(str(file), "rb") as fl:
+        for start, size in _read_back_ranges(uploaded.size, resumed_at):
+            fl.seek(start)
+            if _read_remote(ftps, uploaded.name, start, size) != fl.read(size):
+                raise UploadError(f"{uploaded.name}: remote bytes {start}- differ")
+    return "read-back"
+
+
+def _resume_offset(ftps, name: str, file: Path, length: int) -> int:
+    """Return where to continue a partially uploaded file.
+
+    Only a remote file which is smaller and starts and ends with the same bytes
+    as the local file at its size is taken for a partial upload. Any other
+    remote file is replaced.
+    """
+    remote_size = _remote_size(ftps, name)
+    if not remote_size or remote_size >= length:
+        return 0
+    with open(str(file), "rb") as fl:
+        for start, size in _read_back_ranges(remote_size):
+            fl.seek(start)
+            if _read_remote(ftps, name, start, size) != fl.read(size):
+                _LOGGER.info("%s is not a partial upload of %s", name, file)
+                return 0
+    return remote_size
+
+
+def _replace(ftps, source: str, target: str):
+    """Rename a remote file over another one."""
+    try:
+        ftps.rename(source, target)
+    except error_perm:
+        # The server does not overwrite files when renaming.
+        ftps.delete(target)
+        ftps.rename(source, target)
+
+
+def _sha256_prefix(fl, length: int):
+    """Hash the part of a file which was uploaded before."""
+    digest = hashlib.sha256()
+    remaining = length
+    while remaining:
+        block = fl.read(min(remaining, 1024 * 1024))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    return digest
+
+
 def _upload(
     file: Path,
     target_folder: str,
     ftps,
-    block_size=1024,
+    block_size=None,
     target_file_name: Optional[str] = None,
-):
+    resume=True,
+    verify=True,
+) -> Uploaded:
+    """Upload a file, calculating its sha256 while sending it.
+
+    The file is sent to a part file first, which replaces the target when the
+    upload is complete. An upload which broke off is continued from its part
+    file.
+
+    :param verify: Check the part file before it replaces the target.
+    """
     ftps.cwd(target_folder)
     click.secho(f"Uploading {file.name}", fg=CLICK_INFO_COLOR, nl=False)
 
@@ -103,21 +273,204 @@ def _upload(
 
     click.secho(f" target name {_target_name}", fg=CLICK_INFO_COLOR)
 
+    part_name = f"{_target_name}{PART_SUFFIX}"
     length = os.path.getsize(file)
+    offset = _resume_offset(ftps, part_name, file, length) if resume else 0
+    if offset:
+        click.secho(f"Resuming at {offset} bytes", fg=CLICK_INFO_COLOR)
     with click.open_file(file, "rb") as fl:
-        with click.progressbar(length=length) as bar:
+        digest = _sha256_prefix(fl, offset)
+        # A phase per file, as files are uploaded concurrently when publishing.
+        with progress(f"upload {_target_name}", length) as bar:
+            bar.update(offset)
 
             def _update_size(data):
+                digest.update(data)
                 bar.update(len(data))
 
+            res = ftps.storbinary(
+                "STOR %s" % part_name,
+                fl,
+                block_size,
+                _update_size,
+                rest=offset or None,
+            )
+            click.secho(str(res), fg=CLICK_INFO_COLOR)
+
+    if verify:
+        part = Uploaded(part_name, length, digest.hexdigest())
+        try:
+            check = verify_remote(ftps, file, part, resumed_at=offset)
+        except UploadError:
+            # Do not continue from a damaged part file next time.
+            ftps.delete(part_name)
+            raise
+        click.secho(f"{_target_name} verified ({check})", fg=CLICK_OK_COLOR)
+    _replace(ftps, part_name, _target_name)
+    return Uploaded(_target_name, length, digest.hexdigest())
+
+
+class Artifact(NamedTuple):
+    file: Path
+    target_folder: str
+    target_name: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.target_name or self.file.name
+
+
+# Clients read this file to find a release. It is uploaded last.
+VERSION_FILE_NAME = "version.json"
+
+
+class _FtpsPool:
+    """A small pool of logged in connections."""
+
+    def __init__(self, connect: Callable[[], _NewFtpTls], size: int):
+        self._connect = connect
+        self._idle: "queue.Queue[_NewFtpTls]" = queue.Queue()
+        self._slots = queue.Queue()
+        for _ in range(size):
+            self._slots.put(None)
+
+    @contextmanager
+    def connection(self) -> Iterator[_NewFtpTls]:
+        self._slots.get()
+        try:
             try:
-                res = ftps.storbinary(
-                    "STOR %s" % _target_name, fl, block_size, _update_size
-                )
-                click.secho(str(res), fg=CLICK_INFO_COLOR)
+                ftps = self._idle.get_nowait()
+            except queue.Empty:
+                ftps = self._connect()
+            try:
+                yield ftps
+            except Exception:
+                # The connection may be in any state. Start over next time.
+                ftps.close()
+                raise
+            self._idle.put(ftps)
+        finally:
+            self._slots.put(None)
+
+    def close(self):
+        while not self._idle.empty():
+            ftps = self._idle.get_nowait()
+            try:
+                ftps.quit()
+            except Exception:
+                ftps.close()
+
+
+def _upload_artifact(pool: _FtpsPool, artifact: Artifact, resume=True) -> Uploaded:
+    with pool.connection() as ftps:
+        return _upload(
+            artifact.file,
+            artifact.target_folder,
+            ftps,
+            target_file_name=artifact.target_name,
+            resume=resume,
+        )
 
-            except Exception as err:
-                print(err)
+
+def _remote_release(ftps, target_folder: str) -> Optional[Release]:
+    """Read the version file published in a folder, if there is one."""
+    ftps.cwd(target_folder)
+    data = io.BytesIO()
+    try:
+        ftps.retrbinary(f"RETR {VERSION_FILE_NAME}", data.write)
+    except error_perm:
+        return None
+    try:
+        return Release.from_dict(json.loads(data.getvalue().decode()))
+    except ValueError as err:
+        _LOGGER.warning("Ignoring the published version file: %s", err)
+        return None
+
+
+def _describe_release(
+    version_file: Path,
+    uploaded: Dict[str, Tuple[Path, Uploaded]],
+    dest: Path,
+    current: Optional[Release] = None,
+) -> Path:
+    """Add size, hashes and the previous release to a version file.
+
+    The version file itself is left as it is.
+
+    :param uploaded: The local file and upload result by target name.
+    :param dest: Where to write the described release.
+    :param current: The release published until now.
+    :return: The file to publish: dest, or the version file when the release
+        it names was not uploaded.
+    """
+    base = Release.from_file(version_file)
+    if base.latest not in uploaded:
+        return version_file
+    file, result = uploaded[base.latest]
+    previous = None if current is None else current.latest
+    if current is not None and current.latest == base.latest:
+        # Published again. Keep pointing at the release before it.
+        previous = current.previous
+    release = build_release(file, previous=previous, base=base)
+    if release.sha256 != result.sha256:
+        raise UploadError(f"{file} changed while it was uploaded.")
+    release.save(dest)
+    return dest
+
+
+def publish(
+    artifacts: List[Artifact], connect: Callable[[], _NewFtpTls], workers: int = 3
+):
+    """Upload the artifacts of a release concurrently.
+
+    The version files are uploaded after all other artifacts succeeded, so
+    clients never see a release which is not completely uploaded. The
+    release they point to is described in them first: its size, sha256 and
+    chunk hashes and the release published before it.
+    """
+    files = [artifact for artifact in artifacts if artifact.name != VERSION_FILE_NAME]
+    version_files = [
+        artifact for artifact in artifacts if artifact.name == VERSION_FILE_NAME
+    ]
+
+    pool = _FtpsPool(connect, workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                artifact: executor.submit(_upload_artifact, pool, artifact)
+                for artifact in files
+            }
+            # Raises the first error, after all uploads finished.
+            uploaded = {
+                (artifact.target_folder, artifact.name): (
+                    artifact.file,
+                    future.result(),
+                )
+                for artifact, future in futures.items()
+            }
+        with tempfile.TemporaryDirectory() as temp:
+            for index, artifact in enumerate(version_files):
+                with pool.connection() as ftps:
+                    current = _remote_release(ftps, artifact.target_folder)
+                described = _describe_release(
+                    artifact.file,
+                    {
+                        name: result
+                        for (folder, name), result in uploaded.items()
+                        if folder == artifact.target_folder
+                    },
+                    Path(temp) / f"{index}-{VERSION_FILE_NAME}",
+                    current,
+                )
+                # The published version file is another file, not a partial
+                # upload.
+                _upload_artifact(
+                    pool,
+                    artifact._replace(file=described, target_name=VERSION_FILE_NAME),
+                    resume=False,
+                )
+    finally:
+        pool.close()
 
 
 @click.command()
@@ -127,7 +480,15 @@ def _upload(
 @click.argument("file")
 @click.argument("target-folder")
 @click.option("--target-name", help="Alternative target file name.")
-def upload_file(ftp_host, user, passw, file, target_folder, target_name=None):
+@click.option(
+    "--no-resume",
+    is_flag=True,
+    default=False,
+    help="Upload from the start, even when a partial upload exists.",
+)
+def upload_file(
+    ftp_host, user, passw, file, target_folder, target_name=None, no_resume=False
+):
     """
     :param ftp_host: ftps host
     :param user: ftp user
@@ -142,16 +503,55 @@ def upload_file(ftp_host, user, passw, file, target_folder, target_name=None):
     connection = _ftps_connect(ftp_host, user, passw)
     click.secho("done", fg=CLICK_INFO_COLOR)
 
-    _upload(_file, target_folder, connection, target_file_name=target_name)
+    uploaded = _upload(
+        _file,
+        target_folder,
+        connection,
+        target_file_name=target_name,
+        resume=not no_resume,
+    )
+    click.secho(f"sha256 {uploaded.sha256}", fg=CLICK_OK_COLOR)
+
+
+def _parse_artifact(value: str) -> Artifact:
+    file, sep, target = value.rpartition("=")
+    if not sep or not file or not target:
+        raise click.BadParameter(f"Expected FILE=TARGET_FOLDER, got {value}")
+    _file = Path(file)
+    if not _file.exists():
+        raise click.BadParameter(f"{file} does not exist")
+    return Artifact(_file, target)
+
+
+@click.command()
+@click.argument("ftp_host")
+@click.argument("user")
+@click.argument("passw")
+@click.argument("artifacts", nargs=-1, required=True)
+@click.option("--workers", default=3, help="Number of concurrent uploads.")
+@click.option("--port", default=21, help="FTP port.")
+def publish_release(ftp_host, user, passw, artifacts, workers, port):
+    """Upload all files of a release at once.
+
+    Every ARTIFACT is given as FILE=TARGET_FOLDER, eg.
+    dist/fab.deb=/motorisation.hde.nl/bin/fabricator/ubuntu18_04/. Files named
+    version.json are uploaded last.
+    """
+    _artifacts = [_parse_artifact(artifact) for artifact in artifacts]
+    publish(
+        _artifacts, partial(_ftps_connect, ftp_host, user, passw, port), workers
+    )
+    click.secho("Published.", fg=CLICK_OK_COLOR)
 
 
 @click.group()
 def cli():
     """Main deploy entry"""
-    pass
+    add_consumer(ClickProgressBar())
 
 
 cli.add_command(upload_file)
+cli.add_command(publish_release)
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,112 @@
+"""A local FTP(S) server to test and measure uploads against.
+
+Requires pyftpdlib, and pyOpenSSL for FTPS.
+"""
+
+import datetime
+import errno
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+USER = "user"
+PASSW = "passw"
+
+
+def make_certificate(folder: Path) -> Path:
+    """Write a self signed certificate and its key into one pem file."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    pem = folder / "localhost.pem"
+    pem.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )
+        + certificate.public_bytes(serialization.Encoding.PEM)
+    )
+    return pem
+
+
+@contextmanager
+def local_ftp_server(
+    root: Path, certfile: Optional[Path] = None, user=USER, passw=PASSW
+) -> Iterator[Tuple[str, int]]:
+    """Serve a folder over FTP, or FTPS when a certificate is given.
+
+    :return: The host and port to connect to.
+    """
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.filesystems import AbstractedFS
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+
+    class _Filesystem(AbstractedFS):
+        """Keeps the working directory of a session without os.chdir.
+
+        The server runs inside the calling process, often a test run, whose
+        working directory must not change under it.
+        """
+
+        def chdir(self, path):
+            if not os.path.isdir(path):
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            if not os.access(path, os.X_OK):
+                raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), path)
+            self.cwd = self.fs2ftp(path)
+
+    # It logs every command. A handler of our own keeps it from adding one.
+    ftp_logger = logging.getLogger("pyftpdlib")
+    ftp_logger.setLevel(logging.WARNING)
+    if not ftp_logger.handlers:
+        ftp_logger.addHandler(logging.NullHandler())
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(user, passw, str(root), perm="elradfmwMT")
+
+    if certfile is None:
+        handler = type("_Handler", (FTPHandler,), {})
+    else:
+        from pyftpdlib.handlers import TLS_FTPHandler
+
+        handler = type("_Handler", (TLS_FTPHandler,), {})
+        handler.certfile = str(certfile)
+        handler.tls_control_required = True
+        handler.tls_data_required = True
+    handler.authorizer = authorizer
+    handler.abstracted_fs = _Filesystem
+
+    server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(
+        target=server.serve_forever,
+        kwargs={"timeout": 0.1, "handle_exit": False},
+        daemon=True,
+    )
+    thread.start()
+    try:
+        yield server.address
+    finally:
+        server.close_all()
+        thread.join(timeout=5)